@@ -0,0 +1,271 @@
+"""
+Computes ViT embeddings of all frames in image_data and builds the
+similarity search index (see ``embedding_index.py``).
+
+The frames are read in ID order with keyset pagination, decoded and
+normalised in a process pool and embedded in batches by the backbone of a
+trained ``ViTLightningModule`` (the pre-logits features, i.e. the input of the
+classification head). The backbone is either the Lightning checkpoint or an
+ONNX export of the backbone created with ``--export-onnx``.
+
+Usage:
+    python embed_dataset.py --checkpoint models/best.ckpt --output data/embeddings
+    python embed_dataset.py --checkpoint best.ckpt --export-onnx backbone.onnx
+    python embed_dataset.py --onnx models/backbone.onnx --output data/embeddings
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Add the project root and the database_src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../.."))
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../data_processing/database_src")
+)
+
+import sqlalchemy as sa
+
+from database import Session
+from models import ImageData
+from crud import filter_image_data
+from blob_store import get_blob_store, load_image
+from embedding_index import (
+    EmbeddingIndex,
+    create_vector_file,
+    new_index_directory,
+    normalize,
+    publish_index,
+    write_meta,
+)
+from preprocessing import IMAGE_SIZE, preprocess_item
+
+
+def _load_module(checkpoint: str):
+    from src.ai.training.model import ViTLightningModule
+
+    module = ViTLightningModule.load_from_checkpoint(checkpoint, map_location="cpu")
+    module.eval()
+    return module
+
+
+class TorchBackbone:
+    """Pre-logits features of the ViT of a Lightning checkpoint."""
+
+    def __init__(self, checkpoint: str, device: str = "cpu"):
+        import torch
+
+        self.torch = torch
+        self.device = device
+        self.vit = _load_module(checkpoint).model.to(device)
+        if device.startswith("cuda"):
+            self.vit.half()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        with self.torch.inference_mode():
+            inputs = self.torch.from_numpy(batch).to(self.device)
+            inputs = inputs.to(next(self.vit.parameters()).dtype)
+            features = self.vit.forward_head(
+                self.vit.forward_features(inputs), pre_logits=True
+            )
+        return features.float().cpu().numpy()
+
+
+class OnnxBackbone:
+    """Backbone exported with ``export_backbone_onnx``."""
+
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(model_path)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def export_backbone_onnx(checkpoint: str, output_path: str) -> None:
+    """
+    Exports the pre-logits features of a checkpoint's ViT to ONNX.
+
+    Args:
+        checkpoint: Path of the Lightning checkpoint.
+        output_path: Path of the ONNX model.
+    """
+    import torch
+
+    class Backbone(torch.nn.Module):
+        def __init__(self, vit):
+            super().__init__()
+            self.vit = vit
+
+        def forward(self, x):
+            return self.vit.forward_head(self.vit.forward_features(x), pre_logits=True)
+
+    backbone = Backbone(_load_module(checkpoint).model)
+    torch.onnx.export(
+        backbone,
+        torch.randn(1, 3, IMAGE_SIZE[1], IMAGE_SIZE[0]),
+        output_path,
+        export_params=True,
+        opset_version=14,
+        do_constant_folding=True,
+        dynamic_axes={"input": {0: "batch_size"}, "output": {0: "batch_size"}},
+        input_names=["input"],
+        output_names=["output"],
+    )
+    print(f"Backbone has been exported to {output_path}")
+
+
+def embed_dataset(
+    backbone,
+    directory: str,
+    store=None,
+    batch_size: int = 64,
+    workers: int = None,
+    limit: int = None,
+    **filters,
+) -> int:
+    """
+    Embeds all frames matching ``filters`` into the vector file of an index.
+
+    Args:
+        backbone: Callable mapping a (B, 3, 224, 224) batch to (B, D) embeddings.
+        directory: Index directory the vectors and IDs are written to.
+        store: Blob store holding migrated blobs.
+        batch_size: Number of frames per backbone batch.
+        workers: Number of preprocessing processes (default: number of CPUs).
+        limit: Stop after this many frames (None for all frames).
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Returns:
+        int: Number of embedded frames.
+    """
+    with Session() as session:
+        total = session.execute(
+            filter_image_data(sa.select(sa.func.count(ImageData.id)), **filters)
+        ).scalar()
+    if limit is not None:
+        total = min(total, limit)
+
+    vectors = None
+    ids = np.empty(total, dtype=np.int64)
+    embedded = 0
+    last_id = 0
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while embedded < total:
+            with Session() as session:
+                stmt = sa.select(ImageData.id, ImageData.image, ImageData.image_sha256)
+                rows = session.execute(
+                    filter_image_data(stmt, **filters)
+                    .where(ImageData.id > last_id)
+                    .order_by(ImageData.id)
+                    .limit(min(batch_size, total - embedded))
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            items = [(row.id, load_image(row, store)) for row in rows]
+            results = [
+                result
+                for result in pool.map(
+                    preprocess_item, [item for item in items if item[1]]
+                )
+                if result[1] is not None
+            ]
+            if not results:
+                continue
+
+            batch = np.stack([pixels for _, pixels in results])
+            embeddings = normalize(backbone(batch))
+            if vectors is None:
+                vectors = create_vector_file(directory, total, embeddings.shape[1])
+            vectors[embedded : embedded + len(results)] = embeddings
+            ids[embedded : embedded + len(results)] = [
+                image_id for image_id, _ in results
+            ]
+            embedded += len(results)
+
+            elapsed = time.time() - start_time
+            print(
+                f"Embedded {embedded}/{total} frames up to ID {last_id} "
+                f"({embedded / elapsed:.0f} frames/s)"
+            )
+
+    if vectors is None:
+        return 0
+    vectors.flush()
+    # Frames without an image are skipped, so the matrix may have unused rows
+    write_meta(directory, embedded, vectors.shape[1])
+    np.save(os.path.join(directory, "ids.npy"), ids[:embedded])
+    return embedded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Embed the frames of image_data and build the similarity index."
+    )
+    parser.add_argument("--checkpoint", help="Lightning checkpoint of the ViT")
+    parser.add_argument("--onnx", help="ONNX export of the backbone")
+    parser.add_argument("--export-onnx", help="Export the backbone to this path")
+    parser.add_argument("--output", default="data/embeddings")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--parts-id", type=int, default=None)
+    parser.add_argument("--label", type=int, default=None)
+    parser.add_argument("--n-lists", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.export_onnx:
+        export_backbone_onnx(args.checkpoint, args.export_onnx)
+        return
+    if args.onnx:
+        backbone = OnnxBackbone(args.onnx)
+    elif args.checkpoint:
+        backbone = TorchBackbone(args.checkpoint, args.device)
+    else:
+        parser.error("Either --checkpoint or --onnx is required")
+
+    start_time = time.time()
+    # The published index keeps serving queries until the new one is complete
+    build_directory = new_index_directory(args.output)
+    try:
+        embedded = embed_dataset(
+            backbone,
+            build_directory,
+            store=get_blob_store(),
+            batch_size=args.batch_size,
+            workers=args.workers,
+            limit=args.limit,
+            parts_id=args.parts_id,
+            label=args.label,
+        )
+        if embedded == 0:
+            print("No frames to embed.")
+            shutil.rmtree(build_directory)
+            return
+        index = EmbeddingIndex.build(build_directory, n_lists=args.n_lists)
+    except BaseException:
+        shutil.rmtree(build_directory, ignore_errors=True)
+        raise
+    publish_index(args.output, build_directory)
+    elapsed = time.time() - start_time
+    print(
+        f"Indexed {embedded} frames in {len(index.centroids)} lists "
+        f"to '{args.output}' in {elapsed:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Approximate nearest neighbour index over frame embeddings.
+
+The embeddings are L2-normalised and stored as a float16 matrix that is
+memory-mapped on load, so the index opens instantly and only the probed rows
+are read from disk. Search uses an inverted file (IVF): the vectors are
+clustered with spherical k-means and a query only scores the vectors of the
+``n_probe`` clusters closest to it.
+
+Files of an index directory:
+    meta.json     number of vectors and embedding dimension
+    vectors.f16   (N, D) float16 embeddings, in the order of ``ids.npy``
+    ids.npy       (N,) image_data IDs, ascending
+    centroids.npy (L, D) float32 cluster centroids
+    order.npy     (N,) row numbers sorted by cluster
+    offsets.npy   (L + 1,) start of every cluster in ``order.npy``
+
+An index is built in a new directory next to the published one and then
+published with ``publish_index``: the index path is a symlink that is
+replaced atomically, so readers see either the old or the new index, never a
+partly written one.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+VECTORS_FILE = "vectors.f16"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales vectors to unit length, so the dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def write_meta(directory: str, num_vectors: int, dim: int) -> None:
+    """Records the shape of the vector matrix of an index directory."""
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"num_vectors": num_vectors, "dim": dim}, f)
+
+
+def _open_vectors(directory: str, mode: str = "r", shape: tuple = None):
+    if shape is None:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        shape = (meta["num_vectors"], meta["dim"])
+    return np.memmap(
+        os.path.join(directory, VECTORS_FILE), dtype=np.float16, mode=mode, shape=shape
+    )
+
+
+def create_vector_file(directory: str, num_vectors: int, dim: int) -> np.memmap:
+    """
+    Creates the float16 vector matrix of an index directory for writing.
+
+    Args:
+        directory: Index directory.
+        num_vectors: Number of rows.
+        dim: Embedding dimension.
+
+    Returns:
+        Writable memory map of shape (num_vectors, dim).
+    """
+    os.makedirs(directory, exist_ok=True)
+    write_meta(directory, num_vectors, dim)
+    return _open_vectors(directory, "w+", (num_vectors, dim))
+
+
+def new_index_directory(directory: str) -> str:
+    """
+    Creates an empty directory next to ``directory`` to build a new index in.
+
+    Args:
+        directory: Path the index is published under.
+
+    Returns:
+        str: Path of the new directory.
+    """
+    directory = directory.rstrip(os.sep)
+    build_directory = f"{directory}.{time.strftime('%Y%m%d-%H%M%S')}"
+    suffix = 1
+    while os.path.exists(build_directory):
+        build_directory = f"{directory}.{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        suffix += 1
+    os.makedirs(build_directory)
+    return build_directory
+
+
+def publish_index(directory: str, build_directory: str) -> None:
+    """
+    Atomically replaces the index at ``directory`` with a completely built one.
+
+    ``directory`` becomes a symlink to ``build_directory``; the previously
+    published index directory is deleted. Indexes that are still open keep
+    their memory-mapped files until they are closed.
+
+    Args:
+        directory: Path the index is published under.
+        build_directory: Directory created by ``new_index_directory``.
+    """
+    directory = directory.rstrip(os.sep)
+    previous = None
+    if os.path.islink(directory):
+        previous = os.path.realpath(directory)
+    elif os.path.isdir(directory):
+        # An index written before publish_index existed is moved aside once
+        previous = f"{directory}.previous"
+        os.rename(directory, previous)
+
+    link = f"{directory}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(build_directory), link)
+    os.replace(link, directory)
+    if previous is not None and previous != os.path.realpath(build_directory):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def _kmeans(sample: np.ndarray, n_lists: int, n_iter: int, seed: int) -> np.ndarray:
+    # Spherical k-means: centroids are re-normalised after every update
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = sample[assignment == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+            else:
+                centroids[i] = sample[rng.integers(len(sample))]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class EmbeddingIndex:
+    """IVF index over memory-mapped float16 embeddings."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vectors = _open_vectors(directory)
+        self.ids = np.load(os.path.join(directory, "ids.npy"))
+        self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        self.order = np.load(os.path.join(directory, "order.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+
+    @staticmethod
+    def build(
+        directory: str,
+        n_lists: int = None,
+        n_iter: int = 10,
+        sample_size: int = 100000,
+        batch_size: int = 65536,
+        seed: int = 0,
+    ) -> "EmbeddingIndex":
+        """
+        Builds the IVF lists for the vectors and IDs already in ``directory``.
+
+        Args:
+            directory: Index directory with ``vectors.f16`` and ``ids.npy``.
+            n_lists: Number of clusters (default: sqrt of the number of vectors).
+            n_iter: Number of k-means iterations.
+            sample_size: Number of vectors the clusters are trained on.
+            batch_size: Number of vectors assigned to clusters at once.
+            seed: Seed of the random sample and initial centroids.
+
+        Returns:
+            The loaded EmbeddingIndex.
+        """
+        vectors = _open_vectors(directory)
+        num_vectors = len(vectors)
+        n_lists = n_lists or max(1, int(np.sqrt(num_vectors)))
+        n_lists = min(n_lists, num_vectors)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(
+            rng.choice(num_vectors, min(sample_size, num_vectors), replace=False)
+        )
+        centroids = _kmeans(
+            np.asarray(vectors[sample_rows], dtype=np.float32), n_lists, n_iter, seed
+        )
+
+        assignment = np.empty(num_vectors, dtype=np.int32)
+        for start in range(0, num_vectors, batch_size):
+            batch = np.asarray(vectors[start : start + batch_size], dtype=np.float32)
+            assignment[start : start + len(batch)] = np.argmax(
+                batch @ centroids.T, axis=1
+            )
+
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        np.save(os.path.join(directory, "centroids.npy"), centroids)
+        np.save(os.path.join(directory, "order.npy"), order)
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        return EmbeddingIndex(directory)
+
+    def vector(self, image_id: int):
+        """Returns the embedding of an image, or None if it is not indexed."""
+        row = np.searchsorted(self.ids, image_id)
+        if row == len(self.ids) or self.ids[row] != image_id:
+            return None
+        return np.asarray(self.vectors[row], dtype=np.float32)
+
+    def search(self, query: np.ndarray, k: int = 10, n_probe: int = 8) -> list:
+        """
+        Finds the indexed images most similar to a query embedding.
+
+        Args:
+            query: Embedding of shape (D,).
+            k: Number of results.
+            n_probe: Number of clusters that are searched.
+
+        Returns:
+            list: (image ID, cosine similarity) pairs, most similar first.
+        """
+        query = normalize(query)
+        n_probe = min(n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = np.sort(
+            np.concatenate(
+                [self.order[self.offsets[i] : self.offsets[i + 1]] for i in lists]
+            )
+        )
+        if len(rows) == 0:
+            return []
+
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top]
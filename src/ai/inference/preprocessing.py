@@ -0,0 +1,78 @@
+"""
+Preprocessing of encoded frames into the ViT input, matching the validation
+transform of training. The input size and normalisation are read from the
+``transforms`` section of ``configs/data_config.yaml``, the config the model
+was trained with.
+
+Implemented with PIL and numpy only, so it can run in worker processes of
+the batch jobs without importing torch.
+"""
+
+import io
+import os
+
+import numpy as np
+import yaml
+from PIL import Image
+
+DATA_CONFIG_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "configs", "data_config.yaml"
+)
+
+
+def load_transform_config(path: str = DATA_CONFIG_PATH) -> tuple:
+    """
+    Reads the input size and normalisation of the validation transform.
+
+    Args:
+        path: Path of the data config.
+
+    Returns:
+        tuple: (mean, std, (width, height)); mean and std are float32 arrays.
+    """
+    with open(path, "r") as f:
+        transforms = yaml.load(f, Loader=yaml.SafeLoader)["transforms"]
+    normalization = transforms["normalization"]
+    return (
+        np.array(normalization["mean"], dtype=np.float32),
+        np.array(normalization["std"], dtype=np.float32),
+        tuple(transforms.get("resize", (224, 224))),
+    )
+
+
+IMAGE_MEAN, IMAGE_STD, IMAGE_SIZE = load_transform_config()
+
+
+def preprocess(image: bytes) -> np.ndarray:
+    """
+    Decodes a frame into the normalised CHW float32 input of the ViT.
+
+    Args:
+        image: Encoded image, e.g. JPEG bytes.
+
+    Returns:
+        np.ndarray: Array of shape (3, height, width).
+    """
+    with Image.open(io.BytesIO(image)) as img:
+        pixels = np.asarray(
+            img.convert("RGB").resize(IMAGE_SIZE, Image.BILINEAR), dtype=np.float32
+        )
+    pixels = (pixels / 255.0 - IMAGE_MEAN) / IMAGE_STD
+    return pixels.transpose(2, 0, 1)
+
+
+def preprocess_item(item) -> tuple:
+    """
+    Preprocesses one frame; runs in the worker processes of the batch jobs.
+
+    Args:
+        item: (id, image bytes) tuple.
+
+    Returns:
+        tuple: (id, preprocessed array), the array is None if decoding failed.
+    """
+    image_id, image = item
+    try:
+        return image_id, preprocess(image)
+    except OSError:
+        return image_id, None
@@ -0,0 +1,222 @@
+"""
+Scores all frames in image_data with an ONNX model and stores the results in
+the ``predictions`` table, keyed by (model_version, image_id).
+
+Frames are read in ID order with keyset pagination. While the model scores
+one chunk, the next chunk is already being loaded and preprocessed in a
+process pool. Every chunk is written with one bulk INSERT and committed, and
+only frames without a prediction of the model version are read, so an
+interrupted run resumes where it stopped, also if it is restarted with other
+filters. Create the table once with
+``python schema_management.py create-predictions``.
+
+Usage:
+    python score_dataset.py ../../../models/model.onnx --model-version vit-b16-v3
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import onnxruntime as ort
+
+# Add the database_src directory to the path
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../data_processing/database_src")
+)
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from database import Session
+from models import ImageData, Prediction
+from crud import filter_image_data
+from blob_store import get_blob_store, load_image
+from preprocessing import preprocess_item
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """Converts a (B, C) batch of logits into class probabilities."""
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def fetch_chunk(
+    last_id: int, chunk_size: int, model_version: str, store=None, **filters
+) -> tuple:
+    """
+    Loads the next chunk of unscored frames after ``last_id`` in ID order.
+
+    Args:
+        last_id: Highest image ID of the previous chunk.
+        chunk_size: Maximum number of frames.
+        model_version: Frames with a prediction of this version are skipped.
+        store: Blob store holding migrated blobs.
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Returns:
+        tuple: (list of (id, image bytes) of frames with an image, highest ID
+        of the chunk or None if there are no more frames).
+    """
+    stmt = sa.select(ImageData.id, ImageData.image, ImageData.image_sha256)
+    # Anti-join on the primary key of predictions
+    scored = (
+        sa.select(Prediction.image_id)
+        .where(
+            Prediction.model_version == model_version,
+            Prediction.image_id == ImageData.id,
+        )
+        .exists()
+    )
+    with Session() as session:
+        rows = session.execute(
+            filter_image_data(stmt, **filters)
+            .where(ImageData.id > last_id, ~scored)
+            .order_by(ImageData.id)
+            .limit(chunk_size)
+        ).all()
+    if not rows:
+        return [], None
+    items = [(row.id, load_image(row, store)) for row in rows]
+    return [item for item in items if item[1]], rows[-1].id
+
+
+def score_batches(model: ort.InferenceSession, results, batch_size: int):
+    """
+    Runs the model over preprocessed frames in batches.
+
+    Args:
+        model: ONNX session with one image input and a logits output.
+        results: List of (id, preprocessed array) tuples.
+        batch_size: Number of frames per model call.
+
+    Yields:
+        dict: Prediction row of one frame.
+    """
+    input_name = model.get_inputs()[0].name
+    for start in range(0, len(results), batch_size):
+        batch = results[start : start + batch_size]
+        inputs = np.stack([pixels for _, pixels in batch])
+        probabilities = softmax(model.run(None, {input_name: inputs})[0])
+        for (image_id, _), probs in zip(batch, probabilities):
+            label = int(np.argmax(probs))
+            yield {
+                "image_id": image_id,
+                "label": label,
+                "confidence": float(probs[label]),
+                "probabilities": [float(p) for p in probs],
+            }
+
+
+def score_dataset(
+    model: ort.InferenceSession,
+    model_version: str,
+    store=None,
+    chunk_size: int = 1024,
+    batch_size: int = 64,
+    workers: int = None,
+    **filters,
+) -> int:
+    """
+    Scores all frames not yet scored by ``model_version``.
+
+    Args:
+        model: ONNX session of the classifier.
+        model_version: Version the predictions are stored under.
+        store: Blob store holding migrated blobs.
+        chunk_size: Number of frames per chunk and transaction.
+        batch_size: Number of frames per model call.
+        workers: Number of preprocessing processes (default: number of CPUs).
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Returns:
+        int: Number of frames scored in this run.
+    """
+    last_id = 0
+    scored = 0
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def submit(items):
+            # Executor.map submits all items at once and returns a lazy iterator
+            chunksize = max(1, len(items) // (workers * 4))
+            return pool.map(preprocess_item, items, chunksize=chunksize)
+
+        items, last_id = fetch_chunk(
+            last_id, chunk_size, model_version, store, **filters
+        )
+        pending = submit(items)
+        while last_id is not None:
+            # Load and preprocess the next chunk while this one is scored
+            next_items, next_last_id = fetch_chunk(
+                last_id, chunk_size, model_version, store, **filters
+            )
+            next_pending = submit(next_items)
+
+            results = [result for result in pending if result[1] is not None]
+            rows = [
+                dict(row, model_version=model_version)
+                for row in score_batches(model, results, batch_size)
+            ]
+            if rows:
+                with Session() as session:
+                    session.execute(
+                        postgresql.insert(Prediction)
+                        .values(rows)
+                        .on_conflict_do_nothing()
+                    )
+                    session.commit()
+
+            scored += len(rows)
+            elapsed = time.time() - start_time
+            print(
+                f"Scored {scored} frames up to ID {last_id} "
+                f"({scored / elapsed:.0f} images/s)"
+            )
+            pending, last_id = next_pending, next_last_id
+
+    return scored
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Score the frames of image_data and store the predictions."
+    )
+    parser.add_argument("model_path", help="ONNX model of the classifier")
+    parser.add_argument("--model-version", required=True)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--parts-id", type=int, default=None)
+    parser.add_argument("--slicer-settings-id", type=int, default=None)
+    parser.add_argument(
+        "--providers",
+        default="CPUExecutionProvider",
+        help="Comma-separated ONNX Runtime execution providers",
+    )
+    args = parser.parse_args()
+
+    model = ort.InferenceSession(args.model_path, providers=args.providers.split(","))
+    start_time = time.time()
+    scored = score_dataset(
+        model,
+        args.model_version,
+        store=get_blob_store(),
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        parts_id=args.parts_id,
+        slicer_settings_id=args.slicer_settings_id,
+    )
+    elapsed = time.time() - start_time
+    rate = scored / elapsed if elapsed else 0
+    print(f"Scored {scored} frames in {elapsed:.1f} s ({rate:.0f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Concurrency benchmark for the API database layer.
+
+Compares the previous pattern of blocking SQLAlchemy ``Session`` calls inside
+``async def`` handlers with the pooled ``AsyncSession`` used by the routes.
+Both variants run the same metadata lookup as ``GET /images/{image_id}`` from
+many concurrent clients on one event loop and report requests per second.
+
+Usage (from the ``src`` directory):
+    python -m api.benchmarks.db_sessions --concurrency 64 --duration 10
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import sqlalchemy as sa
+
+from ..core.database import AsyncSessionLocal, DatabaseSession, async_engine
+from models import ImageData
+from crud import IMAGE_METADATA_COLUMNS
+
+
+def _metadata_statement(image_id: int):
+    return sa.select(*IMAGE_METADATA_COLUMNS).where(ImageData.id == image_id)
+
+
+async def sync_session_handler(image_id: int):
+    """Previous pattern: a blocking Session inside an async handler."""
+    db = DatabaseSession()
+    try:
+        return db.execute(_metadata_statement(image_id)).first()
+    finally:
+        db.close()
+
+
+async def async_session_handler(image_id: int):
+    """Current pattern: a pooled AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(_metadata_statement(image_id))
+        return result.first()
+
+
+async def run_benchmark(handler, image_ids, concurrency: int, duration: float) -> dict:
+    """
+    Runs ``concurrency`` clients that call ``handler`` until ``duration`` expires.
+
+    Args:
+        handler: Coroutine function taking an image ID.
+        image_ids: IDs the clients pick from at random.
+        concurrency: Number of concurrent clients.
+        duration: Benchmark duration in seconds.
+
+    Returns:
+        Dictionary with the request count, requests per second and p95 latency.
+    """
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await handler(random.choice(image_ids))
+            latencies.append(time.perf_counter() - start)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "p95_latency_ms": p95 * 1000,
+    }
+
+
+async def main(concurrency: int, duration: float, sample_size: int) -> None:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            sa.select(ImageData.id).order_by(ImageData.id).limit(sample_size)
+        )
+        image_ids = result.scalars().all()
+    if not image_ids:
+        print("No rows in image_data to benchmark against.")
+        return
+
+    for name, handler in [
+        ("sync Session", sync_session_handler),
+        ("AsyncSession", async_session_handler),
+    ]:
+        stats = await run_benchmark(handler, image_ids, concurrency, duration)
+        print(
+            f"{name:>12}: {stats['requests']} requests, "
+            f"{stats['requests_per_second']:.1f} req/s, "
+            f"p95 {stats['p95_latency_ms']:.1f} ms"
+        )
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--sample-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency, args.duration, args.sample_size))
@@ -0,0 +1,62 @@
+"""Read-through caches for slicer settings and parts metadata."""
+
+import sqlalchemy as sa
+import sys
+import os
+
+# Add the database_src directory to the path
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../data_processing/database_src")
+)
+
+from cache import TTLCache
+from models import Parts, SlicerSettings
+from .config import settings
+from .database import AsyncSessionLocal
+from ..schemas import PartsResponse, SlicerSettingsResponse
+
+# Response objects keyed by ID; invalidated by the PUT and DELETE endpoints
+slicer_settings_cache = TTLCache(
+    maxsize=settings.CACHE_MAX_ENTRIES, ttl=settings.CACHE_TTL_SECONDS
+)
+parts_cache = TTLCache(maxsize=settings.CACHE_MAX_ENTRIES, ttl=settings.CACHE_TTL_SECONDS)
+
+
+def get_cache_stats() -> dict:
+    """
+    Get the hit-rate metrics of all caches.
+
+    Returns:
+        Dictionary with the stats of each cache.
+    """
+    return {
+        "slicer_settings": slicer_settings_cache.stats(),
+        "parts": parts_cache.stats(),
+    }
+
+
+async def warm_caches() -> None:
+    """Load the most recent slicer settings and parts into the caches."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            sa.select(SlicerSettings)
+            .order_by(SlicerSettings.id.desc())
+            .limit(settings.CACHE_MAX_ENTRIES)
+        )
+        for setting in result.scalars():
+            slicer_settings_cache.set(
+                setting.id, SlicerSettingsResponse.from_orm(setting)
+            )
+
+        result = await db.execute(
+            sa.select(
+                Parts.id,
+                Parts.name,
+                Parts.url,
+                sa.func.octet_length(Parts.general_image).label("image_size"),
+            )
+            .order_by(Parts.id.desc())
+            .limit(settings.CACHE_MAX_ENTRIES)
+        )
+        for part in result:
+            parts_cache.set(part.id, PartsResponse(**part._mapping))
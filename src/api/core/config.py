@@ -25,12 +25,40 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = ""
     DB_HOST: str = "localhost"
     DB_PORT: str = "5431"
-    DB_NAME: str = "anomaly_detection"
+    # Empty for the server's default database, as in database_src/database.py
+    DB_NAME: str = ""
+
+    # Database Pool Configuration
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection
+
+    # Blob Store Configuration ('database' keeps the images in PostgreSQL)
+    BLOB_STORE_BACKEND: str = "database"
+    BLOB_STORE_PATH: str = ""  # empty: data/blobs in the repository root
+    BLOB_STORE_BUCKET: str = ""
+    BLOB_STORE_ENDPOINT_URL: str = ""
+    BLOB_STORE_PREFIX: str = "frames/"
+
+    # Metadata Cache Configuration (slicer settings and parts)
+    CACHE_TTL_SECONDS: float = 300
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_WARM_ON_STARTUP: bool = False
+
+    # Statistics Configuration (0 disables the scheduled refresh)
+    STATS_REFRESH_INTERVAL_SECONDS: int = 300
 
     # AI Model Configuration
     ONNX_MODEL_PATH: str = "models/model.onnx"
     QUANTIZED_MODEL_PATH: str = "models/quantized_models/model_quantized.onnx"
 
+    # Similarity Search Configuration (built by src/ai/inference/embed_dataset.py)
+    EMBEDDING_INDEX_PATH: str = "data/embeddings"
+    EMBEDDING_INDEX_NPROBE: int = 8
+
     # File Upload Configuration
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_IMAGE_EXTENSIONS: List[str] = [".jpg", ".jpeg", ".png", ".bmp"]
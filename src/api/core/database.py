@@ -1,5 +1,7 @@
 """Database dependency and session management."""
 
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session
 import sys
 import os
@@ -9,7 +11,20 @@ sys.path.append(
     os.path.join(os.path.dirname(__file__), "../../data_processing/database_src")
 )
 
-from database import Session as DatabaseSession
+from database import Session as DatabaseSession, async_db_url
+from .config import settings
+
+# Async engine used by the API routes; the pool is shared by all requests. The
+# URL comes from database_src so the API reads the database the writers fill.
+async_engine = create_async_engine(
+    f"{async_db_url}?prepared_statement_cache_size={settings.DB_STATEMENT_CACHE_SIZE}",
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
 
 def get_db() -> Session:
@@ -24,3 +39,14 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency function to get an async database session.
+
+    Yields:
+        AsyncSession: SQLAlchemy async database session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
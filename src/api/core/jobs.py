@@ -0,0 +1,84 @@
+"""In-process registry of background jobs and their progress."""
+
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+# Number of finished jobs kept for status queries
+MAX_FINISHED_JOBS = 100
+
+
+class Job:
+    """State of one background job."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.progress: Dict[str, int] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+    def update_progress(self, progress: Dict[str, int]) -> None:
+        """Store the latest progress counters reported by the job function."""
+        self.progress = progress
+
+
+_jobs: Dict[str, Job] = {}
+_lock = threading.Lock()
+
+
+def create_job(kind: str) -> Job:
+    """
+    Register a new pending job.
+
+    Args:
+        kind: Type of the job, e.g. 'purge'.
+
+    Returns:
+        The new Job.
+    """
+    job = Job(kind)
+    with _lock:
+        _jobs[job.id] = job
+        # Forget the oldest finished jobs
+        finished = sorted(
+            (j for j in _jobs.values() if j.finished_at is not None),
+            key=lambda j: j.finished_at,
+        )
+        for old_job in finished[: len(finished) - MAX_FINISHED_JOBS]:
+            del _jobs[old_job.id]
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Get a job by ID, or None if it is unknown or expired."""
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def run_job(job: Job, function: Callable[..., dict], *args, **kwargs) -> None:
+    """
+    Run a job function and record its outcome.
+
+    The function is called with ``progress=job.update_progress`` and must
+    return a dict with its result.
+
+    Args:
+        job: Job to run.
+        function: Job function.
+        *args: Positional arguments of the function.
+        **kwargs: Keyword arguments of the function.
+    """
+    job.status = "running"
+    try:
+        job.result = function(*args, progress=job.update_progress, **kwargs)
+        job.status = "finished"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.now()
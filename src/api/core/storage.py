@@ -0,0 +1,36 @@
+"""Blob store dependency for image content."""
+
+from typing import Optional
+import sys
+import os
+
+# Add the database_src directory to the path
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../data_processing/database_src")
+)
+
+from blob_store import DEFAULT_BLOB_STORE_PATH, BlobStore, create_blob_store
+from .config import settings
+
+# Global variable to cache the configured blob store
+_blob_store = None
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    """
+    Get the configured blob store, creating it on first use.
+
+    Returns:
+        BlobStore, or None if images are kept in PostgreSQL.
+    """
+    global _blob_store
+
+    if _blob_store is None and settings.BLOB_STORE_BACKEND != "database":
+        _blob_store = create_blob_store(
+            settings.BLOB_STORE_BACKEND,
+            path=settings.BLOB_STORE_PATH or DEFAULT_BLOB_STORE_PATH,
+            bucket=settings.BLOB_STORE_BUCKET,
+            endpoint_url=settings.BLOB_STORE_ENDPOINT_URL,
+            prefix=settings.BLOB_STORE_PREFIX,
+        )
+    return _blob_store
@@ -4,9 +4,13 @@ API endpoints for managing image data.
 This module contains all the REST endpoints for CRUD operations on image data.
 """
 
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
 import base64
 import sys
 import os
@@ -15,21 +19,84 @@ import os
 sys.path.append(
     os.path.join(os.path.dirname(__file__), "../../../data_processing/database_src")
 )
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../ai/inference"))
 
 from models import ImageData
-from crud import get_image_data_by_column_value, delete_image_data_by_id
-from ..core.database import get_db
+from crud import (
+    IMAGE_METADATA_COLUMNS,
+    filter_image_data,
+    select_image_data_by_column_value,
+    update_labels_by_filter,
+    update_labels_by_id,
+)
+from blob_store import CHUNK_SIZE, content_key, load_image
+from dataset_export import TarStreamWriter, frame_members, select_export_rows
+from dedup import (
+    DEFAULT_MAX_DISTANCE,
+    ClusterBuilder,
+    NearDuplicateFilter,
+    select_cluster_rows,
+    select_near_duplicates,
+)
+from purge import lock_blob_keys, purge_image_data
+from embedding_index import EmbeddingIndex
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, get_async_db
+from ..core.jobs import create_job, get_job, run_job
+from ..core.storage import get_blob_store
 from ..schemas import (
+    BatchUpdateResponse,
+    DuplicateClusterResponse,
     ImageDataCreate,
     ImageDataUpdate,
     ImageDataResponse,
     ImageDataWithImageResponse,
+    ImageLabelBatchUpdate,
+    JobResponse,
+    NearDuplicateResponse,
     PaginationParams,
+    PurgeRequest,
+    SimilarImageResponse,
     ErrorResponse,
 )
 
 router = APIRouter()
 
+# (id, label) pairs per UPDATE statement, below the bind parameter limit
+LABEL_UPDATE_CHUNK_SIZE = 10000
+
+# Cached similarity index, reloaded when the index files are rebuilt
+_embedding_index = None
+_embedding_index_mtime = None
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    """
+    Get the cached embedding index, loading it if it is not cached or outdated.
+
+    Raises:
+        FileNotFoundError: If no index has been built yet.
+    """
+    global _embedding_index, _embedding_index_mtime
+
+    directory = os.path.join(os.getcwd(), settings.EMBEDDING_INDEX_PATH)
+    offsets_path = os.path.join(directory, "offsets.npy")
+    if not os.path.exists(offsets_path):
+        raise FileNotFoundError(f"Embedding index not found: {directory}")
+    mtime = os.path.getmtime(offsets_path)
+    if _embedding_index is None or mtime != _embedding_index_mtime:
+        _embedding_index = EmbeddingIndex(directory)
+        _embedding_index_mtime = mtime
+    return _embedding_index
+
+
+async def _get_image_metadata(db: AsyncSession, image_id: int):
+    """Load the metadata row of an image without its blob."""
+    result = await db.execute(
+        sa.select(*IMAGE_METADATA_COLUMNS).where(ImageData.id == image_id)
+    )
+    return result.first()
+
 
 @router.get("/", response_model=List[ImageDataResponse])
 async def get_images(
@@ -43,7 +110,13 @@ async def get_images(
     parts_id: Optional[int] = Query(None, description="Filter by parts ID"),
     label: Optional[int] = Query(None, description="Filter by label"),
     layer: Optional[int] = Query(None, description="Filter by layer"),
-    db: Session = Depends(get_db),
+    start_time: Optional[datetime] = Query(
+        None, description="Only images captured at or after this time"
+    ),
+    end_time: Optional[datetime] = Query(
+        None, description="Only images captured before this time"
+    ),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Retrieve image data with optional filtering.
@@ -55,29 +128,33 @@ async def get_images(
         parts_id: Filter by parts ID.
         label: Filter by label.
         layer: Filter by layer.
+        start_time: Only include images captured at or after this time.
+        end_time: Only include images captured before this time.
         db: Database session.
 
     Returns:
         List of ImageDataResponse objects.
     """
     try:
-        query = db.query(ImageData)
+        stmt = sa.select(*IMAGE_METADATA_COLUMNS)
 
         # Apply filters
-        if slicer_settings_id is not None:
-            query = query.filter(ImageData.slicer_settings_id == slicer_settings_id)
-        if parts_id is not None:
-            query = query.filter(ImageData.parts_id == parts_id)
-        if label is not None:
-            query = query.filter(ImageData.label == label)
-        if layer is not None:
-            query = query.filter(ImageData.layer == layer)
+        stmt = filter_image_data(
+            stmt,
+            slicer_settings_id=slicer_settings_id,
+            parts_id=parts_id,
+            label=label,
+            layer=layer,
+            start_time=start_time,
+            end_time=end_time,
+        )
 
         # Apply pagination
-        images = query.offset(skip).limit(limit).all()
+        stmt = stmt.order_by(ImageData.id).offset(skip).limit(limit)
+        result = await db.execute(stmt)
 
         # Convert to response format without full image data
-        return [ImageDataResponse.from_orm_with_image_size(img) for img in images]
+        return [ImageDataResponse.from_metadata_row(row) for row in result]
 
     except Exception as e:
         raise HTTPException(
@@ -86,11 +163,253 @@ async def get_images(
         )
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_images(
+    slicer_settings_id: Optional[int] = Query(
+        None, description="Filter by slicer settings ID"
+    ),
+    parts_id: Optional[int] = Query(None, description="Filter by parts ID"),
+    label: Optional[int] = Query(None, description="Filter by label"),
+    layer: Optional[int] = Query(None, description="Filter by layer"),
+    chunk_size: int = Query(
+        default=500, ge=1, le=5000, description="Rows fetched per cursor round trip"
+    ),
+    dedup_distance: Optional[int] = Query(
+        None, ge=0, le=64, description="Skip near-duplicates within this distance"
+    ),
+):
+    """
+    Stream matching frames as a WebDataset-style tar archive.
+
+    Each frame is exported as a JPEG plus a JSON metadata member. Rows are read
+    with a server-side cursor, so the archive is never held in memory.
+
+    Args:
+        slicer_settings_id: Filter by slicer settings ID.
+        parts_id: Filter by parts ID.
+        label: Filter by label.
+        layer: Filter by layer.
+        chunk_size: Number of rows fetched from the cursor per round trip.
+        dedup_distance: Skip frames within this Hamming distance of the last
+            exported frame of the same part.
+
+    Returns:
+        StreamingResponse with the tar archive.
+    """
+    stmt = select_export_rows(
+        slicer_settings_id=slicer_settings_id,
+        parts_id=parts_id,
+        label=label,
+        layer=layer,
+    ).execution_options(yield_per=chunk_size)
+
+    store = get_blob_store()
+
+    async def stream_archive():
+        # The session lives as long as the response is being streamed
+        async with AsyncSessionLocal() as session:
+            writer = TarStreamWriter()
+            near_duplicates = (
+                NearDuplicateFilter(dedup_distance)
+                if dedup_distance is not None
+                else None
+            )
+            result = await session.stream(stmt)
+            async for row in result:
+                if near_duplicates is not None and not near_duplicates.keep(row):
+                    continue
+                image = row.image
+                if image is None:
+                    image = await run_in_threadpool(load_image, row, store)
+                for name, data, mtime in frame_members(row, image):
+                    chunk = writer.add(name, data, mtime)
+                    if chunk:
+                        yield chunk
+            yield writer.close()
+
+    return StreamingResponse(
+        stream_archive(),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": 'attachment; filename="frames.tar"'},
+    )
+
+
+@router.get("/duplicate-clusters", response_model=List[DuplicateClusterResponse])
+async def get_duplicate_clusters(
+    parts_id: Optional[int] = Query(None, description="Filter by parts ID"),
+    slicer_settings_id: Optional[int] = Query(
+        None, description="Filter by slicer settings ID"
+    ),
+    start_time: Optional[datetime] = Query(
+        None, description="Only images captured at or after this time"
+    ),
+    end_time: Optional[datetime] = Query(
+        None, description="Only images captured before this time"
+    ),
+    max_distance: int = Query(
+        default=DEFAULT_MAX_DISTANCE,
+        ge=0,
+        le=64,
+        description="Maximum Hamming distance",
+    ),
+    min_size: int = Query(default=2, ge=1, description="Minimum cluster size"),
+    limit: int = Query(
+        default=100, ge=1, le=10000, description="Maximum number of clusters"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieve clusters of consecutive near-duplicate frames per part.
+
+    Only frames whose perceptual hash has been computed (``dedup.py hash``)
+    are clustered.
+
+    Args:
+        parts_id: Filter by parts ID.
+        slicer_settings_id: Filter by slicer settings ID.
+        start_time: Only include images captured at or after this time.
+        end_time: Only include images captured before this time.
+        max_distance: Maximum Hamming distance to the cluster representative.
+        min_size: Only return clusters with at least this many frames.
+        limit: Maximum number of clusters to return.
+        db: Database session.
+
+    Returns:
+        List of DuplicateClusterResponse objects.
+    """
+    try:
+        stmt = select_cluster_rows(
+            parts_id=parts_id,
+            slicer_settings_id=slicer_settings_id,
+            start_time=start_time,
+            end_time=end_time,
+        ).execution_options(yield_per=1000)
+
+        # Rows are streamed and the query stops once enough clusters are found
+        builder = ClusterBuilder(max_distance)
+        clusters = []
+        result = await db.stream(stmt)
+        try:
+            async for row in result:
+                cluster = builder.add(row)
+                if cluster and len(cluster) >= min_size:
+                    clusters.append(cluster)
+                    if len(clusters) == limit:
+                        break
+            else:
+                cluster = builder.finish()
+                if cluster and len(cluster) >= min_size:
+                    clusters.append(cluster)
+        finally:
+            await result.close()
+        return [
+            DuplicateClusterResponse(
+                representative_id=cluster[0], size=len(cluster), ids=cluster
+            )
+            for cluster in clusters
+        ]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving duplicate clusters: {str(e)}",
+        )
+
+
+@router.patch("/labels", response_model=BatchUpdateResponse)
+async def update_labels(
+    batch: ImageLabelBatchUpdate, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Relabel many images in one transaction.
+
+    Either ``items`` with (id, label) pairs or a ``filter`` with the new
+    ``label`` is applied as set-based UPDATE statements; no rows or image
+    blobs are loaded.
+
+    Args:
+        batch: Label assignments or filter and new label.
+        db: Database session.
+
+    Returns:
+        BatchUpdateResponse with the number of updated images.
+    """
+    try:
+        updated = 0
+        if batch.items is not None:
+            assignments = [(item.id, item.label) for item in batch.items]
+            for start in range(0, len(assignments), LABEL_UPDATE_CHUNK_SIZE):
+                chunk = assignments[start : start + LABEL_UPDATE_CHUNK_SIZE]
+                result = await db.execute(update_labels_by_id(chunk))
+                updated += result.rowcount
+        else:
+            filters = batch.filter.dict(exclude_none=True)
+            result = await db.execute(update_labels_by_filter(batch.label, **filters))
+            updated = result.rowcount
+
+        await db.commit()
+        return BatchUpdateResponse(updated=updated)
+
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error updating labels: {str(e)}",
+        )
+
+
+@router.post("/purge", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def purge_images(purge: PurgeRequest, background_tasks: BackgroundTasks):
+    """
+    Start a background job deleting images by ID list or filter.
+
+    Rows are deleted in chunks; blobs that are no longer referenced are removed
+    from the blob store. Poll ``GET /images/purge/{job_id}`` for the progress.
+
+    Args:
+        purge: IDs or filter of the images to delete.
+        background_tasks: FastAPI background tasks.
+
+    Returns:
+        JobResponse of the started job.
+    """
+    job = create_job("purge")
+    background_tasks.add_task(
+        run_job,
+        job,
+        purge_image_data,
+        ids=purge.ids,
+        filters=purge.filter.dict(exclude_none=True) if purge.filter else None,
+        store=get_blob_store(),
+    )
+    return JobResponse.from_orm(job)
+
+
+@router.get("/purge/{job_id}", response_model=JobResponse)
+async def get_purge_job(job_id: str):
+    """
+    Retrieve the progress of a purge job.
+
+    Args:
+        job_id: ID of the job.
+
+    Returns:
+        JobResponse.
+    """
+    job = get_job(job_id)
+    if job is None or job.kind != "purge":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Purge job {job_id} not found",
+        )
+    return JobResponse.from_orm(job)
+
+
 @router.get("/{image_id}", response_model=ImageDataResponse)
 async def get_image(
     image_id: int,
     include_image: bool = Query(False, description="Include base64 encoded image data"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Retrieve a specific image by ID.
@@ -104,7 +423,10 @@ async def get_image(
         ImageDataResponse or ImageDataWithImageResponse.
     """
     try:
-        image = db.query(ImageData).filter(ImageData.id == image_id).first()
+        if include_image:
+            image = await db.get(ImageData, image_id)
+        else:
+            image = await _get_image_metadata(db, image_id)
         if not image:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -112,9 +434,10 @@ async def get_image(
             )
 
         if include_image:
-            return ImageDataWithImageResponse.from_orm_with_base64(image)
+            image_bytes = await run_in_threadpool(load_image, image, get_blob_store())
+            return ImageDataWithImageResponse.from_orm_with_base64(image, image_bytes)
         else:
-            return ImageDataResponse.from_orm_with_image_size(image)
+            return ImageDataResponse.from_metadata_row(image)
 
     except HTTPException:
         raise
@@ -125,8 +448,163 @@ async def get_image(
         )
 
 
+@router.get(
+    "/{image_id}/near-duplicates", response_model=List[NearDuplicateResponse]
+)
+async def get_near_duplicates(
+    image_id: int,
+    max_distance: int = Query(
+        default=DEFAULT_MAX_DISTANCE,
+        ge=0,
+        le=64,
+        description="Maximum Hamming distance",
+    ),
+    limit: int = Query(default=100, ge=1, le=1000, description="Maximum results"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieve the images whose perceptual hash is close to the one of an image.
+
+    Args:
+        image_id: ID of the image.
+        max_distance: Maximum Hamming distance of the perceptual hashes.
+        limit: Maximum number of images to return.
+        db: Database session.
+
+    Returns:
+        List of NearDuplicateResponse objects, nearest first.
+    """
+    result = await db.execute(
+        sa.select(ImageData.phash).where(ImageData.id == image_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Image with ID {image_id} not found",
+        )
+    if row.phash is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Image with ID {image_id} has no perceptual hash yet",
+        )
+
+    try:
+        result = await db.execute(
+            select_near_duplicates(row.phash, max_distance)
+            .where(ImageData.id != image_id)
+            .limit(limit)
+        )
+        return [
+            NearDuplicateResponse(id=match.id, distance=match.distance)
+            for match in result
+        ]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving near-duplicates: {str(e)}",
+        )
+
+
+@router.get("/{image_id}/similar", response_model=List[SimilarImageResponse])
+async def get_similar_images(
+    image_id: int,
+    k: int = Query(default=10, ge=1, le=1000, description="Number of results"),
+    n_probe: Optional[int] = Query(
+        default=None, ge=1, description="Number of index lists to search"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieve the images whose ViT embedding is closest to the one of an image.
+
+    Args:
+        image_id: ID of the image.
+        k: Number of images to return.
+        n_probe: Number of index lists searched (more is slower but more exact).
+        db: Database session.
+
+    Returns:
+        List of SimilarImageResponse objects, most similar first.
+    """
+    try:
+        index = await run_in_threadpool(get_embedding_index)
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)
+        )
+
+    query = index.vector(image_id)
+    if query is None:
+        if await _get_image_metadata(db, image_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Image with ID {image_id} not found",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Image with ID {image_id} has no embedding yet",
+        )
+
+    try:
+        matches = await run_in_threadpool(
+            index.search,
+            query,
+            k + 1,
+            n_probe or settings.EMBEDDING_INDEX_NPROBE,
+        )
+        return [
+            SimilarImageResponse(id=match_id, score=score)
+            for match_id, score in matches
+            if match_id != image_id
+        ][:k]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching similar images: {str(e)}",
+        )
+
+
+@router.get("/{image_id}/content", response_class=StreamingResponse)
+async def get_image_content(image_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream the JPEG of an image, from the blob store or the database.
+
+    Args:
+        image_id: ID of the image to retrieve.
+        db: Database session.
+
+    Returns:
+        StreamingResponse with the image bytes.
+    """
+    result = await db.execute(
+        sa.select(ImageData.image_sha256, ImageData.image).where(
+            ImageData.id == image_id
+        )
+    )
+    row = result.first()
+    if not row or (row.image is None and not row.image_sha256):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Image content for ID {image_id} not found",
+        )
+
+    store = get_blob_store()
+    if row.image is not None or store is None:
+        content = iter([row.image or b""])
+    else:
+        # Sync iterators are consumed in the threadpool by Starlette
+        content = store.iter_chunks(row.image_sha256, CHUNK_SIZE)
+
+    return StreamingResponse(content, media_type="image/jpeg")
+
+
 @router.post("/", response_model=ImageDataResponse, status_code=status.HTTP_201_CREATED)
-async def create_image(image_data: ImageDataCreate, db: Session = Depends(get_db)):
+async def create_image(
+    image_data: ImageDataCreate, db: AsyncSession = Depends(get_async_db)
+):
     """
     Create a new image record.
 
@@ -141,9 +619,19 @@ async def create_image(image_data: ImageDataCreate, db: Session = Depends(get_db
         # Decode base64 image
         image_bytes = base64.b64decode(image_data.image)
 
+        # Store the blob outside the database if a blob store is configured
+        store = get_blob_store()
+        image_sha256 = content_key(image_bytes)
+        if store is not None:
+            # Held until the commit, so a purge cannot delete the blob first
+            await db.execute(lock_blob_keys([image_sha256], shared=True))
+            await run_in_threadpool(store.put, image_bytes)
+
         # Create new ImageData object
         db_image = ImageData(
-            image=image_bytes,
+            image=image_bytes if store is None else None,
+            image_sha256=image_sha256,
+            image_size=len(image_bytes),
             slicer_settings_id=image_data.slicer_settings_id,
             parts_id=image_data.parts_id,
             label=image_data.label,
@@ -151,13 +639,13 @@ async def create_image(image_data: ImageDataCreate, db: Session = Depends(get_db
         )
 
         db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
+        await db.commit()
+        await db.refresh(db_image)
 
         return ImageDataResponse.from_orm_with_image_size(db_image)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating image: {str(e)}",
@@ -166,7 +654,9 @@ async def create_image(image_data: ImageDataCreate, db: Session = Depends(get_db
 
 @router.put("/{image_id}", response_model=ImageDataResponse)
 async def update_image(
-    image_id: int, image_update: ImageDataUpdate, db: Session = Depends(get_db)
+    image_id: int,
+    image_update: ImageDataUpdate,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Update an existing image record.
@@ -180,27 +670,30 @@ async def update_image(
         Updated ImageDataResponse.
     """
     try:
-        db_image = db.query(ImageData).filter(ImageData.id == image_id).first()
+        # Update fields if provided, without loading the image blob
+        update_data = image_update.dict(exclude_unset=True)
+        if update_data:
+            await db.execute(
+                sa.update(ImageData)
+                .where(ImageData.id == image_id)
+                .values(**update_data)
+            )
+
+        db_image = await _get_image_metadata(db, image_id)
         if not db_image:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Image with ID {image_id} not found",
             )
 
-        # Update fields if provided
-        update_data = image_update.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_image, field, value)
-
-        db.commit()
-        db.refresh(db_image)
+        await db.commit()
 
-        return ImageDataResponse.from_orm_with_image_size(db_image)
+        return ImageDataResponse.from_metadata_row(db_image)
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating image: {str(e)}",
@@ -208,17 +701,21 @@ async def update_image(
 
 
 @router.delete("/{image_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_image(image_id: int, db: Session = Depends(get_db)):
+async def delete_image(image_id: int):
     """
     Delete an image record.
 
+    The row is deleted like a purge, so its blob is removed from the blob store
+    once no other row references it.
+
     Args:
         image_id: ID of the image to delete.
-        db: Database session.
     """
     try:
-        success = delete_image_data_by_id(db, image_id)
-        if not success:
+        counts = await run_in_threadpool(
+            purge_image_data, ids=[image_id], store=get_blob_store()
+        )
+        if counts["deleted"] == 0:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Image with ID {image_id} not found",
@@ -233,27 +730,45 @@ async def delete_image(image_id: int, db: Session = Depends(get_db)):
         )
 
 
-@router.get("/by-column/{column_name}", response_model=List[ImageDataResponse])
+@router.get("/by-column/{column_name}", response_class=StreamingResponse)
 async def get_images_by_column(
-    column_name: str, value: int, db: Session = Depends(get_db)
+    column_name: str,
+    value: int,
+    limit: Optional[int] = Query(
+        None, ge=1, description="Maximum number of records to return"
+    ),
+    cursor: Optional[int] = Query(
+        None, ge=0, description="Only return records with an ID greater than this"
+    ),
 ):
     """
-    Get images filtered by a specific column value.
+    Stream images filtered by a specific column value as NDJSON.
+
+    Every line is one ImageDataResponse object, ordered by ID. The image blobs
+    are not loaded. To continue a truncated stream, pass the last received ID
+    as ``cursor``.
 
     Args:
         column_name: Name of the column to filter by.
         value: Value to filter for.
-        db: Database session.
+        limit: Maximum number of records to return.
+        cursor: Only return records with an ID greater than this value.
 
     Returns:
-        List of ImageDataResponse objects.
+        StreamingResponse with one JSON object per line.
     """
     try:
-        images = get_image_data_by_column_value(db, column_name, value)
-        return [ImageDataResponse.from_orm_with_image_size(img) for img in images]
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error retrieving images by {column_name}: {str(e)}",
+        stmt = select_image_data_by_column_value(
+            column_name, value, limit=limit, after_id=cursor
         )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async def stream_lines():
+        # The session lives as long as the response is being streamed
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(stmt.execution_options(yield_per=1000))
+            async for row in result:
+                yield ImageDataResponse.from_metadata_row(row).json() + "\n"
+
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
@@ -6,7 +6,8 @@ This module contains all the REST endpoints for CRUD operations on parts.
 
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
 import base64
 import sys
 import os
@@ -17,7 +18,8 @@ sys.path.append(
 )
 
 from models import Parts
-from ..core.database import get_db
+from ..core.cache import parts_cache
+from ..core.database import get_async_db
 from ..schemas import PartsCreate, PartsUpdate, PartsResponse, PartsWithImageResponse
 
 router = APIRouter()
@@ -30,7 +32,7 @@ async def get_parts(
         default=100, ge=1, le=1000, description="Maximum number of records to return"
     ),
     name: Optional[str] = Query(None, description="Filter by part name"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Retrieve parts with optional filtering.
@@ -45,14 +47,15 @@ async def get_parts(
         List of PartsResponse objects.
     """
     try:
-        query = db.query(Parts)
+        stmt = sa.select(Parts)
 
         # Apply filters
         if name:
-            query = query.filter(Parts.name.ilike(f"%{name}%"))
+            stmt = stmt.where(Parts.name.ilike(f"%{name}%"))
 
         # Apply pagination
-        parts = query.offset(skip).limit(limit).all()
+        result = await db.execute(stmt.order_by(Parts.id).offset(skip).limit(limit))
+        parts = result.scalars().all()
 
         return [PartsResponse.from_orm_with_image_size(part) for part in parts]
 
@@ -67,10 +70,10 @@ async def get_parts(
 async def get_part(
     part_id: int,
     include_image: bool = Query(False, description="Include base64 encoded image data"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Retrieve a specific part by ID.
+    Retrieve a specific part by ID. Responses without the image are cached.
 
     Args:
         part_id: ID of the part to retrieve.
@@ -81,7 +84,12 @@ async def get_part(
         PartsResponse or PartsWithImageResponse.
     """
     try:
-        part = db.query(Parts).filter(Parts.id == part_id).first()
+        if not include_image:
+            cached = parts_cache.get(part_id)
+            if cached is not None:
+                return cached
+
+        part = await db.get(Parts, part_id)
         if not part:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -91,7 +99,9 @@ async def get_part(
         if include_image:
             return PartsWithImageResponse.from_orm_with_base64(part)
         else:
-            return PartsResponse.from_orm_with_image_size(part)
+            response = PartsResponse.from_orm_with_image_size(part)
+            parts_cache.set(part_id, response)
+            return response
 
     except HTTPException:
         raise
@@ -103,7 +113,9 @@ async def get_part(
 
 
 @router.post("/", response_model=PartsResponse, status_code=status.HTTP_201_CREATED)
-async def create_part(part_data: PartsCreate, db: Session = Depends(get_db)):
+async def create_part(
+    part_data: PartsCreate, db: AsyncSession = Depends(get_async_db)
+):
     """
     Create a new part record.
 
@@ -124,13 +136,13 @@ async def create_part(part_data: PartsCreate, db: Session = Depends(get_db)):
         )
 
         db.add(db_part)
-        db.commit()
-        db.refresh(db_part)
+        await db.commit()
+        await db.refresh(db_part)
 
         return PartsResponse.from_orm_with_image_size(db_part)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating part: {str(e)}",
@@ -139,7 +151,9 @@ async def create_part(part_data: PartsCreate, db: Session = Depends(get_db)):
 
 @router.put("/{part_id}", response_model=PartsResponse)
 async def update_part(
-    part_id: int, part_update: PartsUpdate, db: Session = Depends(get_db)
+    part_id: int,
+    part_update: PartsUpdate,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Update an existing part record.
@@ -153,7 +167,7 @@ async def update_part(
         Updated PartsResponse.
     """
     try:
-        db_part = db.query(Parts).filter(Parts.id == part_id).first()
+        db_part = await db.get(Parts, part_id)
         if not db_part:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -168,15 +182,16 @@ async def update_part(
                 value = base64.b64decode(value)
             setattr(db_part, field, value)
 
-        db.commit()
-        db.refresh(db_part)
+        await db.commit()
+        await db.refresh(db_part)
+        parts_cache.invalidate(part_id)
 
         return PartsResponse.from_orm_with_image_size(db_part)
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating part: {str(e)}",
@@ -184,7 +199,7 @@ async def update_part(
 
 
 @router.delete("/{part_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_part(part_id: int, db: Session = Depends(get_db)):
+async def delete_part(part_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Delete a part record.
 
@@ -193,20 +208,21 @@ async def delete_part(part_id: int, db: Session = Depends(get_db)):
         db: Database session.
     """
     try:
-        db_part = db.query(Parts).filter(Parts.id == part_id).first()
+        db_part = await db.get(Parts, part_id)
         if not db_part:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Part with ID {part_id} not found",
             )
 
-        db.delete(db_part)
-        db.commit()
+        await db.delete(db_part)
+        await db.commit()
+        parts_cache.invalidate(part_id)
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting part: {str(e)}",
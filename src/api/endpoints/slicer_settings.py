@@ -5,8 +5,9 @@ This module contains all the REST endpoints for CRUD operations on slicer settin
 """
 
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
 import sys
 import os
 
@@ -16,7 +17,13 @@ sys.path.append(
 )
 
 from models import SlicerSettings
-from ..core.database import get_db
+from crud import (
+    SLICER_SETTINGS_COLUMNS,
+    insert_slicer_settings_if_missing,
+    slicer_settings_fingerprint,
+)
+from ..core.cache import slicer_settings_cache
+from ..core.database import get_async_db
 from ..schemas import SlicerSettingsCreate, SlicerSettingsUpdate, SlicerSettingsResponse
 
 router = APIRouter()
@@ -30,7 +37,7 @@ async def get_slicer_settings(
     ),
     printer_name: Optional[str] = Query(None, description="Filter by printer name"),
     slicer_profile: Optional[str] = Query(None, description="Filter by slicer profile"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Retrieve slicer settings with optional filtering.
@@ -46,18 +53,21 @@ async def get_slicer_settings(
         List of SlicerSettingsResponse objects.
     """
     try:
-        query = db.query(SlicerSettings)
+        stmt = sa.select(SlicerSettings)
 
         # Apply filters
         if printer_name:
-            query = query.filter(SlicerSettings.printer_name.ilike(f"%{printer_name}%"))
+            stmt = stmt.where(SlicerSettings.printer_name.ilike(f"%{printer_name}%"))
         if slicer_profile:
-            query = query.filter(
+            stmt = stmt.where(
                 SlicerSettings.slicer_profile.ilike(f"%{slicer_profile}%")
             )
 
         # Apply pagination
-        settings = query.offset(skip).limit(limit).all()
+        result = await db.execute(
+            stmt.order_by(SlicerSettings.id).offset(skip).limit(limit)
+        )
+        settings = result.scalars().all()
 
         return [SlicerSettingsResponse.from_orm(setting) for setting in settings]
 
@@ -69,9 +79,11 @@ async def get_slicer_settings(
 
 
 @router.get("/{setting_id}", response_model=SlicerSettingsResponse)
-async def get_slicer_setting(setting_id: int, db: Session = Depends(get_db)):
+async def get_slicer_setting(
+    setting_id: int, db: AsyncSession = Depends(get_async_db)
+):
     """
-    Retrieve a specific slicer setting by ID.
+    Retrieve a specific slicer setting by ID, served from the cache if possible.
 
     Args:
         setting_id: ID of the slicer setting to retrieve.
@@ -81,16 +93,20 @@ async def get_slicer_setting(setting_id: int, db: Session = Depends(get_db)):
         SlicerSettingsResponse.
     """
     try:
-        setting = (
-            db.query(SlicerSettings).filter(SlicerSettings.id == setting_id).first()
-        )
+        cached = slicer_settings_cache.get(setting_id)
+        if cached is not None:
+            return cached
+
+        setting = await db.get(SlicerSettings, setting_id)
         if not setting:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Slicer setting with ID {setting_id} not found",
             )
 
-        return SlicerSettingsResponse.from_orm(setting)
+        response = SlicerSettingsResponse.from_orm(setting)
+        slicer_settings_cache.set(setting_id, response)
+        return response
 
     except HTTPException:
         raise
@@ -105,30 +121,44 @@ async def get_slicer_setting(setting_id: int, db: Session = Depends(get_db)):
     "/", response_model=SlicerSettingsResponse, status_code=status.HTTP_201_CREATED
 )
 async def create_slicer_setting(
-    setting_data: SlicerSettingsCreate, db: Session = Depends(get_db)
+    setting_data: SlicerSettingsCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Create a new slicer setting record.
+    Get or create a slicer setting record.
+
+    Settings are matched by their fingerprint. If identical settings already
+    exist, the existing record is returned with status 200 instead of 201.
 
     Args:
         setting_data: Slicer setting data to create.
+        response: Response used to set the status code.
         db: Database session.
 
     Returns:
-        Created SlicerSettingsResponse.
+        Created or existing SlicerSettingsResponse.
     """
     try:
-        # Create new SlicerSettings object
-        db_setting = SlicerSettings(**setting_data.dict())
-
-        db.add(db_setting)
-        db.commit()
-        db.refresh(db_setting)
+        stmt, fingerprint = insert_slicer_settings_if_missing(setting_data.dict())
+        setting_id = (await db.execute(stmt)).scalar()
+        await db.commit()
+
+        if setting_id is None:
+            response.status_code = status.HTTP_200_OK
+            result = await db.execute(
+                sa.select(SlicerSettings).where(
+                    SlicerSettings.fingerprint == fingerprint
+                )
+            )
+            db_setting = result.scalar_one()
+        else:
+            db_setting = await db.get(SlicerSettings, setting_id)
 
         return SlicerSettingsResponse.from_orm(db_setting)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating slicer setting: {str(e)}",
@@ -137,7 +167,9 @@ async def create_slicer_setting(
 
 @router.put("/{setting_id}", response_model=SlicerSettingsResponse)
 async def update_slicer_setting(
-    setting_id: int, setting_update: SlicerSettingsUpdate, db: Session = Depends(get_db)
+    setting_id: int,
+    setting_update: SlicerSettingsUpdate,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Update an existing slicer setting record.
@@ -151,9 +183,7 @@ async def update_slicer_setting(
         Updated SlicerSettingsResponse.
     """
     try:
-        db_setting = (
-            db.query(SlicerSettings).filter(SlicerSettings.id == setting_id).first()
-        )
+        db_setting = await db.get(SlicerSettings, setting_id)
         if not db_setting:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -164,16 +194,26 @@ async def update_slicer_setting(
         update_data = setting_update.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_setting, field, value)
+        db_setting.fingerprint = slicer_settings_fingerprint(
+            {name: getattr(db_setting, name) for name in SLICER_SETTINGS_COLUMNS}
+        )
 
-        db.commit()
-        db.refresh(db_setting)
+        await db.commit()
+        await db.refresh(db_setting)
+        slicer_settings_cache.invalidate(setting_id)
 
         return SlicerSettingsResponse.from_orm(db_setting)
 
     except HTTPException:
         raise
+    except sa.exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Slicer settings with the same values already exist",
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating slicer setting: {str(e)}",
@@ -181,7 +221,9 @@ async def update_slicer_setting(
 
 
 @router.delete("/{setting_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_slicer_setting(setting_id: int, db: Session = Depends(get_db)):
+async def delete_slicer_setting(
+    setting_id: int, db: AsyncSession = Depends(get_async_db)
+):
     """
     Delete a slicer setting record.
 
@@ -190,22 +232,21 @@ async def delete_slicer_setting(setting_id: int, db: Session = Depends(get_db)):
         db: Database session.
     """
     try:
-        db_setting = (
-            db.query(SlicerSettings).filter(SlicerSettings.id == setting_id).first()
-        )
+        db_setting = await db.get(SlicerSettings, setting_id)
         if not db_setting:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Slicer setting with ID {setting_id} not found",
             )
 
-        db.delete(db_setting)
-        db.commit()
+        await db.delete(db_setting)
+        await db.commit()
+        slicer_settings_cache.invalidate(setting_id)
 
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting slicer setting: {str(e)}",
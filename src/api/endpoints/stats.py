@@ -0,0 +1,114 @@
+"""
+API endpoints for the dataset statistics.
+
+The statistics are served from the ``image_data_stats`` materialised view,
+which is refreshed on a schedule and on demand.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+import sys
+import os
+
+# Add the database_src directory to the path
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "../../../data_processing/database_src")
+)
+
+from stats import refresh_stats_view, select_stats, stats_row_to_dict
+from ..core.database import async_engine, get_async_db
+from ..schemas import ImageDataStatsResponse
+
+router = APIRouter()
+
+
+async def refresh_stats() -> datetime:
+    """
+    Refresh the materialised statistics.
+
+    Returns:
+        Time at which the refresh finished.
+    """
+    async with async_engine.begin() as connection:
+        await connection.run_sync(refresh_stats_view)
+    return datetime.now()
+
+
+async def run_scheduled_refresh(interval: float) -> None:
+    """Refresh the statistics every ``interval`` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_stats()
+        except Exception as e:
+            print(f"Error refreshing statistics: {e}")
+
+
+@router.get("/", response_model=List[ImageDataStatsResponse])
+async def get_stats(
+    group_by: List[str] = Query(
+        default=["label"],
+        description="Columns to group by: label, layer_bucket, parts_id, "
+        "slicer_settings_id",
+    ),
+    label: Optional[int] = Query(None, description="Filter by label"),
+    parts_id: Optional[int] = Query(None, description="Filter by parts ID"),
+    slicer_settings_id: Optional[int] = Query(
+        None, description="Filter by slicer settings ID"
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieve frame counts and image byte totals.
+
+    Args:
+        group_by: Columns to group the statistics by.
+        label: Filter by label.
+        parts_id: Filter by parts ID.
+        slicer_settings_id: Filter by slicer settings ID.
+        db: Database session.
+
+    Returns:
+        List of ImageDataStatsResponse objects, one per group.
+    """
+    try:
+        stmt = select_stats(
+            group_by=group_by,
+            label=label,
+            parts_id=parts_id,
+            slicer_settings_id=slicer_settings_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        result = await db.execute(stmt)
+        return [ImageDataStatsResponse(**stats_row_to_dict(row)) for row in result]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving statistics: {str(e)}",
+        )
+
+
+@router.post("/refresh")
+async def refresh_stats_now():
+    """
+    Refresh the statistics immediately.
+
+    Returns:
+        Time of the refresh.
+    """
+    try:
+        refreshed_at = await refresh_stats()
+        return {"refreshed_at": refreshed_at}
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error refreshing statistics: {str(e)}",
+        )
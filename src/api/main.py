@@ -5,12 +5,15 @@ This module sets up the main FastAPI application with all the necessary
 middleware, routers, and configurations.
 """
 
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 import uvicorn
 
-from .endpoints import images, slicer_settings, parts, inference
+from .endpoints import images, slicer_settings, parts, inference, stats
+from .core.cache import get_cache_stats, warm_caches
 from .core.config import settings
 
 # Create FastAPI application instance
@@ -40,11 +43,31 @@ app.include_router(
     tags=["slicer-settings"],
 )
 app.include_router(parts.router, prefix=f"{settings.API_V1_STR}/parts", tags=["parts"])
+app.include_router(stats.router, prefix=f"{settings.API_V1_STR}/stats", tags=["stats"])
 app.include_router(
     inference.router, prefix=f"{settings.API_V1_STR}/inference", tags=["inference"]
 )
 
 
+@app.on_event("startup")
+async def startup():
+    """Warm the metadata caches and schedule the statistics refresh if configured."""
+    if settings.CACHE_WARM_ON_STARTUP:
+        await warm_caches()
+    if settings.STATS_REFRESH_INTERVAL_SECONDS > 0:
+        app.state.stats_refresh_task = asyncio.create_task(
+            stats.run_scheduled_refresh(settings.STATS_REFRESH_INTERVAL_SECONDS)
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the scheduled statistics refresh."""
+    task = getattr(app.state, "stats_refresh_task", None)
+    if task is not None:
+        task.cancel()
+
+
 @app.get("/", include_in_schema=False)
 async def root():
     """Redirect root to API documentation."""
@@ -60,5 +83,11 @@ async def health_check():
     }
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit-rate metrics of the slicer settings and parts caches."""
+    return get_cache_stats()
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
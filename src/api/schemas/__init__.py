@@ -6,8 +6,8 @@ and response serialization.
 """
 
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field, validator
+from typing import Dict, Optional, List
+from pydantic import BaseModel, Field, root_validator, validator
 import base64
 
 
@@ -73,7 +73,21 @@ class ImageDataResponse(ImageDataBase):
             "parts_id": obj.parts_id,
             "label": obj.label,
             "layer": obj.layer,
-            "image_size": len(obj.image) if obj.image else None,
+            "image_size": obj.image_size or (len(obj.image) if obj.image else None),
+        }
+        return cls(**data)
+
+    @classmethod
+    def from_metadata_row(cls, row):
+        """Create response from a metadata row that carries the image size."""
+        data = {
+            "id": row.id,
+            "timestamp": row.timestamp,
+            "slicer_settings_id": row.slicer_settings_id,
+            "parts_id": row.parts_id,
+            "label": row.label,
+            "layer": row.layer,
+            "image_size": row.image_size,
         }
         return cls(**data)
 
@@ -84,8 +98,13 @@ class ImageDataWithImageResponse(ImageDataResponse):
     image: str = Field(..., description="Base64 encoded image data")
 
     @classmethod
-    def from_orm_with_base64(cls, obj):
-        """Create response with base64 encoded image."""
+    def from_orm_with_base64(cls, obj, image=None):
+        """
+        Create response with base64 encoded image.
+
+        ``image`` overrides ``obj.image`` for blobs loaded from the blob store.
+        """
+        image = image if image is not None else obj.image
         data = {
             "id": obj.id,
             "timestamp": obj.timestamp,
@@ -93,12 +112,124 @@ class ImageDataWithImageResponse(ImageDataResponse):
             "parts_id": obj.parts_id,
             "label": obj.label,
             "layer": obj.layer,
-            "image_size": len(obj.image) if obj.image else None,
-            "image": base64.b64encode(obj.image).decode("utf-8") if obj.image else "",
+            "image_size": len(image) if image else None,
+            "image": base64.b64encode(image).decode("utf-8") if image else "",
         }
         return cls(**data)
 
 
+class ImageDataFilter(BaseSchema):
+    """Filter selecting image data rows for batch operations."""
+
+    slicer_settings_id: Optional[int] = None
+    parts_id: Optional[int] = None
+    label: Optional[int] = None
+    layer: Optional[int] = None
+    start_time: Optional[datetime] = Field(
+        None, description="Only images captured at or after this time"
+    )
+    end_time: Optional[datetime] = Field(
+        None, description="Only images captured before this time"
+    )
+
+    @root_validator(skip_on_failure=True)
+    def validate_not_empty(cls, values):
+        """Reject empty filters, which would select every image."""
+        if all(value is None for value in values.values()):
+            raise ValueError("At least one filter field is required")
+        return values
+
+
+class ImageLabelAssignment(BaseSchema):
+    """New label of one image."""
+
+    id: int
+    label: Optional[int] = None
+
+
+class ImageLabelBatchUpdate(BaseSchema):
+    """Schema for relabelling many images at once."""
+
+    items: Optional[List[ImageLabelAssignment]] = Field(
+        None, description="(id, label) pairs"
+    )
+    filter: Optional[ImageDataFilter] = Field(
+        None, description="Images to relabel with ``label``"
+    )
+    label: Optional[int] = Field(None, description="New label for ``filter``")
+    clear_label: bool = Field(
+        False, description="Remove the label of the ``filter`` images"
+    )
+
+    @root_validator(skip_on_failure=True)
+    def validate_items_or_filter(cls, values):
+        """Require exactly one of ``items`` and ``filter``, and a ``filter`` label."""
+        if (values.get("items") is None) == (values.get("filter") is None):
+            raise ValueError("Provide either 'items' or 'filter'")
+        if values.get("filter") is not None:
+            # A missing label must not silently clear every matching image
+            if values.get("clear_label") == (values.get("label") is not None):
+                raise ValueError(
+                    "Provide either 'label' or 'clear_label' with 'filter'"
+                )
+        return values
+
+
+class BatchUpdateResponse(BaseSchema):
+    """Schema for the result of a batch update."""
+
+    updated: int = Field(..., description="Number of updated images")
+
+
+class NearDuplicateResponse(BaseSchema):
+    """Schema for a near-duplicate of an image."""
+
+    id: int
+    distance: int = Field(..., description="Hamming distance of the perceptual hashes")
+
+
+class SimilarImageResponse(BaseSchema):
+    """Schema for an image similar to a query image."""
+
+    id: int
+    score: float = Field(..., description="Cosine similarity of the embeddings")
+
+
+class DuplicateClusterResponse(BaseSchema):
+    """Schema for a cluster of near-duplicate images."""
+
+    representative_id: int = Field(..., description="First image of the cluster")
+    size: int
+    ids: List[int]
+
+
+class PurgeRequest(BaseSchema):
+    """Schema for purging images by ID list or filter."""
+
+    ids: Optional[List[int]] = Field(None, description="IDs of the images")
+    filter: Optional[ImageDataFilter] = Field(None, description="Images to purge")
+
+    @root_validator(skip_on_failure=True)
+    def validate_ids_or_filter(cls, values):
+        """Require exactly one of ``ids`` and ``filter``."""
+        if (values.get("ids") is None) == (values.get("filter") is None):
+            raise ValueError("Provide either 'ids' or 'filter'")
+        return values
+
+
+class JobResponse(BaseSchema):
+    """Schema for the state of a background job."""
+
+    id: str
+    kind: str
+    status: str = Field(..., description="pending, running, finished or failed")
+    progress: Dict[str, int] = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
 # Slicer Settings Schemas
 class SlicerSettingsBase(BaseSchema):
     """Base schema for SlicerSettings."""
@@ -150,6 +281,7 @@ class SlicerSettingsResponse(SlicerSettingsBase):
     """Schema for SlicerSettings response."""
 
     id: int
+    fingerprint: Optional[str] = None
 
 
 # Parts Schemas
@@ -236,6 +368,20 @@ class PartsWithImageResponse(PartsResponse):
         return cls(**data)
 
 
+# Statistics Schemas
+class ImageDataStatsResponse(BaseSchema):
+    """Schema for one group of the frame statistics."""
+
+    label: Optional[int] = None
+    layer_bucket: Optional[int] = Field(
+        None, description="First layer of the layer bucket"
+    )
+    parts_id: Optional[int] = None
+    slicer_settings_id: Optional[int] = None
+    frame_count: int
+    total_bytes: int = Field(..., description="Total size of the images in bytes")
+
+
 # Inference Schemas
 class InferenceRequest(BaseSchema):
     """Schema for anomaly detection inference request."""
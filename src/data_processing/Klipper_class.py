@@ -1,19 +1,118 @@
-from requests import get, post
-from gcode_extraction.extract_gcode_from_string import (
-    extract_relevant_slicing_parameters_from_string,
+import random
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+from gcode_extraction.parameter_parser import (
+    SLICING_PARAMETERS,
+    parse_gcode_parameters,
 )
 
+# (connect, read) timeouts in seconds per URL prefix; the longest match wins
+DEFAULT_TIMEOUT = (1.0, 2.0)
+TIMEOUTS = {
+    "/printer/gcode/script": (1.0, 10.0),
+    "/server/files/": (1.0, 30.0),
+}
+# Response codes of a restarting or overloaded Moonraker that are retried
+RETRY_STATUS_CODES = (502, 503, 504)
+# Byte ranges read by fetch_gcode_metadata: slicers write a header at the start
+# and (OrcaSlicer) the config block at the end of the file
+GCODE_HEAD_BYTES = 32 * 1024
+GCODE_TAIL_BYTES = 64 * 1024
+GCODE_MAX_TAIL_BYTES = 8 * 1024 * 1024
+# Start of the config block of OrcaSlicer and PrusaSlicer; once it is in the
+# tail range, keys that are still missing are not in the file
+CONFIG_BLOCK_MARKERS = (b"; CONFIG_BLOCK_START", b"; prusaslicer_config = begin")
+
+
+class PrinterUnavailableError(Exception):
+    """The printer did not answer or its circuit breaker is open."""
+
+
+class CircuitBreaker(object):
+    """Stops requests to a printer after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    requests fail immediately. After ``reset_timeout`` seconds one trial
+    request is let through; its success closes the breaker again.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Returns whether a request may be sent now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running:
+                return False
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
 
 class KlipperPrinter(object):
     """Moonraker API interface.
+
+    Requests share one keep-alive connection pool. Idempotent requests are
+    retried with jittered exponential backoff, and a circuit breaker makes
+    requests to an offline printer fail fast with ``PrinterUnavailableError``.
+
     Args
     ----
     address (str): e.g. 'http://192.168.1.17'
+    retries (int): Number of retries of GET requests
+    backoff (float): Base delay between retries in seconds
+    breaker (CircuitBreaker): Circuit breaker of the printer
+    gcode_cache (GcodeParameterCache): Cache of the parsed G-code parameters
     """
 
-    def __init__(self, address: str) -> None:
+    def __init__(
+        self,
+        address: str,
+        retries: int = 2,
+        backoff: float = 0.2,
+        breaker: CircuitBreaker = None,
+        gcode_cache=None,
+    ) -> None:
         # used to strip trailing slashes that comes from copying the url from the browser
         self.addr = address.strip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.gcode_cache = gcode_cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
         configfile = self.get("/printer/objects/query?configfile")
         self.settings = configfile["result"]["status"]["configfile"]["settings"]
@@ -21,7 +120,8 @@ class KlipperPrinter(object):
 
     def check_connection(self) -> bool:
         try:
-            self.get("/printer/objects/query?configfile")
+            # Small payload, unlike the configfile query
+            self.get("/printer/info")
             return True
         except Exception as e:
             print(f"Error checking connection: {e}")
@@ -49,14 +149,108 @@ class KlipperPrinter(object):
         return gcode_content
 
     def extract_gcode_params(self) -> dict:
-        gcode_content = self.get_gcode()
-        # Extract relevant parameters from the G-code content
-        params = extract_relevant_slicing_parameters_from_string(gcode_content)
+        if self.gcode_cache is None:
+            # Only the head and tail of the G-code file are downloaded
+            return self.fetch_gcode_metadata()
+        params = self.gcode_cache.lookup(self)["parameters"]
+        return {key: params[key] for key in SLICING_PARAMETERS if key in params}
+
+    def get_file_metadata(self, filename: str) -> dict:
+        """Moonraker's metadata of a G-code file (size, modified, slicer, ...).
+
+        Returns an empty dict if Moonraker has no metadata for the file yet.
+        """
+        response = self.get(f"/server/files/metadata?filename={quote(filename)}")
+        return response.get("result") or {}
+
+    def fetch_gcode_metadata(
+        self,
+        filename: str = None,
+        head_bytes: int = GCODE_HEAD_BYTES,
+        tail_bytes: int = GCODE_TAIL_BYTES,
+        max_tail_bytes: int = GCODE_MAX_TAIL_BYTES,
+        parameters: list = SLICING_PARAMETERS,
+    ) -> dict:
+        """Extracts the slicing parameters from the head and tail of a G-code file.
+
+        The tail range is doubled while parameters are missing, up to
+        ``max_tail_bytes``, until it reaches the head or until it contains the
+        start of the slicer's config block. Servers that ignore the Range
+        header send the whole file, which is parsed as before.
+
+        Args
+        ----
+        filename (str): G-code file; defaults to the current print job
+        head_bytes (int): Bytes read from the start of the file
+        tail_bytes (int): Bytes first read from the end of the file
+        max_tail_bytes (int): Largest tail read before giving up
+        parameters (list): Parameters to look for
+
+        Returns
+        -------
+        dict
+            Parameters found, as returned by ``parse_gcode_parameters``.
+        """
+        url = f"/server/files/gcodes/{filename or self.get_filename()}"
+        head, size = self.get_byte_range(url, 0, head_bytes - 1)
+        if size is None or size <= len(head):
+            return parse_gcode_parameters(head, parameters)
+        # Drop the line cut off at the end of the head range
+        params = parse_gcode_parameters(head[: head.rfind(b"\n") + 1], parameters)
+        missing = set(parameters) - params.keys()
+
+        tail = b""
+        tail_start = size
+        while missing:
+            start = max(len(head), size - tail_bytes)
+            chunk, _ = self.get_byte_range(url, start, tail_start - 1)
+            tail, tail_start = chunk + tail, start
+            if tail_start == len(head):
+                # Rejoin the line split between the head and the tail
+                text = head[head.rfind(b"\n") + 1 :] + tail
+            else:
+                # Drop the line cut off at the start of the tail range
+                text = tail[tail.find(b"\n") + 1 :]
+            # Only the missing keys, so head values win as in a full scan
+            params.update(parse_gcode_parameters(text, missing))
+            missing -= params.keys()
+            if not missing or any(marker in tail for marker in CONFIG_BLOCK_MARKERS):
+                break
+            if tail_start == len(head) or tail_bytes >= max_tail_bytes:
+                print(f"Slicing parameters not found in {url}: {sorted(missing)}")
+                break
+            tail_bytes = min(tail_bytes * 2, max_tail_bytes)
         return params
 
+    def get_byte_range(self, url: str, start: int, end: int) -> tuple:
+        """Downloads bytes ``start`` to ``end`` (inclusive) of a file.
+
+        Returns
+        -------
+        tuple
+            (content, file size). The size is None if the server ignored the
+            Range header and sent the whole file as content.
+        """
+        headers = {"Range": f"bytes={start}-{end}"}
+        response = self.request("GET", url, headers=headers)
+        if response.status_code == 416:
+            # Range starts beyond the end, e.g. an empty file
+            return b"", 0
+        response.raise_for_status()
+        if response.status_code != 206:
+            return response.content, None
+        # Content-Range: bytes 0-32767/123456789
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return response.content, int(total) if total.isdigit() else None
+
     def get_part_name(self) -> str:
 
-        return self.get_filename().split("_0")[0]
+        return self.part_name(self.get_filename())
+
+    @staticmethod
+    def part_name(filename: str) -> str:
+        """Returns the part name of a G-code file, the text before the first '_0'."""
+        return filename.split("_0")[0]
 
     def query_status(self):
         """
@@ -73,13 +267,70 @@ class KlipperPrinter(object):
     def get(self, url: str):
         """`response.get` wrapper. `url` concatenated to printer base address
         Returns .json response dict."""
-        return get(self.addr + url, timeout=2).json()
+        return self.request("GET", url).json()
 
     def post(self, url: str, *args, **kwargs):
         """`response.set` wrapper. `url` is concatenated to printer base address.
         Returns .json response dict."""
-        return post(self.addr + url, *args, **kwargs).json()
+        return self.request("POST", url, *args, **kwargs).json()
 
     def get_download(self, url: str):
         """Download the content from a G-code file from the printer's server."""
-        return get(self.addr + url, timeout=2)
+        return self.request("GET", url)
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        """Sends a request through the pooled session.
+
+        GET requests are retried on connection errors, timeouts and 502/503/504
+        responses; POST requests are sent once, since G-code scripts must not
+        run twice. Any other ``requests.RequestException`` fails the request
+        without retries.
+
+        Raises
+        ------
+        PrinterUnavailableError
+            If the circuit breaker is open or all attempts failed.
+        """
+        if not self.breaker.allow():
+            raise PrinterUnavailableError(f"Printer {self.addr} is unavailable")
+
+        kwargs.setdefault("timeout", self.timeout(url))
+        attempts = self.retries + 1 if method == "GET" else 1
+        for attempt in range(attempts):
+            try:
+                response = self.session.request(
+                    method, self.addr + url, *args, **kwargs
+                )
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.breaker.record_success()
+                    return response
+                error = requests.HTTPError(
+                    f"{response.status_code} from {url}", response=response
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.RequestException as e:
+                # Not retried (e.g. a broken response), but it still counts as a
+                # failure so that a half-open trial is resolved
+                error = e
+                break
+            if attempt + 1 < attempts:
+                # Full jitter, so several capture threads do not retry in lockstep
+                time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+        self.breaker.record_failure()
+        raise PrinterUnavailableError(
+            f"Printer {self.addr} did not answer {method} {url}: {error}"
+        ) from error
+
+    @staticmethod
+    def timeout(url: str) -> tuple:
+        """Returns the (connect, read) timeout of an endpoint."""
+        matches = [prefix for prefix in TIMEOUTS if url.startswith(prefix)]
+        if not matches:
+            return DEFAULT_TIMEOUT
+        return TIMEOUTS[max(matches, key=len)]
+
+    def close(self) -> None:
+        """Closes the pooled connections."""
+        self.session.close()
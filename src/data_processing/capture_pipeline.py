@@ -0,0 +1,335 @@
+"""
+Bounded producer/consumer pipeline from frame capture to ``image_data``.
+
+    capture tasks --put()--> frame queue --> encoders (thread pool)
+        --> write queue --> writer: one INSERT per batch of N frames or T ms
+
+Both queues are bounded. When the frame queue is full, the ``policy``
+decides what happens to a new frame:
+
+    block        ``put`` waits for space, slowing down the capture task
+    drop_newest  the new frame is dropped
+    drop_oldest  the oldest queued frame is dropped to make room
+
+A slow database fills the write queue first, which stalls the encoders and
+then fills the frame queue, so the policy also applies to database
+backpressure. ``metrics()`` reports queue depths, dropped frames and
+write latencies.
+
+With a ``FrameSpool`` (see frame_spool.py) the writer appends the batches to
+the local spool instead, and a drain task moves them to the database in bulk
+whenever it is reachable, so frames survive database outages.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image
+
+# Add the database_src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), "database_src"))
+
+import sqlalchemy as sa
+
+from database import Session
+from models import ImageData
+from blob_store import content_key
+from purge import lock_blob_keys
+
+POLICIES = ("block", "drop_newest", "drop_oldest")
+
+
+def encode_frame(image, quality: int = 90) -> bytes:
+    """
+    Encodes a frame as JPEG; frames that are JPEG bytes already are kept.
+
+    Args:
+        image: JPEG bytes, a PIL image or an HxWx3 RGB array.
+        quality: JPEG quality.
+
+    Returns:
+        bytes: The JPEG data.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def write_frames(rows: list, store=None) -> None:
+    """
+    Inserts a batch of encoded frames into image_data in one transaction.
+
+    Args:
+        rows: Dicts with image, timestamp, layer, parts_id and
+            slicer_settings_id.
+        store: Blob store; the images are stored there instead of the table.
+    """
+    images = [row.pop("image") for row in rows]
+    keys = [content_key(image) for image in images]
+    with Session() as session:
+        if store is not None:
+            # Held until the commit, so a purge cannot delete a blob between
+            # the put and the INSERT of the row referencing it
+            session.execute(lock_blob_keys(keys, shared=True))
+            for image in images:
+                store.put(image)
+        values = [
+            dict(
+                row,
+                image=image if store is None else None,
+                image_sha256=key,
+                image_size=len(image),
+            )
+            for row, image, key in zip(rows, images, keys)
+        ]
+        session.execute(sa.insert(ImageData), values)
+        session.commit()
+
+
+class CapturePipeline(object):
+    """
+    Encodes captured frames in a thread pool and writes them in batches.
+
+    Args:
+        maxsize: Capacity of the frame queue.
+        policy: What happens to frames when the queue is full, see ``POLICIES``.
+        encode_workers: Number of encoder threads.
+        batch_size: Maximum number of frames per INSERT.
+        flush_interval: Maximum seconds a frame waits for its batch.
+        store: Blob store passed on to ``write_frames``.
+        write_retries: Attempts per batch before it is dropped.
+        spool: FrameSpool the batches are written to first.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        policy: str = "drop_oldest",
+        encode_workers: int = 2,
+        batch_size: int = 50,
+        flush_interval: float = 0.5,
+        jpeg_quality: int = 90,
+        store=None,
+        write_retries: int = 3,
+        spool=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.policy = policy
+        self.encode_workers = encode_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.jpeg_quality = jpeg_quality
+        self.store = store
+        self.write_retries = write_retries
+        self.spool = spool
+
+        self.frames: asyncio.Queue = asyncio.Queue(maxsize)
+        self.encoded: asyncio.Queue = asyncio.Queue(max(batch_size * 2, maxsize))
+        self.counters = {
+            "received": 0,
+            "dropped": 0,
+            "encoded": 0,
+            "encode_errors": 0,
+            "written": 0,
+            "write_errors": 0,
+            "batches": 0,
+            "spooled": 0,
+        }
+        self.last_write_seconds: Optional[float] = None
+        self.max_write_seconds = 0.0
+        # Encoders, the writer and the spool drain
+        self._executor = ThreadPoolExecutor(
+            max_workers=encode_workers + 2, thread_name_prefix="capture-pipeline"
+        )
+        self._drain_lock = threading.Lock()
+        self._tasks = []
+
+    async def put(self, frame) -> bool:
+        """
+        Queues a captured frame according to the queue policy.
+
+        Args:
+            frame: Object with image, timestamp and layer attributes and
+                optional parts_id and slicer_settings_id.
+
+        Returns:
+            bool: False if the frame was dropped.
+        """
+        self.counters["received"] += 1
+        if self.policy == "block":
+            await self.frames.put(frame)
+            return True
+        if self.frames.full():
+            if self.policy == "drop_newest":
+                self.counters["dropped"] += 1
+                return False
+            self.frames.get_nowait()
+            self.frames.task_done()
+            self.counters["dropped"] += 1
+        self.frames.put_nowait(frame)
+        return True
+
+    def start(self) -> None:
+        """Starts the encoder and writer tasks in the running event loop."""
+        self._tasks = [
+            asyncio.create_task(self._encode_loop())
+            for _ in range(self.encode_workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._write_loop()))
+        if self.spool is not None:
+            self._tasks.append(asyncio.create_task(self._drain_loop()))
+
+    async def close(self) -> None:
+        """Writes all queued frames and stops the pipeline."""
+        await self.frames.join()
+        await self.encoded.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.spool is not None:
+            # Frames that cannot be drained now stay in the spool for the next run
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._executor, self._drain_spool)
+            except Exception as e:
+                print(f"{self.spool.pending()} frames left in the spool: {e}")
+            self.spool.close()
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def metrics(self) -> dict:
+        """Queue depths, frame counters and write latencies."""
+        return dict(
+            self.counters,
+            queue_depth=self.frames.qsize(),
+            queue_capacity=self.frames.maxsize,
+            write_queue_depth=self.encoded.qsize(),
+            spool_pending=None if self.spool is None else self.spool.pending(),
+            spool_evicted=None if self.spool is None else self.spool.evicted,
+            last_write_ms=(
+                None
+                if self.last_write_seconds is None
+                else round(self.last_write_seconds * 1000, 1)
+            ),
+            max_write_ms=round(self.max_write_seconds * 1000, 1),
+        )
+
+    async def _encode_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await self.frames.get()
+            try:
+                image = await loop.run_in_executor(
+                    self._executor, encode_frame, frame.image, self.jpeg_quality
+                )
+                row = {
+                    "image": image,
+                    "timestamp": frame.timestamp,
+                    "layer": frame.layer,
+                    "parts_id": getattr(frame, "parts_id", None),
+                    "slicer_settings_id": getattr(frame, "slicer_settings_id", None),
+                }
+                # Waits while the writer is behind, which stalls the encoders
+                await self.encoded.put(row)
+                self.counters["encoded"] += 1
+            except Exception as e:
+                self.counters["encode_errors"] += 1
+                print(f"Error encoding frame: {e}")
+            finally:
+                self.frames.task_done()
+
+    async def _next_batch(self) -> list:
+        batch = [await self.encoded.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.encoded.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write_batch(loop, batch)
+            finally:
+                for _ in batch:
+                    self.encoded.task_done()
+
+    async def _write_batch(self, loop, batch: list) -> None:
+        if self.spool is not None:
+            await loop.run_in_executor(self._executor, self.spool.append_many, batch)
+            self.counters["spooled"] += len(batch)
+            return
+        for attempt in range(self.write_retries):
+            started = time.monotonic()
+            try:
+                await loop.run_in_executor(
+                    self._executor,
+                    write_frames,
+                    [dict(row) for row in batch],
+                    self.store,
+                )
+            except Exception as e:
+                print(f"Error writing {len(batch)} frames: {e}")
+                await asyncio.sleep(0.5 * 2**attempt)
+                continue
+            self.last_write_seconds = time.monotonic() - started
+            self.max_write_seconds = max(
+                self.max_write_seconds, self.last_write_seconds
+            )
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+            return
+        self.counters["write_errors"] += len(batch)
+
+    def _drain_spool(self) -> int:
+        def write(rows):
+            started = time.monotonic()
+            write_frames(rows, self.store)
+            self.last_write_seconds = time.monotonic() - started
+            self.max_write_seconds = max(
+                self.max_write_seconds, self.last_write_seconds
+            )
+            self.counters["written"] += len(rows)
+            self.counters["batches"] += 1
+
+        # A cancelled drain task keeps running in its thread until it returns
+        with self._drain_lock:
+            return self.spool.drain(write, self.batch_size)
+
+    async def _drain_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        backoff = self.flush_interval
+        while True:
+            try:
+                drained = await loop.run_in_executor(self._executor, self._drain_spool)
+                backoff = self.flush_interval
+            except Exception as e:
+                print(f"Database unreachable, keeping frames in the spool: {e}")
+                drained = 0
+                backoff = min(backoff * 2, 30.0)
+            if not drained:
+                await asyncio.sleep(backoff)
@@ -0,0 +1,509 @@
+"""
+asyncio supervisor capturing frames from many printers.
+
+Every printer from the config file gets a Moonraker WebSocket watcher (see
+``moonraker_ws.py``) and a capture task, both running in one event loop. The
+per-printer tasks are restarted with backoff when they fail, so one broken
+printer never affects the others. Idle printers cost one open WebSocket;
+snapshots are fetched through a thread pool of fixed size shared by all
+printers, so the footprint stays roughly flat as printers are added.
+
+Capture modes (``capture_mode`` in the config):
+    interval  a frame every ``capture_interval`` seconds while printing
+    layer     ``frames_per_layer`` frames on every layer change, optionally
+              once the toolhead is at ``capture_position`` (see layer_trigger.py)
+    macro     ``frames_per_layer`` frames whenever the slicer's layer change
+              G-code calls the capture macro
+
+With ``--gcode-cache`` the slicer settings of every print are resolved
+through gcode_cache.py when it starts, and its part by the G-code file name
+(see ``crud.resolve_part_id``); both IDs are stored with its frames.
+
+Usage:
+    python capture_supervisor.py printers.yaml --output-dir frames/
+    python capture_supervisor.py printers.yaml --sink database --batch-size 50
+    python capture_supervisor.py printers.yaml --sink database --spool-dir spool/
+    python capture_supervisor.py printers.yaml --sink database --gcode-cache
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import requests
+import yaml
+
+from Klipper_class import KlipperPrinter
+from moonraker_ws import MoonrakerWebSocket
+from layer_trigger import LayerTracker, in_position, parse_capture_macro
+
+CAPTURE_MODES = ("interval", "layer", "macro")
+DEFAULTS = {
+    "capture_mode": "interval",
+    "capture_interval": 1.0,
+    "frames_per_layer": 1,
+    "frame_spacing": 0.2,  # seconds between the frames of one layer
+    "capture_position": None,  # [x, y] in mm, or None to capture right away
+    "position_tolerance": 5.0,
+    "position_timeout": 10.0,
+    "snapshot_path": "/webcam/?action=snapshot",
+    "snapshot_timeout": 5.0,
+}
+
+
+def load_config(path: str) -> list:
+    """
+    Loads the printer configs from a YAML file.
+
+    The file has a ``printers`` list with at least ``name`` and ``url`` per
+    printer; keys of the optional ``defaults`` mapping apply to all printers.
+    See ``printers.example.yaml``.
+
+    Returns:
+        list: One dict per printer with all keys of ``DEFAULTS``.
+
+    Raises:
+        ValueError: If a printer has no name or URL, a name is used twice or
+            the capture mode is unknown.
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    defaults = dict(DEFAULTS, **(config.get("defaults") or {}))
+
+    printers = []
+    names = set()
+    for entry in config.get("printers") or []:
+        printer = dict(defaults, **entry)
+        if not printer.get("name") or not printer.get("url"):
+            raise ValueError(f"Printer config needs a name and a url: {entry}")
+        if printer["capture_mode"] not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode: {printer['capture_mode']}")
+        if printer["name"] in names:
+            raise ValueError(f"Duplicate printer name: {printer['name']}")
+        names.add(printer["name"])
+        printer.setdefault(
+            "snapshot_url", printer["url"].rstrip("/") + printer["snapshot_path"]
+        )
+        printers.append(printer)
+    return printers
+
+
+class Frame(object):
+    """One captured camera frame."""
+
+    def __init__(
+        self,
+        printer: str,
+        image: bytes,
+        layer: Optional[int] = None,
+        slicer_settings_id: Optional[int] = None,
+        parts_id: Optional[int] = None,
+    ):
+        self.printer = printer
+        self.image = image
+        self.layer = layer
+        self.slicer_settings_id = slicer_settings_id
+        self.parts_id = parts_id
+        self.timestamp = datetime.now()
+
+
+class PrinterHealth(object):
+    """Health state of one printer, as reported by the supervisor."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.connection = "connecting"
+        self.print_state: Optional[str] = None
+        self.last_update: Optional[float] = None
+        self.frames = 0
+        self.errors = 0
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+
+    def record_error(self, error: Exception) -> None:
+        self.errors += 1
+        self.last_error = str(error)
+
+    def as_dict(self) -> dict:
+        age = None
+        if self.last_update is not None:
+            age = round(time.monotonic() - self.last_update, 1)
+        return {
+            "name": self.name,
+            "connection": self.connection,
+            "print_state": self.print_state,
+            "seconds_since_update": age,
+            "frames": self.frames,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
+
+
+class PrinterWorker(object):
+    """Status watcher and frame capture of one printer."""
+
+    def __init__(
+        self,
+        config: dict,
+        sink: Callable[[Frame], Awaitable[None]],
+        executor: ThreadPoolExecutor,
+        gcode_cache=None,
+    ):
+        self.config = config
+        self.name = config["name"]
+        self.sink = sink
+        self.executor = executor
+        self.health = PrinterHealth(self.name)
+        self.client: Optional[MoonrakerWebSocket] = None
+        self.printing = asyncio.Event()
+        self.session = requests.Session()
+        self.layers = LayerTracker()
+        self._requested_layer: Optional[int] = None
+        self._layer_requested = asyncio.Event()
+        self.gcode_cache = gcode_cache
+        self.slicer_settings_id: Optional[int] = None
+        self.parts_id: Optional[int] = None
+        self._printer: Optional[KlipperPrinter] = None
+        self._settings_task: Optional[asyncio.Task] = None
+
+    def _on_update(self, changes: dict, status: dict) -> None:
+        self.health.last_update = time.monotonic()
+        layer = self.layers.update(changes, status)
+        if layer is not None and self.config["capture_mode"] == "layer":
+            self._request_layer(layer)
+        state = changes.get("print_stats", {}).get("state")
+        if state is None:
+            return
+        self.health.print_state = state
+        if state == "printing":
+            if self.gcode_cache is not None and not self.printing.is_set():
+                self._settings_task = asyncio.create_task(self.resolve_settings())
+            self.printing.set()
+        else:
+            self.printing.clear()
+
+    def _on_gcode_response(self, params: list) -> None:
+        for line in params:
+            layer = parse_capture_macro(str(line))
+            if layer is not None:
+                self._request_layer(layer)
+
+    def _request_layer(self, layer: int) -> None:
+        # Only the latest layer is kept if capturing falls behind
+        self._requested_layer = layer
+        self._layer_requested.set()
+
+    async def run(self) -> None:
+        """Runs the watcher and the capture loop until cancelled."""
+        # A closed client cannot be restarted, so every run gets a new one
+        self.client = MoonrakerWebSocket(self.config["url"])
+        self.client.add_listener(self._on_update)
+        if self.config["capture_mode"] == "macro":
+            self.client.add_notification_listener(
+                "notify_gcode_response", self._on_gcode_response
+            )
+        if self.gcode_cache is not None:
+            self.gcode_cache.watch(self.client, self.config["url"])
+        self.printing.clear()
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(self.client.run())
+                tasks.create_task(self._track_connection())
+                if self.config["capture_mode"] == "interval":
+                    tasks.create_task(self.capture_loop())
+                else:
+                    tasks.create_task(self.layer_capture_loop())
+        finally:
+            await self.client.close()
+
+    async def _track_connection(self) -> None:
+        while True:
+            await self.client.connected.wait()
+            self.health.connection = "online"
+            while self.client.connected.is_set():
+                await asyncio.sleep(1.0)
+            self.health.connection = "offline"
+            self.printing.clear()
+
+    async def resolve_settings(self) -> None:
+        """Looks up the slicer settings and part IDs of the current print."""
+        self.slicer_settings_id = None
+        self.parts_id = None
+        filename = self.client.status.get("print_stats", {}).get("filename")
+        loop = asyncio.get_running_loop()
+        try:
+            entry = await loop.run_in_executor(
+                self.executor, self._lookup_settings, filename
+            )
+            self.slicer_settings_id = entry["slicer_settings_id"]
+        except Exception as e:
+            self.health.record_error(e)
+            print(f"[{self.name}] Error resolving slicer settings: {e}")
+        if not filename:
+            return
+        try:
+            self.parts_id = await loop.run_in_executor(
+                self.executor, self._lookup_part, filename
+            )
+        except Exception as e:
+            self.health.record_error(e)
+            print(f"[{self.name}] Error resolving part: {e}")
+
+    def _lookup_settings(self, filename: Optional[str]) -> dict:
+        if self._printer is None:
+            self._printer = KlipperPrinter(self.config["url"])
+        return self.gcode_cache.lookup(self._printer, filename or None)
+
+    def _lookup_part(self, filename: str) -> Optional[int]:
+        # database_src is on the path once gcode_cache is imported
+        from crud import resolve_part_id
+
+        with self.gcode_cache.session_factory() as session:
+            return resolve_part_id(session, KlipperPrinter.part_name(filename))
+
+    async def snapshot(self) -> bytes:
+        """Fetches one JPEG snapshot in the shared thread pool."""
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            self.executor,
+            lambda: self.session.get(
+                self.config["snapshot_url"], timeout=self.config["snapshot_timeout"]
+            ),
+        )
+        response.raise_for_status()
+        return response.content
+
+    async def capture(self, layer: Optional[int]) -> None:
+        """Captures one frame tagged with ``layer`` and hands it to the sink."""
+        try:
+            image = await self.snapshot()
+            await self.sink(
+                Frame(self.name, image, layer, self.slicer_settings_id, self.parts_id)
+            )
+            self.health.frames += 1
+        except Exception as e:
+            self.health.record_error(e)
+            print(f"[{self.name}] Error capturing frame: {e}")
+
+    async def capture_loop(self) -> None:
+        """Captures a frame every ``capture_interval`` seconds while printing."""
+        interval = float(self.config["capture_interval"])
+        while True:
+            await self.printing.wait()
+            started = time.monotonic()
+            await self.capture(self.layers.layer or None)
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def wait_in_position(self) -> bool:
+        """Waits until the toolhead reaches ``capture_position`` or times out."""
+        target = self.config["capture_position"]
+        tolerance = float(self.config["position_tolerance"])
+        deadline = time.monotonic() + float(self.config["position_timeout"])
+        while not in_position(self.client.status, target, tolerance):
+            if time.monotonic() > deadline:
+                return False
+            # toolhead.position is pushed by Moonraker, no request is sent here
+            await asyncio.sleep(0.05)
+        return True
+
+    async def layer_capture_loop(self) -> None:
+        """Captures ``frames_per_layer`` frames for every requested layer."""
+        frames = int(self.config["frames_per_layer"])
+        spacing = float(self.config["frame_spacing"])
+        while True:
+            await self._layer_requested.wait()
+            self._layer_requested.clear()
+            layer = self._requested_layer
+            if not self.printing.is_set():
+                continue
+            # The capture macro parks the toolhead itself
+            parked = self.config["capture_mode"] == "macro"
+            if self.config["capture_position"] and not parked:
+                if not await self.wait_in_position():
+                    print(f"[{self.name}] Toolhead not in position on layer {layer}")
+            for i in range(frames):
+                if i:
+                    await asyncio.sleep(spacing)
+                await self.capture(layer)
+
+
+async def supervise(worker: PrinterWorker, max_backoff: float = 60.0) -> None:
+    """Restarts a printer worker with exponential backoff whenever it fails."""
+    backoff = 1.0
+    while True:
+        started = time.monotonic()
+        try:
+            await worker.run()
+        except Exception as e:
+            worker.health.record_error(e)
+            print(f"[{worker.name}] Worker failed: {e}")
+        worker.health.connection = "offline"
+        worker.health.restarts += 1
+        # Reset the backoff after a worker ran fine for a while
+        if time.monotonic() - started > max_backoff:
+            backoff = 1.0
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, max_backoff)
+
+
+async def report_health(
+    workers: list, interval: float, metrics: Optional[Callable[[], dict]] = None
+) -> None:
+    """Prints a one-line health summary per printer every ``interval`` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        for worker in workers:
+            print(worker.health.as_dict())
+        if metrics is not None:
+            print({"sink": metrics()})
+
+
+def directory_sink(output_dir: str) -> Callable[[Frame], Awaitable[None]]:
+    """Returns a frame sink that writes JPEG files per printer."""
+
+    def write(frame: Frame) -> None:
+        directory = os.path.join(output_dir, frame.printer)
+        os.makedirs(directory, exist_ok=True)
+        name = frame.timestamp.strftime("%Y%m%dT%H%M%S_%f")
+        if frame.layer is not None:
+            name = f"{name}_layer{frame.layer:04d}"
+        with open(os.path.join(directory, f"{name}.jpg"), "wb") as f:
+            f.write(frame.image)
+
+    async def sink(frame: Frame) -> None:
+        await asyncio.to_thread(write, frame)
+
+    return sink
+
+
+async def run_supervisor(
+    printers: list,
+    sink: Callable[[Frame], Awaitable[None]],
+    capture_workers: int = 8,
+    health_interval: float = 60.0,
+    metrics: Optional[Callable[[], dict]] = None,
+    gcode_cache=None,
+) -> None:
+    """
+    Runs one worker per printer until cancelled.
+
+    Args:
+        printers: Printer configs from ``load_config``.
+        sink: Coroutine function storing a captured Frame.
+        capture_workers: Size of the snapshot thread pool shared by all printers.
+        health_interval: Seconds between health reports, 0 disables them.
+        metrics: Returns the metrics of the sink for the health reports.
+        gcode_cache: GcodeParameterCache resolving the slicer settings of prints.
+    """
+    with ThreadPoolExecutor(
+        max_workers=capture_workers, thread_name_prefix="snapshot"
+    ) as executor:
+        workers = [
+            PrinterWorker(config, sink, executor, gcode_cache) for config in printers
+        ]
+        async with asyncio.TaskGroup() as tasks:
+            for worker in workers:
+                tasks.create_task(supervise(worker), name=worker.name)
+            if health_interval:
+                tasks.create_task(report_health(workers, health_interval, metrics))
+
+
+async def _main(args) -> None:
+    printers = load_config(args.config)
+    print(f"Supervising {len(printers)} printers")
+    main_task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, main_task.cancel)
+        except NotImplementedError:
+            # Windows: KeyboardInterrupt cancels the main task instead
+            pass
+
+    pipeline = None
+    if args.sink == "database":
+        from capture_pipeline import CapturePipeline
+        from blob_store import get_blob_store
+        from frame_spool import FrameSpool
+
+        spool = None
+        if args.spool_dir:
+            spool = FrameSpool(args.spool_dir, max_bytes=args.spool_max_mb * 1024**2)
+            print(f"{spool.pending()} frames pending in the spool")
+        pipeline = CapturePipeline(
+            maxsize=args.queue_size,
+            policy=args.queue_policy,
+            encode_workers=args.encode_workers,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_ms / 1000,
+            store=get_blob_store(),
+            spool=spool,
+        )
+        pipeline.start()
+        sink, metrics = pipeline.put, pipeline.metrics
+    else:
+        sink, metrics = directory_sink(args.output_dir), None
+
+    gcode_cache = None
+    if args.gcode_cache:
+        from gcode_cache import GcodeParameterCache
+        from database import Session
+
+        gcode_cache = GcodeParameterCache(Session)
+
+    try:
+        await run_supervisor(
+            printers,
+            sink,
+            capture_workers=args.capture_workers,
+            health_interval=args.health_interval,
+            metrics=metrics,
+            gcode_cache=gcode_cache,
+        )
+    except asyncio.CancelledError:
+        print("Supervisor stopped")
+    finally:
+        if pipeline is not None:
+            # Write the frames that are still queued
+            await pipeline.close()
+            print(pipeline.metrics())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture frames from many printers.")
+    parser.add_argument("config", help="YAML file with the printers")
+    parser.add_argument(
+        "--sink", choices=("directory", "database"), default="directory"
+    )
+    parser.add_argument("--output-dir", default="frames")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument(
+        "--queue-policy",
+        choices=("block", "drop_newest", "drop_oldest"),
+        default="drop_oldest",
+    )
+    parser.add_argument("--encode-workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--flush-ms", type=float, default=500)
+    parser.add_argument(
+        "--spool-dir", default=None, help="Spool frames on disk before the database"
+    )
+    parser.add_argument("--spool-max-mb", type=int, default=10240)
+    parser.add_argument("--capture-workers", type=int, default=8)
+    parser.add_argument("--health-interval", type=float, default=60.0)
+    parser.add_argument(
+        "--gcode-cache",
+        action="store_true",
+        help="Tag frames with the slicer settings of the print (needs the database)",
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
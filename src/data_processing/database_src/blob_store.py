@@ -0,0 +1,227 @@
+"""
+Content-addressed blob storage for captured frames.
+
+Blobs are keyed by the SHA-256 of their content, so identical frames are
+stored once. ``image_data`` rows keep the key in ``image_sha256`` and leave
+``image`` empty once their blob has been moved to the store.
+
+Backends:
+    - ``LocalBlobStore``: files below a root directory.
+    - ``S3BlobStore``: any S3-compatible object store (AWS S3, MinIO, ...).
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+CHUNK_SIZE = 64 * 1024
+# Root of the local backend if BLOB_STORE_PATH is not set, shared with the API
+# settings. Absolute, so the API and the scripts use the same directory
+# whatever their working directory is.
+DEFAULT_BLOB_STORE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../../data/blobs")
+)
+
+
+def content_key(data: bytes) -> str:
+    """Returns the content address (hex SHA-256) of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Interface of the blob store backends."""
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores a blob unless a blob with the same content already exists.
+
+        Args:
+            data: Blob content.
+
+        Returns:
+            str: Content key of the blob.
+        """
+        key = content_key(data)
+        if not self.exists(key):
+            self._write(key, data)
+        return key
+
+    def get(self, key: str) -> bytes:
+        """Returns the content of a blob."""
+        return b"".join(self.iter_chunks(key))
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Streams the content of a blob in chunks."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """Checks whether a blob is stored."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Deletes a blob; missing blobs are ignored."""
+        raise NotImplementedError
+
+    def _write(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blob store on the local filesystem.
+
+    Blobs are sharded into two directory levels (``ab/cd/abcd...``) to keep
+    directories small.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """Returns the file path of a blob."""
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, key: str, data: bytes) -> None:
+        directory = os.path.dirname(self.path(key))
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see partial blobs
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class S3BlobStore(BlobStore):
+    """Blob store on an S3-compatible object store, e.g. MinIO."""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        prefix: str = "frames/",
+    ):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def object_key(self, key: str) -> str:
+        """Returns the object key of a blob."""
+        return f"{self.prefix}{key[:2]}/{key}"
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        response = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        yield from response["Body"].iter_chunks(chunk_size)
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def _write(self, key: str, data: bytes) -> None:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            Body=data,
+            ContentType="image/jpeg",
+        )
+
+
+def create_blob_store(
+    backend: str,
+    path: Optional[str] = None,
+    bucket: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    prefix: str = "frames/",
+) -> Optional[BlobStore]:
+    """
+    Creates a blob store backend.
+
+    Args:
+        backend: 'database' (blobs stay in PostgreSQL), 'local' or 's3'.
+        path: Root directory of the local backend.
+        bucket: Bucket of the S3 backend.
+        endpoint_url: Endpoint of the S3 backend, e.g. a MinIO server.
+        prefix: Object key prefix of the S3 backend.
+
+    Returns:
+        The blob store, or None for the 'database' backend.
+
+    Raises:
+        ValueError: If the backend is unknown or misconfigured.
+    """
+    if backend == "database":
+        return None
+    if backend == "local":
+        if not path:
+            raise ValueError("The local blob store needs a path")
+        return LocalBlobStore(path)
+    if backend == "s3":
+        if not bucket:
+            raise ValueError("The S3 blob store needs a bucket")
+        return S3BlobStore(bucket, endpoint_url=endpoint_url or None, prefix=prefix)
+    raise ValueError(f"Unknown blob store backend: {backend}")
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    """Creates the blob store configured by the BLOB_STORE_* environment variables."""
+    return create_blob_store(
+        os.getenv("BLOB_STORE_BACKEND", "database"),
+        path=os.getenv("BLOB_STORE_PATH") or DEFAULT_BLOB_STORE_PATH,
+        bucket=os.getenv("BLOB_STORE_BUCKET"),
+        endpoint_url=os.getenv("BLOB_STORE_ENDPOINT_URL"),
+        prefix=os.getenv("BLOB_STORE_PREFIX", "frames/"),
+    )
+
+
+def load_image(row, store: Optional[BlobStore]) -> Optional[bytes]:
+    """
+    Returns the JPEG of an image_data row, wherever it is stored.
+
+    Args:
+        row: Row or ImageData object with ``image`` and ``image_sha256``.
+        store: Blob store holding migrated blobs.
+
+    Returns:
+        The image bytes, or None if the row has no image.
+    """
+    if row.image is not None:
+        return row.image
+    if row.image_sha256 and store is not None:
+        return store.get(row.image_sha256)
+    return None
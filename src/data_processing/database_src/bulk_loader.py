@@ -0,0 +1,250 @@
+"""
+Bulk loader for slicer settings, parts and image labels.
+
+Input files (CSV or Parquet) are read in chunks. Every chunk is validated
+against the column types of the ORM model, streamed into a temporary staging
+table with ``COPY FROM STDIN`` and then merged into the target table on its
+natural key in one statement:
+
+    - ``slicer_settings``: fingerprint of the settings; existing rows are kept.
+    - ``parts``: name; the url (and general_image, if given) of existing parts
+      are updated.
+    - ``labels``: image_data id; only the label column is updated.
+
+Columns that are not part of the target are ignored.
+
+Usage:
+    python bulk_loader.py slicer_settings data/slicer_settings.csv
+    python bulk_loader.py labels data/labels.parquet --chunk-size 100000
+"""
+
+import argparse
+import base64
+import io
+import time
+
+import pandas as pd
+
+from database import db
+from models import ImageData, Parts, SlicerSettings
+from crud import SLICER_SETTINGS_COLUMNS, slicer_settings_fingerprint
+
+# target: (model, input columns, required input columns)
+TARGETS = {
+    "slicer_settings": (
+        SlicerSettings,
+        SLICER_SETTINGS_COLUMNS,
+        SLICER_SETTINGS_COLUMNS,
+    ),
+    "parts": (Parts, ("name", "url", "general_image"), ("name", "url")),
+    "labels": (ImageData, ("id", "label"), ("id", "label")),
+}
+
+# general_image of new parts when the input has no images
+EMPTY_IMAGE = "'\\x'::bytea"
+
+MERGE_SQL = {
+    "slicer_settings": (
+        "INSERT INTO slicer_settings ({columns}, fingerprint) "
+        "SELECT DISTINCT ON (fingerprint) {columns}, fingerprint FROM staging "
+        "ON CONFLICT (fingerprint) DO NOTHING"
+    ),
+    "labels": (
+        "UPDATE image_data SET label = staging.label FROM staging "
+        "WHERE image_data.id = staging.id"
+    ),
+}
+
+
+def read_chunks(path: str, chunk_size: int):
+    """
+    Reads a CSV or Parquet file in chunks.
+
+    Args:
+        path: Path of a .csv or .parquet file.
+        chunk_size: Number of rows per chunk.
+
+    Yields:
+        pandas.DataFrame: The next chunk.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _to_bytea_hex(value):
+    # Binary columns are given base64 encoded and copied in bytea hex format
+    try:
+        return "\\x" + base64.b64decode(value, validate=True).hex()
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_chunk(df: pd.DataFrame, target: str) -> tuple:
+    """
+    Converts a chunk to the column types of the target model.
+
+    Args:
+        df: Input chunk.
+        target: Key of ``TARGETS``.
+
+    Returns:
+        tuple: (DataFrame with the valid rows and the target columns,
+        index labels of the rejected rows)
+
+    Raises:
+        ValueError: If a required column is missing.
+    """
+    model, columns, required = TARGETS[target]
+    missing = [name for name in required if name not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns for '{target}': {', '.join(missing)}")
+
+    valid = pd.Series(True, index=df.index)
+    result = pd.DataFrame(index=df.index)
+    for name in columns:
+        if name not in df.columns:
+            continue
+        column = model.__table__.columns[name]
+        python_type = column.type.python_type
+        values = df[name]
+        if python_type is int:
+            converted = pd.to_numeric(values, errors="coerce")
+            valid &= converted.isna() == values.isna()
+            valid &= converted.isna() | (converted % 1 == 0)
+            converted = converted.where(converted % 1 == 0).astype("Int64")
+        elif python_type is float:
+            converted = pd.to_numeric(values, errors="coerce")
+            valid &= converted.isna() == values.isna()
+        elif python_type is bytes:
+            converted = values.map(_to_bytea_hex)
+        else:
+            converted = values.where(values.isna(), values.astype(str).str.strip())
+        if not column.nullable or name in required:
+            valid &= converted.notna()
+        result[name] = converted
+
+    return result[valid], list(df.index[~valid])
+
+
+def copy_to_staging(cursor, df: pd.DataFrame) -> None:
+    """Streams a DataFrame into the staging table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY staging ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+
+def merge_staging(cursor, target: str, columns) -> int:
+    """
+    Merges the staging table into the target table on its natural key.
+
+    Returns:
+        int: Number of inserted or updated rows.
+    """
+    if target == "parts":
+        # Only the given columns are updated, so the reference images of
+        # existing parts are kept if the input has none
+        updates = ", ".join(
+            f"{name} = staging.{name}" for name in columns if name != "name"
+        )
+        cursor.execute(
+            f"UPDATE parts SET {updates} FROM staging WHERE parts.name = staging.name"
+        )
+        updated = cursor.rowcount
+        values = list(columns)
+        if "general_image" not in columns:
+            columns, values = [*columns, "general_image"], [*values, EMPTY_IMAGE]
+        cursor.execute(
+            f"INSERT INTO parts ({', '.join(columns)}) "
+            f"SELECT DISTINCT ON (name) {', '.join(values)} FROM staging "
+            "WHERE NOT EXISTS (SELECT 1 FROM parts WHERE parts.name = staging.name)"
+        )
+        return updated + cursor.rowcount
+
+    cursor.execute(MERGE_SQL[target].format(columns=", ".join(columns)))
+    return cursor.rowcount
+
+
+def load_file(path: str, target: str, chunk_size: int = 50000) -> dict:
+    """
+    Loads a CSV or Parquet file into the target table.
+
+    Args:
+        path: Path of a .csv or .parquet file.
+        target: 'slicer_settings', 'parts' or 'labels'.
+        chunk_size: Number of rows per chunk and transaction.
+
+    Returns:
+        dict: Counts of read, rejected and merged rows and the throughput.
+    """
+    model = TARGETS[target][0]
+    stats = {"read": 0, "rejected": 0, "merged": 0}
+    start_time = time.time()
+
+    for chunk in read_chunks(path, chunk_size):
+        df, rejected = validate_chunk(chunk, target)
+        if rejected:
+            print(f"Rejected {len(rejected)} invalid rows, e.g. rows {rejected[:5]}")
+        if target == "slicer_settings":
+            df["fingerprint"] = [
+                slicer_settings_fingerprint(row)
+                for row in df.to_dict(orient="records")
+            ]
+
+        connection = db.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # Only the input columns, without NOT NULL constraints or defaults,
+            # so missing columns are not rejected or drawn from the id sequence
+            cursor.execute(
+                "CREATE TEMP TABLE staging ON COMMIT DROP AS "
+                f"SELECT {', '.join(df.columns)} FROM {model.__tablename__} "
+                "WITH NO DATA"
+            )
+            copy_to_staging(cursor, df)
+            columns = [name for name in df.columns if name != "fingerprint"]
+            merged = merge_staging(cursor, target, columns)
+            connection.commit()
+        finally:
+            connection.close()
+
+        stats["read"] += len(chunk)
+        stats["rejected"] += len(rejected)
+        stats["merged"] += merged
+        elapsed = time.time() - start_time
+        print(
+            f"Loaded {stats['read']} rows into '{target}' "
+            f"({stats['read'] / elapsed:.0f} rows/s)"
+        )
+
+    elapsed = time.time() - start_time
+    stats["rows_per_second"] = stats["read"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Bulk load slicer settings, parts or image labels."
+    )
+    parser.add_argument("target", choices=tuple(TARGETS))
+    parser.add_argument("path", help="CSV or Parquet file")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    stats = load_file(args.path, args.target, args.chunk_size)
+    print(
+        f"Read {stats['read']} rows, rejected {stats['rejected']}, "
+        f"merged {stats['merged']} ({stats['rows_per_second']:.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,183 @@
+import hashlib
+import json
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
-from models import ImageData
+from models import ImageData, Parts, SlicerSettings
+from cache import TTLCache
+
+# Read-through caches for the capture pipeline, which resolves the same part
+# names and slicer profiles for every print
+part_id_cache = TTLCache()
+slicer_settings_id_cache = TTLCache()
+
+# Image data columns without the blob; the size of blobs that are still stored
+# in the database is computed there
+IMAGE_METADATA_COLUMNS = (
+    ImageData.id,
+    ImageData.timestamp,
+    ImageData.slicer_settings_id,
+    ImageData.parts_id,
+    ImageData.label,
+    ImageData.layer,
+    sa.func.coalesce(
+        ImageData.image_size, sa.func.octet_length(ImageData.image)
+    ).label("image_size"),
+)
+
+# Columns that identify a slicer profile, i.e. all columns except id and fingerprint
+SLICER_SETTINGS_COLUMNS = tuple(
+    column.name
+    for column in SlicerSettings.__table__.columns
+    if column.name not in ("id", "fingerprint")
+)
+
+FILTERABLE_IMAGE_DATA_COLUMNS = (
+    "id",
+    "timestamp",
+    "slicer_settings_id",
+    "parts_id",
+    "label",
+    "layer",
+)
+
+
+def filter_image_data(
+    query,
+    slicer_settings_id=None,
+    parts_id=None,
+    label=None,
+    layer=None,
+    start_time=None,
+    end_time=None,
+):
+    """
+    Applies the optional image data filters used by the API and export tools.
+
+    Args:
+        query: SQLAlchemy query or select statement on ImageData columns.
+        slicer_settings_id: Filter by slicer settings ID.
+        parts_id: Filter by parts ID.
+        label: Filter by label.
+        layer: Filter by layer.
+        start_time: Only include images captured at or after this time.
+        end_time: Only include images captured before this time.
+
+    Returns:
+        The filtered query.
+    """
+    if slicer_settings_id is not None:
+        query = query.filter(ImageData.slicer_settings_id == slicer_settings_id)
+    if parts_id is not None:
+        query = query.filter(ImageData.parts_id == parts_id)
+    if label is not None:
+        query = query.filter(ImageData.label == label)
+    if layer is not None:
+        query = query.filter(ImageData.layer == layer)
+    if start_time is not None:
+        query = query.filter(ImageData.timestamp >= start_time)
+    if end_time is not None:
+        query = query.filter(ImageData.timestamp < end_time)
+    return query
+
+
+def select_image_data_by_column_value(column_name, value, limit=None, after_id=None):
+    """
+    Builds the select statement behind ``get_image_data_by_column_value``.
+
+    Args:
+        column_name: The name of the column to filter by (e.g., "layer", "slicer_settings_id").
+        value: The value to filter for.
+        limit: Maximum number of rows to return (None for all rows).
+        after_id: Only return rows with an ID greater than this cursor.
+
+    Returns:
+        Select statement over ``IMAGE_METADATA_COLUMNS`` ordered by ID.
+
+    Raises:
+        ValueError: If the column does not exist or cannot be filtered on.
+    """
+    if column_name not in FILTERABLE_IMAGE_DATA_COLUMNS:
+        raise ValueError(f"Column '{column_name}' cannot be used to filter image data")
+
+    stmt = sa.select(*IMAGE_METADATA_COLUMNS).where(
+        getattr(ImageData, column_name) == value
+    )
+    if after_id is not None:
+        stmt = stmt.where(ImageData.id > after_id)
+    stmt = stmt.order_by(ImageData.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
 
 
-def get_image_data_by_column_value(session, column_name, value):
+def get_image_data_by_column_value(
+    session, column_name, value, limit=None, after_id=None, chunk_size=1000
+):
     """
-    Retrieves all image data rows where the specified column matches the given value.
+    Streams the image data rows where the specified column matches the given value.
+
+    The image blob is not loaded; each row carries its size in bytes as
+    ``image_size`` instead. Rows are returned in ID order through a server-side
+    cursor, so callers can page through large results with ``after_id``.
 
     Args:
         session: SQLAlchemy session object.
         column_name: The name of the column to filter by (e.g., "layer", "slicer_settings_id").
         value: The value to filter for.
+        limit: Maximum number of rows to return (None for all rows).
+        after_id: Only return rows with an ID greater than this cursor.
+        chunk_size: Number of rows fetched from the cursor per round trip.
+
+    Returns:
+        Iterator of rows with the columns of ``IMAGE_METADATA_COLUMNS``.
+
+    Raises:
+        ValueError: If the column does not exist or cannot be filtered on.
+    """
+    stmt = select_image_data_by_column_value(column_name, value, limit, after_id)
+    return session.execute(stmt.execution_options(yield_per=chunk_size))
+
+
+def update_labels_by_id(assignments):
+    """
+    Builds one set-based UPDATE assigning new labels to images by ID.
+
+    The (id, label) pairs are joined as a VALUES list, so the whole batch is
+    applied by a single statement without loading any rows.
+
+    Args:
+        assignments: Sequence of (id, label) pairs.
 
     Returns:
-        list: List of Image_data objects matching the criteria.
+        Update statement on image_data.
     """
-    try:
-        # Check if the column exists in the Image_data model
-        if not hasattr(ImageData, column_name):
-            print(f"Error: Column '{column_name}' does not exist in Image_data model")
-            return []
+    new_labels = sa.values(
+        sa.column("id", sa.Integer), sa.column("label", sa.Integer), name="new_labels"
+    ).data([tuple(assignment) for assignment in assignments])
+    return (
+        sa.update(ImageData)
+        .where(ImageData.id == new_labels.c.id)
+        .values(label=new_labels.c.label)
+        .execution_options(synchronize_session=False)
+    )
 
-        # Build and execute the query
-        query = session.query(ImageData).filter(
-            getattr(ImageData, column_name) == value
-        )
-        results = query.all()
 
-        return results
+def update_labels_by_filter(label, **filters):
+    """
+    Builds one UPDATE setting the label of all images matching the filters.
 
-    except Exception as e:
-        print(f"Error querying image data by {column_name}: {e}")
-        return []
+    Args:
+        label: New label.
+        **filters: Keyword arguments of ``filter_image_data``.
+
+    Returns:
+        Update statement on image_data.
+    """
+    return filter_image_data(
+        sa.update(ImageData).values(label=label), **filters
+    ).execution_options(synchronize_session=False)
 
 
 def delete_image_data_by_id(session, image_id):
@@ -44,10 +191,134 @@ def delete_image_data_by_id(session, image_id):
     Returns:
         True if the row was deleted, False if not found.
     """
-    row_to_delete = session.query(ImageData).filter_by(id=image_id).first()
-    if row_to_delete:
-        session.delete(row_to_delete)
-        session.commit()
-        return True
-    else:
-        return False
+    # Delete by primary key without loading the row and its image blob
+    result = session.execute(
+        sa.delete(ImageData)
+        .where(ImageData.id == image_id)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount > 0
+
+
+def normalize_slicer_settings_value(name, value):
+    """
+    Converts a slicer settings value to the type of its column.
+
+    Floats are rounded to 6 decimals and integers to the nearest integer, so
+    values that only differ by rounding noise compare equal.
+
+    Args:
+        name: Column of ``SLICER_SETTINGS_COLUMNS``.
+        value: Value as number or string.
+
+    Raises:
+        ValueError: If the value cannot be converted to the column type.
+    """
+    python_type = SlicerSettings.__table__.columns[name].type.python_type
+    if python_type is float:
+        return round(float(value), 6)
+    if python_type is int:
+        return int(round(float(value)))
+    return str(value).strip()
+
+
+def slicer_settings_fingerprint(values):
+    """
+    Computes the canonical fingerprint of a set of slicer settings.
+
+    Values are normalised to the column types before hashing, so ``"15"``, ``15``
+    and ``15.0`` for an integer column, or floats that only differ by rounding
+    noise, give the same fingerprint.
+
+    Args:
+        values: Mapping with a value for every column of ``SLICER_SETTINGS_COLUMNS``.
+
+    Returns:
+        str: Hex SHA-256 of the normalised settings.
+
+    Raises:
+        KeyError: If a column is missing.
+        ValueError: If a value cannot be converted to its column type.
+    """
+    normalised = {
+        name: normalize_slicer_settings_value(name, values[name])
+        for name in SLICER_SETTINGS_COLUMNS
+    }
+    canonical = json.dumps(normalised, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def insert_slicer_settings_if_missing(values):
+    """
+    Builds an ``INSERT ... ON CONFLICT DO NOTHING RETURNING id`` for slicer settings.
+
+    The statement returns the new ID, or no row if settings with the same
+    fingerprint already exist.
+
+    Args:
+        values: Mapping with a value for every column of ``SLICER_SETTINGS_COLUMNS``.
+
+    Returns:
+        tuple: (insert statement, fingerprint)
+    """
+    fingerprint = slicer_settings_fingerprint(values)
+    row = {name: values[name] for name in SLICER_SETTINGS_COLUMNS}
+    stmt = (
+        postgresql.insert(SlicerSettings)
+        .values(**row, fingerprint=fingerprint)
+        .on_conflict_do_nothing(index_elements=[SlicerSettings.fingerprint])
+        .returning(SlicerSettings.id)
+    )
+    return stmt, fingerprint
+
+
+def get_or_create_slicer_settings(session, values):
+    """
+    Returns the ID of matching slicer settings, inserting them if they are new.
+
+    The insert is atomic, so concurrent capture processes starting a print
+    with the same profile end up with the same row.
+
+    Args:
+        session: SQLAlchemy session object.
+        values: Mapping with a value for every column of ``SLICER_SETTINGS_COLUMNS``.
+
+    Returns:
+        tuple: (slicer settings ID, True if the row was created)
+    """
+    stmt, fingerprint = insert_slicer_settings_if_missing(values)
+    setting_id = slicer_settings_id_cache.get(fingerprint)
+    if setting_id is not None:
+        return setting_id, False
+
+    setting_id = session.execute(stmt).scalar()
+    session.commit()
+    created = setting_id is not None
+    if not created:
+        setting_id = session.execute(
+            sa.select(SlicerSettings.id).where(
+                SlicerSettings.fingerprint == fingerprint
+            )
+        ).scalar_one()
+    slicer_settings_id_cache.set(fingerprint, setting_id)
+    return setting_id, created
+
+
+def resolve_part_id(session, name):
+    """
+    Returns the ID of the part with the given name, using the part ID cache.
+
+    Args:
+        session: SQLAlchemy session object.
+        name: Name of the part.
+
+    Returns:
+        The part ID, or None if no part has this name.
+    """
+    return part_id_cache.get_or_load(
+        name,
+        lambda: session.execute(
+            sa.select(Parts.id).where(Parts.name == name).order_by(Parts.id).limit(1)
+        ).scalar(),
+    )
@@ -11,13 +11,33 @@ db_user = os.getenv("DB_USER", "postgres")  # Default if not found
 db_password = os.getenv("DB_PASSWORD", "")  # Default if not found
 db_host = os.getenv("DB_HOST", "localhost")  # Default if not found
 db_port = os.getenv("DB_PORT", "5431")  # Default if not found
+db_name = os.getenv("DB_NAME", "")  # Empty for the server's default database
+
+# Connection pool settings
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+db_pool_timeout = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+db_pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+db_pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
 
 # Construct the connection string
-db_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}"
+db_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+# The same database for the asyncpg engine of the API
+async_db_url = db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
 
 # Create SQLAlchemy engine and session factory
-engine = sa.create_engine(db_url)
+engine = sa.create_engine(
+    db_url,
+    pool_size=db_pool_size,
+    max_overflow=db_max_overflow,
+    pool_timeout=db_pool_timeout,
+    pool_recycle=db_pool_recycle,
+    pool_pre_ping=db_pool_pre_ping,
+)
 Session = sessionmaker(bind=engine)
 
+# Alias used by the schema management scripts
+db = engine
+
 # Create the base class for declarative models
 Base = declarative_base()
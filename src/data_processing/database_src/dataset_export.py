@@ -0,0 +1,239 @@
+"""
+Streaming export of labelled frames as WebDataset-style tar shards.
+
+Every frame is written as two tar members sharing the same key, e.g.
+``000086261.jpg`` and ``000086261.json``. Rows are read from ``image_data``
+with a server-side cursor, so memory stays constant regardless of the
+number of exported frames.
+"""
+
+import argparse
+import io
+import json
+import os
+import tarfile
+import time
+
+import sqlalchemy as sa
+
+from database import Session
+from models import ImageData
+from crud import filter_image_data
+from blob_store import get_blob_store, load_image
+from dedup import dedup_rows
+
+# Columns needed to build a shard sample, in the order they are unpacked
+EXPORT_COLUMNS = (
+    ImageData.id,
+    ImageData.timestamp,
+    ImageData.slicer_settings_id,
+    ImageData.parts_id,
+    ImageData.label,
+    ImageData.layer,
+    ImageData.image,
+    ImageData.image_sha256,
+    ImageData.phash,
+)
+
+
+def select_export_rows(**filters):
+    """
+    Builds the select statement for the rows to export, in ID order.
+
+    Args:
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Returns:
+        Select statement over ``EXPORT_COLUMNS``.
+    """
+    stmt = sa.select(*EXPORT_COLUMNS)
+    return filter_image_data(stmt, **filters).order_by(ImageData.id)
+
+
+def iter_export_rows(session, chunk_size=500, dedup_distance=None, **filters):
+    """
+    Streams the rows to export in ID order using a server-side cursor.
+
+    Args:
+        session: SQLAlchemy session object.
+        chunk_size: Number of rows fetched from the cursor per round trip.
+        dedup_distance: If set, skip frames within this Hamming distance of the
+            last exported frame of the same part (see ``dedup.dedup_rows``).
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Yields:
+        Row tuples with the columns of ``EXPORT_COLUMNS``.
+    """
+    stmt = select_export_rows(**filters).execution_options(yield_per=chunk_size)
+    rows = session.execute(stmt)
+    if dedup_distance is not None:
+        rows = dedup_rows(rows, dedup_distance)
+    yield from rows
+
+
+def frame_members(row, image):
+    """
+    Builds the tar members (name, bytes, mtime) for one exported frame.
+
+    Args:
+        row: Row with the columns of ``EXPORT_COLUMNS``.
+        image: JPEG bytes of the frame, loaded with ``blob_store.load_image``.
+
+    Returns:
+        list: The JPEG member followed by its JSON metadata member.
+    """
+    key = f"{row.id:09d}"
+    metadata = {
+        "id": row.id,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "slicer_settings_id": row.slicer_settings_id,
+        "parts_id": row.parts_id,
+        "label": row.label,
+        "layer": row.layer,
+    }
+    mtime = row.timestamp.timestamp() if row.timestamp else time.time()
+    return [
+        (f"{key}.jpg", image or b"", mtime),
+        (f"{key}.json", json.dumps(metadata).encode("utf-8"), mtime),
+    ]
+
+
+def _add_member(tar, name, data, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(data))
+
+
+class TarStreamWriter:
+    """
+    Incrementally builds a tar stream and hands out the bytes written so far.
+
+    Used by the API to stream an export without buffering the whole archive.
+    """
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._tar = tarfile.open(fileobj=self._buffer, mode="w|")
+
+    def add(self, name, data, mtime):
+        """Adds a member and returns the tar bytes that are ready to be sent."""
+        _add_member(self._tar, name, data, mtime)
+        return self._drain()
+
+    def close(self):
+        """Finishes the archive and returns the remaining bytes."""
+        self._tar.close()
+        return self._drain()
+
+    def _drain(self):
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def iter_tar_stream(rows, store=None):
+    """
+    Encodes exported rows as a single tar byte stream.
+
+    Args:
+        rows: Iterable of rows with the columns of ``EXPORT_COLUMNS``.
+        store: Blob store holding migrated blobs.
+
+    Yields:
+        bytes: Consecutive chunks of the tar archive.
+    """
+    writer = TarStreamWriter()
+    for row in rows:
+        for name, data, mtime in frame_members(row, load_image(row, store)):
+            chunk = writer.add(name, data, mtime)
+            if chunk:
+                yield chunk
+    yield writer.close()
+
+
+def write_tar_shards(rows, output_dir, shard_size=10000, prefix="frames", store=None):
+    """
+    Writes exported rows into numbered tar shards on disk.
+
+    Args:
+        rows: Iterable of rows with the columns of ``EXPORT_COLUMNS``.
+        output_dir: Directory the shards are written to.
+        shard_size: Maximum number of frames per shard.
+        prefix: File name prefix of the shards.
+        store: Blob store holding migrated blobs.
+
+    Returns:
+        int: Number of exported frames.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tar = None
+    shard_index = 0
+    count = 0
+    start_time = time.time()
+    try:
+        for row in rows:
+            if count % shard_size == 0:
+                if tar is not None:
+                    tar.close()
+                shard_path = os.path.join(output_dir, f"{prefix}-{shard_index:06d}.tar")
+                tar = tarfile.open(shard_path, "w")
+                shard_index += 1
+            for name, data, mtime in frame_members(row, load_image(row, store)):
+                _add_member(tar, name, data, mtime)
+            count += 1
+            if count % shard_size == 0:
+                elapsed = time.time() - start_time
+                print(f"Exported {count} frames ({count / elapsed:.0f} frames/s)")
+    finally:
+        if tar is not None:
+            tar.close()
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export labelled frames from image_data as tar shards."
+    )
+    parser.add_argument("output_dir", help="Directory the tar shards are written to")
+    parser.add_argument("--label", type=int, default=None)
+    parser.add_argument("--parts-id", type=int, default=None)
+    parser.add_argument("--slicer-settings-id", type=int, default=None)
+    parser.add_argument("--layer", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--prefix", default="frames")
+    parser.add_argument(
+        "--dedup-distance",
+        type=int,
+        default=None,
+        help="Skip near-duplicate frames within this Hamming distance",
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with Session() as session:
+        rows = iter_export_rows(
+            session,
+            chunk_size=args.chunk_size,
+            dedup_distance=args.dedup_distance,
+            label=args.label,
+            parts_id=args.parts_id,
+            slicer_settings_id=args.slicer_settings_id,
+            layer=args.layer,
+        )
+        count = write_tar_shards(
+            rows,
+            args.output_dir,
+            shard_size=args.shard_size,
+            prefix=args.prefix,
+            store=get_blob_store(),
+        )
+
+    elapsed = time.time() - start_time
+    print(f"Exported {count} frames to '{args.output_dir}' in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
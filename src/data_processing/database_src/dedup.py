@@ -0,0 +1,386 @@
+"""
+Exact and perceptual hashes of captured frames for deduplication.
+
+``compute_hashes`` fills ``image_sha256`` (exact content key) and ``phash``
+(64-bit DCT perceptual hash) of all frames that have no ``phash`` yet. The
+images are hashed in a process pool and the hashes are written back with one
+bulk UPDATE per batch.
+
+Near-duplicates are frames whose perceptual hashes differ in at most a few
+bits (Hamming distance). They are found with multi-index hashing: the hash is
+stored in four indexed 16-bit segment columns as well, and two hashes within
+``d`` bits differ in at most ``d // 4`` bits in one segment, so the segment
+indexes narrow the candidates before the exact distance is computed.
+
+The capture loop stores consecutive frames of the same part, so
+near-duplicates are clustered in capture order per part.
+
+Usage:
+    python dedup.py hash --workers 8
+    python dedup.py clusters --parts-id 3 --max-distance 4
+"""
+
+import argparse
+import hashlib
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from PIL import Image
+
+from database import Session
+from models import PHASH_SEGMENT_BITS, PHASH_SEGMENTS, ImageData
+from crud import filter_image_data
+from blob_store import get_blob_store, load_image
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+DEFAULT_MAX_DISTANCE = 4
+# Beyond this many bits per segment the candidate lists are too long and too
+# unselective for the segment indexes, and the whole table is scanned
+MAX_SEGMENT_RADIUS = 2
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    # Orthonormal DCT-II basis, so the 2D DCT is two matrix products
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def perceptual_hash(image: bytes) -> int:
+    """
+    Computes the 64-bit DCT perceptual hash (pHash) of an image.
+
+    Args:
+        image: Encoded image, e.g. JPEG bytes.
+
+    Returns:
+        int: The hash as signed 64-bit integer, as stored in the BIGINT column.
+    """
+    with Image.open(io.BytesIO(image)) as img:
+        pixels = np.asarray(
+            img.convert("L").resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR),
+            dtype=np.float64,
+        )
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    value = int("".join("1" if bit else "0" for bit in bits), 2)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Returns the number of differing bits of two 64-bit hashes."""
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def hash_frame(item) -> tuple:
+    """
+    Hashes one frame; runs in the worker processes.
+
+    Args:
+        item: (id, image bytes) tuple.
+
+    Returns:
+        tuple: (id, SHA-256 hex digest, perceptual hash), the hash is None if
+        decoding failed.
+    """
+    image_id, image = item
+    try:
+        phash = perceptual_hash(image)
+    except (OSError, ValueError):
+        phash = None
+    return image_id, hashlib.sha256(image).hexdigest(), phash
+
+
+def compute_hashes(store=None, batch_size=500, workers=None, limit=None) -> int:
+    """
+    Computes the exact and perceptual hashes of all frames without ``phash``.
+
+    Args:
+        store: Blob store holding migrated blobs.
+        batch_size: Number of frames per batch and transaction.
+        workers: Number of hashing processes (default: number of CPUs).
+        limit: Stop after this many frames (None for all frames).
+
+    Returns:
+        int: Number of hashed frames.
+    """
+    hashed = 0
+    last_id = 0
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while limit is None or hashed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - hashed)
+            with Session() as session:
+                rows = session.execute(
+                    sa.select(ImageData.id, ImageData.image, ImageData.image_sha256)
+                    .where(ImageData.phash.is_(None), ImageData.id > last_id)
+                    .order_by(ImageData.id)
+                    .limit(size)
+                ).all()
+                if not rows:
+                    break
+
+                items = []
+                for row in rows:
+                    image = load_image(row, store)
+                    if image:
+                        items.append((row.id, image))
+                chunksize = max(1, len(items) // (workers * 4))
+                results = []
+                for image_id, sha256, phash in pool.map(
+                    hash_frame, items, chunksize=chunksize
+                ):
+                    if phash is None:
+                        # Left without phash, so the next run tries it again
+                        print(f"Skipping frame {image_id}: image cannot be decoded")
+                        continue
+                    results.append((image_id, sha256, phash))
+
+                if results:
+                    session.execute(
+                        sa.update(ImageData),
+                        [
+                            {"id": image_id, "image_sha256": sha256, "phash": phash}
+                            for image_id, sha256, phash in results
+                        ],
+                    )
+                    session.commit()
+
+            hashed += len(rows)
+            last_id = rows[-1].id
+            elapsed = time.time() - start_time
+            print(
+                f"Hashed {hashed} frames up to ID {last_id} "
+                f"({hashed / elapsed:.0f} frames/s)"
+            )
+
+    return hashed
+
+
+def segment_candidates(value: int, radius: int) -> list:
+    """Returns all 16-bit values within ``radius`` bits of a segment value."""
+    candidates = []
+    for bits in range(radius + 1):
+        for positions in itertools.combinations(range(PHASH_SEGMENT_BITS), bits):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            candidates.append(flipped)
+    return candidates
+
+
+def select_near_duplicates(phash: int, max_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Builds a query for the frames within ``max_distance`` bits of a hash.
+
+    Candidates are selected through the indexes of the segment columns
+    ``phash_0`` to ``phash_3`` (up to ``4 * MAX_SEGMENT_RADIUS + 3`` bits),
+    then ``bit_count`` (PostgreSQL 14+) on the XOR of the hashes gives the
+    exact distance.
+
+    Args:
+        phash: Perceptual hash to compare with.
+        max_distance: Maximum Hamming distance.
+
+    Returns:
+        Select statement with the frame ID and its ``distance``, nearest first.
+    """
+    distance = sa.func.bit_count(
+        sa.cast(ImageData.phash.op("#")(phash), postgresql.BIT(64))
+    ).label("distance")
+    stmt = (
+        sa.select(ImageData.id, distance)
+        .where(ImageData.phash.is_not(None), distance <= max_distance)
+        .order_by(distance, ImageData.id)
+    )
+    radius = max_distance // PHASH_SEGMENTS
+    if radius > MAX_SEGMENT_RADIUS:
+        return stmt
+    unsigned = phash & 0xFFFFFFFFFFFFFFFF
+    return stmt.where(
+        sa.or_(
+            *(
+                getattr(ImageData, f"phash_{segment}").in_(
+                    segment_candidates(
+                        (unsigned >> segment * PHASH_SEGMENT_BITS) & 0xFFFF, radius
+                    )
+                )
+                for segment in range(PHASH_SEGMENTS)
+            )
+        )
+    )
+
+
+def select_cluster_rows(**filters):
+    """
+    Builds the query for the hashed frames to cluster, in capture order per part.
+
+    Args:
+        **filters: Optional filters passed on to ``filter_image_data``.
+
+    Returns:
+        Select statement with id, parts_id and phash.
+    """
+    stmt = sa.select(ImageData.id, ImageData.parts_id, ImageData.phash).where(
+        ImageData.phash.is_not(None)
+    )
+    return filter_image_data(stmt, **filters).order_by(
+        ImageData.parts_id, ImageData.timestamp, ImageData.id
+    )
+
+
+class ClusterBuilder:
+    """
+    Groups consecutive near-duplicate frames of the same part.
+
+    A frame joins the current cluster if its hash is within ``max_distance``
+    bits of the first frame of the cluster, which is the representative.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._cluster = []
+        self._representative = None
+
+    def add(self, row) -> Optional[list]:
+        """
+        Adds a row with id, parts_id and phash in capture order per part.
+
+        Returns:
+            list: IDs of the cluster the row has closed, or None.
+        """
+        if (
+            self._cluster
+            and row.parts_id == self._representative.parts_id
+            and hamming_distance(row.phash, self._representative.phash)
+            <= self.max_distance
+        ):
+            self._cluster.append(row.id)
+            return None
+        closed = self.finish()
+        self._cluster = [row.id]
+        self._representative = row
+        return closed
+
+    def finish(self) -> Optional[list]:
+        """Returns the IDs of the open cluster, or None if there is none."""
+        cluster, self._cluster = self._cluster, []
+        return cluster or None
+
+
+def iter_clusters(rows, max_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Groups an ordered row stream with a ``ClusterBuilder``.
+
+    Args:
+        rows: Rows with id, parts_id and phash in capture order per part.
+        max_distance: Maximum Hamming distance to the cluster representative.
+
+    Yields:
+        list: IDs of a cluster; the first ID is the representative frame.
+    """
+    clusters = ClusterBuilder(max_distance)
+    for row in rows:
+        cluster = clusters.add(row)
+        if cluster:
+            yield cluster
+    cluster = clusters.finish()
+    if cluster:
+        yield cluster
+
+
+class NearDuplicateFilter:
+    """
+    Drops frames that are near-duplicates of the last kept frame of their part.
+
+    Rows without a perceptual hash are always kept.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._last_kept = {}
+
+    def keep(self, row) -> bool:
+        """Checks a row with parts_id and phash and remembers it if it is kept."""
+        if row.phash is None:
+            return True
+        previous = self._last_kept.get(row.parts_id)
+        if previous is not None and (
+            hamming_distance(row.phash, previous) <= self.max_distance
+        ):
+            return False
+        self._last_kept[row.parts_id] = row.phash
+        return True
+
+
+def dedup_rows(rows, max_distance: int = DEFAULT_MAX_DISTANCE):
+    """
+    Filters an ordered row stream with a ``NearDuplicateFilter``.
+
+    Args:
+        rows: Rows with parts_id and phash, e.g. export rows in ID order.
+        max_distance: Maximum Hamming distance of dropped frames.
+
+    Yields:
+        The kept rows.
+    """
+    near_duplicates = NearDuplicateFilter(max_distance)
+    for row in rows:
+        if near_duplicates.keep(row):
+            yield row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Frame deduplication tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    hash_parser = commands.add_parser("hash", help="Hash all frames without phash")
+    hash_parser.add_argument("--batch-size", type=int, default=500)
+    hash_parser.add_argument("--workers", type=int, default=None)
+    hash_parser.add_argument("--limit", type=int, default=None)
+    cluster_parser = commands.add_parser("clusters", help="Print duplicate clusters")
+    cluster_parser.add_argument("--parts-id", type=int, default=None)
+    cluster_parser.add_argument("--slicer-settings-id", type=int, default=None)
+    cluster_parser.add_argument(
+        "--max-distance", type=int, default=DEFAULT_MAX_DISTANCE
+    )
+    args = parser.parse_args()
+
+    if args.command == "hash":
+        hashed = compute_hashes(
+            get_blob_store(), args.batch_size, args.workers, args.limit
+        )
+        print(f"Hashed {hashed} frames.")
+        return
+
+    with Session() as session:
+        rows = session.execute(
+            select_cluster_rows(
+                parts_id=args.parts_id, slicer_settings_id=args.slicer_settings_id
+            ).execution_options(yield_per=10000)
+        )
+        clusters = frames = 0
+        for cluster in iter_clusters(rows, args.max_distance):
+            frames += len(cluster)
+            if len(cluster) > 1:
+                clusters += 1
+                print(f"{cluster[0]}: {len(cluster)} frames")
+    print(f"{clusters} clusters of near-duplicates in {frames} frames")
+
+
+if __name__ == "__main__":
+    main()
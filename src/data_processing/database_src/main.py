@@ -40,7 +40,7 @@ def main() -> None:
         session.commit()
 
         # Test query
-        results = get_image_data_by_column_value(session, "label", 1)
+        results = list(get_image_data_by_column_value(session, "label", 1))
         print(f"Found {len(results)} records with label=1:")
         for record in results:
             print(record)
@@ -0,0 +1,113 @@
+"""
+Moves image blobs from PostgreSQL into the configured blob store.
+
+Rows are processed in ID-ordered batches. The blobs of a batch are uploaded in
+parallel, then the batch is updated in one transaction: ``image_sha256`` and
+``image_size`` are set and ``image`` is cleared. A run can be interrupted and
+restarted at any time; rows that still hold their blob are picked up again.
+
+Usage:
+    BLOB_STORE_BACKEND=s3 BLOB_STORE_BUCKET=frames \
+    BLOB_STORE_ENDPOINT_URL=http://localhost:9000 python migrate_blobs.py
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy as sa
+
+from database import Session
+from models import ImageData
+from blob_store import content_key, get_blob_store
+from purge import lock_blob_keys
+from schema_management import add_blob_store_columns
+
+
+def migrate_blobs(store, batch_size=200, workers=8, limit=None):
+    """
+    Moves blobs that are still stored in image_data into the blob store.
+
+    Args:
+        store: Target blob store.
+        batch_size: Number of rows per batch and transaction.
+        workers: Number of parallel uploads.
+        limit: Stop after this many rows (None for all rows).
+
+    Returns:
+        int: Number of migrated rows.
+    """
+    migrated = 0
+    last_id = 0
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or migrated < limit:
+            size = batch_size if limit is None else min(batch_size, limit - migrated)
+            with Session() as session:
+                rows = session.execute(
+                    sa.select(ImageData.id, ImageData.image)
+                    .where(ImageData.image.is_not(None), ImageData.id > last_id)
+                    .order_by(ImageData.id)
+                    .limit(size)
+                ).all()
+                if not rows:
+                    break
+
+                # Held until the commit, so a purge cannot delete a blob that
+                # is shared with another row before this row references it
+                keys = [content_key(row.image) for row in rows]
+                session.execute(lock_blob_keys(keys, shared=True))
+                list(pool.map(lambda row: store.put(row.image), rows))
+
+                # Bulk UPDATE by primary key, executed as one executemany
+                session.execute(
+                    sa.update(ImageData),
+                    [
+                        {
+                            "id": row.id,
+                            "image_sha256": key,
+                            "image_size": len(row.image),
+                            "image": None,
+                        }
+                        for row, key in zip(rows, keys)
+                    ],
+                )
+                session.commit()
+
+            migrated += len(rows)
+            last_id = rows[-1].id
+            elapsed = time.time() - start_time
+            print(
+                f"Migrated {migrated} blobs up to ID {last_id} "
+                f"({migrated / elapsed:.0f} rows/s)"
+            )
+
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Move image blobs from PostgreSQL into the blob store."
+    )
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    store = get_blob_store()
+    if store is None:
+        print("Set BLOB_STORE_BACKEND to 'local' or 's3' to migrate blobs.")
+        return
+
+    if not add_blob_store_columns():
+        return
+
+    migrated = migrate_blobs(
+        store, batch_size=args.batch_size, workers=args.workers, limit=args.limit
+    )
+    print(f"Migrated {migrated} blobs. Run VACUUM on image_data to reclaim space.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,73 @@ import sqlalchemy as sa
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 from datetime import datetime
-from .database import Base
+from typing import Optional
+
+# Imported as database_src.models by the package and as models by the scripts
+# that put database_src on sys.path
+try:
+    from .database import Base
+except ImportError:
+    from database import Base
+
+# phash is split into 16-bit segments for the multi-index Hamming search of
+# dedup.py: two hashes within d bits differ in at most d // 4 bits in one of
+# the segments
+PHASH_SEGMENT_BITS = 16
+PHASH_SEGMENTS = 4
+
+
+def phash_segment_sql(segment: int) -> str:
+    """SQL expression of a 16-bit segment of phash, as generated column."""
+    return f"(phash >> {segment * PHASH_SEGMENT_BITS}) & 65535"
 
 
 class ImageData(Base):
     __tablename__ = "image_data"
+    # Indexes for the filter combinations of the API (GET /images/, exports) and
+    # for time-range scans. Foreign keys are not indexed automatically in PostgreSQL.
+    __table_args__ = (
+        sa.Index("ix_image_data_parts_id_label_layer", "parts_id", "label", "layer"),
+        sa.Index(
+            "ix_image_data_slicer_settings_id_label", "slicer_settings_id", "label"
+        ),
+        sa.Index("ix_image_data_label_layer", "label", "layer"),
+        sa.Index("ix_image_data_layer", "layer"),
+        sa.Index("ix_image_data_timestamp", "timestamp"),
+        sa.Index("ix_image_data_image_sha256", "image_sha256"),
+        # Frames dedup.py has not hashed yet; the Hamming distance queries
+        # compare bits and cannot use a btree on phash
+        sa.Index(
+            "ix_image_data_unhashed", "id", postgresql_where=sa.text("phash IS NULL")
+        ),
+        sa.Index("ix_image_data_phash_0", "phash_0"),
+        sa.Index("ix_image_data_phash_1", "phash_1"),
+        sa.Index("ix_image_data_phash_2", "phash_2"),
+        sa.Index("ix_image_data_phash_3", "phash_3"),
+    )
 
+    # On a table partitioned by timestamp (see partitioning.py) the database
+    # primary key is (id, timestamp); id stays unique through its sequence.
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    image: Mapped[bytes] = mapped_column(sa.LargeBinary)
+    # NULL once the blob has been moved to the blob store (see blob_store.py)
+    image: Mapped[Optional[bytes]] = mapped_column(sa.LargeBinary, nullable=True)
+    # SHA-256 content address of the image in the blob store
+    image_sha256: Mapped[Optional[str]] = mapped_column(sa.String(64), nullable=True)
+    image_size: Mapped[Optional[int]] = mapped_column(nullable=True)
+    # 64-bit perceptual hash for near-duplicate detection (see dedup.py)
+    phash: Mapped[Optional[int]] = mapped_column(sa.BigInteger, nullable=True)
+    phash_0: Mapped[Optional[int]] = mapped_column(
+        sa.Computed(phash_segment_sql(0), persisted=True), nullable=True
+    )
+    phash_1: Mapped[Optional[int]] = mapped_column(
+        sa.Computed(phash_segment_sql(1), persisted=True), nullable=True
+    )
+    phash_2: Mapped[Optional[int]] = mapped_column(
+        sa.Computed(phash_segment_sql(2), persisted=True), nullable=True
+    )
+    phash_3: Mapped[Optional[int]] = mapped_column(
+        sa.Computed(phash_segment_sql(3), persisted=True), nullable=True
+    )
     timestamp: Mapped[datetime] = mapped_column(
         sa.DateTime(), nullable=False, server_default=func.now()
     )
@@ -31,8 +90,14 @@ class ImageData(Base):
 
 class SlicerSettings(Base):
     __tablename__ = "slicer_settings"
+    # Existing profiles are looked up by their fingerprint (see crud.py)
+    __table_args__ = (
+        sa.Index("ux_slicer_settings_fingerprint", "fingerprint", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # SHA-256 of the normalised settings, NULL only for rows not yet backfilled
+    fingerprint: Mapped[Optional[str]] = mapped_column(sa.String(64), nullable=True)
     slicer_profile: Mapped[str]
     sparse_infill_density: Mapped[int]
     sparse_infill_pattern: Mapped[str]
@@ -68,8 +133,49 @@ class Parts(Base):
     images: Mapped[list[ImageData]] = relationship(back_populates="parts")
 
 
+class Prediction(Base):
+    __tablename__ = "predictions"
+    # Written by src/ai/inference/score_dataset.py. The primary key starts with
+    # model_version so a scoring run can skip the frames it has already scored.
+    # No foreign key: on the partitioned image_data the key is (id, timestamp).
+    __table_args__ = (
+        sa.Index("ix_predictions_image_id", "image_id"),
+        sa.Index("ix_predictions_model_version_label", "model_version", "label"),
+    )
+
+    model_version: Mapped[str] = mapped_column(sa.String(64), primary_key=True)
+    image_id: Mapped[int] = mapped_column(sa.BigInteger, primary_key=True)
+    label: Mapped[int]
+    confidence: Mapped[float]
+    probabilities: Mapped[list[float]] = mapped_column(sa.ARRAY(sa.Float))
+    created_at: Mapped[datetime] = mapped_column(
+        sa.DateTime(), nullable=False, server_default=func.now()
+    )
+
+
+class GcodeFile(Base):
+    __tablename__ = "gcode_files"
+    # Parameter cache of gcode_cache.py. A row is only used while size and
+    # modified still match Moonraker's metadata of the file.
+
+    printer: Mapped[str] = mapped_column(sa.String(255), primary_key=True)
+    filename: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+    size: Mapped[int] = mapped_column(sa.BigInteger)
+    modified: Mapped[float]
+    parameters: Mapped[dict] = mapped_column(sa.JSON)
+    slicer_settings_id: Mapped[Optional[int]] = mapped_column(
+        sa.ForeignKey("slicer_settings.id", ondelete="SET NULL"), nullable=True
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        sa.DateTime(), nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+
 if __name__ == "__main__":
-    from .database import engine
+    from database import engine
 
     Base.metadata.create_all(bind=engine)
-    print("Tables 'image_data', 'slicer_settings', and 'parts' created successfully!")
+    print(
+        "Tables 'image_data', 'slicer_settings', 'parts', 'predictions' and "
+        "'gcode_files' created successfully!"
+    )
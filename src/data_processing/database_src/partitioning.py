@@ -0,0 +1,390 @@
+"""
+Range partitioning of image_data by capture timestamp.
+
+PostgreSQL requires the partition key to be part of the primary key, so the
+partitioned table uses ``PRIMARY KEY (id, timestamp)``. The ORM keeps mapping
+``id`` as the identity of ImageData, which stays unique because all rows draw
+from the same ``image_data_id_seq`` sequence.
+
+The indexes declared on the ImageData model are created on the partitioned
+parent and are inherited by every partition. Queries with a ``timestamp``
+range (e.g. ``start_time`` on ``GET /images/``) are pruned to the matching
+partitions.
+
+Migration of an existing table (``migrate_to_partitioned``):
+    0. The table needs all columns of ``COLUMNS``; run
+       ``schema_management.py add-blob-columns`` and ``add-dedup-columns``
+       first on older databases.
+    1. Create ``image_data_partitioned`` and the partitions for all rows.
+    2. Install a trigger on ``image_data`` that mirrors every write and
+       records the keys of deleted rows in ``image_data_migration_deletes``.
+    3. Backfill the existing rows in short, ID-ordered batches.
+    4. Swap the tables in one short transaction, after removing the recorded
+       deletes that a backfill batch copied again. The old table is kept as
+       ``image_data_unpartitioned`` until it is dropped manually.
+"""
+
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from database import db
+from models import PHASH_SEGMENTS, ImageData, phash_segment_sql
+
+TABLE_NAME = "image_data"
+# (id, timestamp) of rows deleted from image_data while it is being migrated
+DELETES_TABLE = f"{TABLE_NAME}_migration_deletes"
+INTERVALS = ("month", "week")
+# schema_management.py command that adds a column missing from older tables
+COLUMN_MIGRATIONS = {
+    "image_sha256": "add-blob-columns",
+    "image_size": "add-blob-columns",
+    "phash": "add-dedup-columns",
+}
+
+# Column order used for all copies between the old and the partitioned table
+COLUMNS = (
+    "id",
+    "image",
+    "image_sha256",
+    "image_size",
+    "phash",
+    "timestamp",
+    "slicer_settings_id",
+    "parts_id",
+    "label",
+    "layer",
+)
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_start(moment: datetime, interval: str) -> datetime:
+    """Returns the start of the partition containing ``moment``."""
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == "month":
+        return day.replace(day=1)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def next_partition_start(start: datetime, interval: str) -> datetime:
+    """Returns the start of the partition following the one starting at ``start``."""
+    if interval == "month":
+        year, month = divmod(start.month, 12)
+        return start.replace(year=start.year + year, month=month + 1)
+    return start + timedelta(days=7)
+
+
+def partition_name(table_name: str, start: datetime, interval: str) -> str:
+    """Returns a partition name, e.g. image_data_p2024_03 or image_data_p2024_w09."""
+    if interval == "month":
+        return f"{table_name}_p{start:%Y_%m}"
+    year, week, _ = start.isocalendar()
+    return f"{table_name}_p{year}_w{week:02d}"
+
+
+def create_partitioned_table(connection, table_name: str = TABLE_NAME) -> None:
+    """
+    Creates a partitioned image_data table with its indexes and default partition.
+
+    Args:
+        connection: SQLAlchemy connection inside a transaction.
+        table_name: Name of the new table.
+    """
+    connection.execute(sa.text("CREATE SEQUENCE IF NOT EXISTS image_data_id_seq"))
+    phash_segments = "".join(
+        f"phash_{segment} INTEGER "
+        f"GENERATED ALWAYS AS ({phash_segment_sql(segment)}) STORED, "
+        for segment in range(PHASH_SEGMENTS)
+    )
+    connection.execute(
+        sa.text(
+            f"CREATE TABLE IF NOT EXISTS {table_name} ("
+            "id INTEGER NOT NULL DEFAULT nextval('image_data_id_seq'), "
+            "image BYTEA, "
+            "image_sha256 VARCHAR(64), "
+            "image_size INTEGER, "
+            "phash BIGINT, "
+            f"{phash_segments}"
+            "timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+            "slicer_settings_id INTEGER REFERENCES slicer_settings (id), "
+            "parts_id INTEGER REFERENCES parts (id), "
+            "label INTEGER, "
+            "layer INTEGER, "
+            "PRIMARY KEY (id, timestamp)"
+            ") PARTITION BY RANGE (timestamp)"
+        )
+    )
+    for index in ImageData.__table__.indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        index_name = index.name.replace(TABLE_NAME, table_name, 1)
+        where = index.dialect_options["postgresql"]["where"]
+        connection.execute(
+            sa.text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})"
+                + (f" WHERE {where}" if where is not None else "")
+            )
+        )
+    # Catches rows outside of the created ranges instead of rejecting them
+    connection.execute(
+        sa.text(
+            f"CREATE TABLE IF NOT EXISTS {table_name}_default "
+            f"PARTITION OF {table_name} DEFAULT"
+        )
+    )
+
+
+def create_partitions(
+    connection,
+    first: datetime,
+    last: datetime,
+    interval: str = "month",
+    table_name: str = TABLE_NAME,
+) -> list:
+    """
+    Creates the partitions covering the time range from ``first`` to ``last``.
+
+    Args:
+        connection: SQLAlchemy connection inside a transaction.
+        first: Earliest timestamp that has to be covered.
+        last: Latest timestamp that has to be covered.
+        interval: 'month' or 'week'.
+        table_name: Name of the partitioned table.
+
+    Returns:
+        list: Names of the partitions in the range.
+    """
+    names = []
+    start = partition_start(first, interval)
+    while start <= last:
+        end = next_partition_start(start, interval)
+        name = partition_name(table_name, start, interval)
+        connection.execute(
+            sa.text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            )
+        )
+        names.append(name)
+        start = end
+    return names
+
+
+def list_partitions(connection, table_name: str = TABLE_NAME) -> list:
+    """
+    Lists the range partitions of a table with their bounds.
+
+    Returns:
+        list: (name, start, end) tuples ordered by start; the default
+        partition is not included.
+    """
+    rows = connection.execute(
+        sa.text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table_name"
+        ),
+        {"table_name": table_name},
+    )
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            start, end = (datetime.fromisoformat(value) for value in match.groups())
+            partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _install_mirror_trigger(connection, target: str) -> None:
+    connection.execute(
+        sa.text(
+            f"CREATE TABLE IF NOT EXISTS {DELETES_TABLE} "
+            "(id INTEGER NOT NULL, timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL)"
+        )
+    )
+    columns = ", ".join(COLUMNS)
+    new_values = ", ".join(f"NEW.{column}" for column in COLUMNS)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in COLUMNS[1:])
+    connection.execute(
+        sa.text(
+            f"""
+            CREATE OR REPLACE FUNCTION {TABLE_NAME}_mirror() RETURNS trigger AS $$
+            BEGIN
+                -- A backfill batch that read the row before it was deleted
+                -- can still copy it, so the key is removed again at cut-over
+                IF TG_OP = 'DELETE' THEN
+                    DELETE FROM {target} WHERE id = OLD.id;
+                    INSERT INTO {DELETES_TABLE} VALUES (OLD.id, OLD.timestamp);
+                    RETURN OLD;
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.timestamp <> OLD.timestamp THEN
+                    DELETE FROM {target} WHERE id = OLD.id;
+                    INSERT INTO {DELETES_TABLE} VALUES (OLD.id, OLD.timestamp);
+                END IF;
+                INSERT INTO {target} ({columns}) VALUES ({new_values})
+                ON CONFLICT (id, timestamp) DO UPDATE SET {updates};
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        )
+    )
+    connection.execute(
+        sa.text(
+            f"CREATE TRIGGER {TABLE_NAME}_mirror "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {TABLE_NAME} "
+            f"FOR EACH ROW EXECUTE FUNCTION {TABLE_NAME}_mirror()"
+        )
+    )
+
+
+def missing_columns(connection, table_name: str = TABLE_NAME) -> list:
+    """Returns the columns of ``COLUMNS`` the table does not have."""
+    existing = set(
+        connection.execute(
+            sa.text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_name = :table_name"
+            ),
+            {"table_name": table_name},
+        ).scalars()
+    )
+    return [column for column in COLUMNS if column not in existing]
+
+
+def migrate_to_partitioned(
+    interval: str = "month", batch_size: int = 5000, periods_ahead: int = 3
+) -> bool:
+    """
+    Migrates the existing image_data table to a partitioned table while the
+    capture pipeline keeps writing.
+
+    Args:
+        interval: 'month' or 'week'.
+        batch_size: Number of rows copied per backfill transaction.
+        periods_ahead: Number of future partitions to create.
+
+    Returns:
+        bool: True if successful, False if columns are missing.
+    """
+    target = f"{TABLE_NAME}_partitioned"
+
+    with db.connect() as connection:
+        missing = missing_columns(connection)
+    if missing:
+        commands = sorted(
+            {
+                COLUMN_MIGRATIONS[column]
+                for column in missing
+                if column in COLUMN_MIGRATIONS
+            }
+        )
+        hint = " and ".join(
+            f"'python schema_management.py {command}'" for command in commands
+        )
+        print(
+            f"Table '{TABLE_NAME}' has no column {', '.join(missing)}."
+            + (f" Run {hint} first." if commands else "")
+        )
+        return False
+
+    with db.begin() as connection:
+        first, max_id = connection.execute(
+            sa.text(f"SELECT min(timestamp), max(id) FROM {TABLE_NAME}")
+        ).one()
+        now = datetime.now()
+        last = now
+        for _ in range(periods_ahead):
+            last = next_partition_start(partition_start(last, interval), interval)
+        create_partitioned_table(connection, target)
+        create_partitions(connection, first or now, last, interval, target)
+        _install_mirror_trigger(connection, target)
+    print(f"Created '{target}' and installed the mirror trigger.")
+
+    # Backfill: rows written from now on are mirrored by the trigger
+    columns = ", ".join(COLUMNS)
+    last_id = 0
+    while max_id is not None and last_id < max_id:
+        with db.begin() as connection:
+            connection.execute(
+                sa.text(
+                    f"INSERT INTO {target} ({columns}) "
+                    f"SELECT {columns} FROM {TABLE_NAME} "
+                    "WHERE id > :last_id AND id <= :upper "
+                    "ON CONFLICT (id, timestamp) DO NOTHING"
+                ),
+                {"last_id": last_id, "upper": last_id + batch_size},
+            )
+        last_id += batch_size
+        print(f"Backfilled rows up to ID {min(last_id, max_id)} of {max_id}")
+
+    # Cut-over: short exclusive lock while the tables are swapped
+    with db.begin() as connection:
+        connection.execute(
+            sa.text(f"LOCK TABLE {TABLE_NAME} IN ACCESS EXCLUSIVE MODE")
+        )
+        # Rows deleted while their batch was being copied; only the recorded
+        # keys are looked up, not the whole table
+        connection.execute(
+            sa.text(
+                f"DELETE FROM {target} t USING {DELETES_TABLE} d "
+                "WHERE t.id = d.id AND t.timestamp = d.timestamp"
+            )
+        )
+        connection.execute(
+            sa.text(f"DROP TRIGGER {TABLE_NAME}_mirror ON {TABLE_NAME}")
+        )
+        connection.execute(sa.text(f"DROP FUNCTION {TABLE_NAME}_mirror()"))
+        connection.execute(sa.text(f"DROP TABLE {DELETES_TABLE}"))
+        connection.execute(
+            sa.text(f"ALTER TABLE {TABLE_NAME} RENAME TO {TABLE_NAME}_unpartitioned")
+        )
+        for index in ImageData.__table__.indexes:
+            old_name = index.name.replace(TABLE_NAME, f"{TABLE_NAME}_unpartitioned", 1)
+            new_name = index.name.replace(TABLE_NAME, target, 1)
+            connection.execute(
+                sa.text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {old_name}")
+            )
+            connection.execute(
+                sa.text(f"ALTER INDEX {new_name} RENAME TO {index.name}")
+            )
+        connection.execute(sa.text(f"ALTER TABLE {target} RENAME TO {TABLE_NAME}"))
+        connection.execute(
+            sa.text(f"ALTER TABLE {target}_default RENAME TO {TABLE_NAME}_default")
+        )
+        for name, start, _ in list_partitions(connection, TABLE_NAME):
+            connection.execute(
+                sa.text(
+                    f"ALTER TABLE {name} RENAME TO "
+                    f"{partition_name(TABLE_NAME, start, interval)}"
+                )
+            )
+        # Keep the sequence alive when the old table is dropped
+        connection.execute(
+            sa.text(f"ALTER SEQUENCE image_data_id_seq OWNED BY {TABLE_NAME}.id")
+        )
+    print(
+        f"'{TABLE_NAME}' is now partitioned by {interval}. The previous table is "
+        f"kept as '{TABLE_NAME}_unpartitioned' and can be dropped after checking."
+    )
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate image_data to a table partitioned by timestamp."
+    )
+    parser.add_argument("--interval", choices=INTERVALS, default="month")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--periods-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    if not migrate_to_partitioned(args.interval, args.batch_size, args.periods_ahead):
+        sys.exit(1)
@@ -0,0 +1,172 @@
+"""
+Chunked purge of image_data rows and their blobs.
+
+Rows are deleted by ID list or by filter in chunks of ``chunk_size`` rows, one
+transaction per chunk, so locks are short and a purge can be interrupted at
+any time. Every chunk returns the content keys of the deleted rows; blobs that
+are no longer referenced by any row are then deleted from the blob store.
+
+Writers store a blob before the row that references it is committed. They hold
+a shared advisory lock per content key (``lock_blob_keys``) from the ``put``
+until that commit, and the blob cleanup takes the exclusive locks before it
+checks the references, so a blob is never deleted under a row being inserted.
+
+Usage:
+    python purge.py --parts-id 3 --start-time 2024-05-01 --end-time 2024-05-02
+"""
+
+import argparse
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from database import Session
+from models import ImageData
+from crud import filter_image_data
+from blob_store import get_blob_store
+
+
+def lock_blob_keys(keys, shared: bool = False):
+    """
+    Builds the statement taking the advisory locks of content keys.
+
+    The locks are held until the end of the transaction and taken in key
+    order, so writers and the cleanup cannot deadlock.
+
+    Args:
+        keys: Content keys of the blobs.
+        shared: Take the shared locks of writers instead of exclusive ones.
+
+    Returns:
+        Text statement to execute in the transaction.
+    """
+    function = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    return sa.text(
+        f"SELECT {function}(hashtext(key)) FROM "
+        "(SELECT DISTINCT key FROM unnest(CAST(:keys AS text[])) AS key "
+        "ORDER BY key) AS sorted_keys"
+    ).bindparams(keys=sorted(set(keys)))
+
+
+def delete_unreferenced_blobs(session, store, keys) -> int:
+    """
+    Deletes the blobs of ``keys`` that no image_data row references anymore.
+
+    The references are checked under the exclusive locks of the keys, which
+    are released by the commit at the end.
+
+    Args:
+        session: SQLAlchemy session or connection.
+        store: Blob store holding the blobs.
+        keys: Content keys of deleted rows.
+
+    Returns:
+        int: Number of deleted blobs.
+    """
+    keys = set(keys)
+    if not keys:
+        return 0
+    session.execute(lock_blob_keys(keys))
+    referenced = set(
+        session.execute(
+            sa.select(ImageData.image_sha256)
+            .where(ImageData.image_sha256.in_(keys))
+            .distinct()
+        ).scalars()
+    )
+    orphaned = keys - referenced
+    for key in orphaned:
+        store.delete(key)
+    session.commit()
+    return len(orphaned)
+
+
+def _delete_chunks(ids, filters, chunk_size):
+    # Yields one DELETE ... RETURNING statement per chunk
+    if ids is not None:
+        ids = sorted(set(ids))
+        for start in range(0, len(ids), chunk_size):
+            yield sa.delete(ImageData).where(
+                ImageData.id.in_(ids[start : start + chunk_size])
+            )
+        return
+    chunk = filter_image_data(sa.select(ImageData.id), **filters).limit(chunk_size)
+    while True:
+        yield sa.delete(ImageData).where(ImageData.id.in_(chunk))
+
+
+def purge_image_data(
+    ids=None, filters=None, store=None, chunk_size=1000, progress=None
+) -> dict:
+    """
+    Deletes image_data rows by ID list or filter in chunks.
+
+    Args:
+        ids: IDs of the rows to delete.
+        filters: Keyword arguments of ``filter_image_data``, used without ``ids``.
+        store: Blob store; blobs no longer referenced by any row are deleted.
+        chunk_size: Number of rows deleted per transaction.
+        progress: Called with the counts after every chunk.
+
+    Returns:
+        dict: Numbers of deleted rows and deleted blobs.
+
+    Raises:
+        ValueError: If neither IDs nor a non-empty filter are given.
+    """
+    if ids is None and not filters:
+        raise ValueError("Purging needs an ID list or at least one filter")
+
+    counts = {"deleted": 0, "blobs_deleted": 0}
+    with Session() as session:
+        for stmt in _delete_chunks(ids, filters, chunk_size):
+            keys = session.execute(
+                stmt.returning(ImageData.image_sha256).execution_options(
+                    synchronize_session=False
+                )
+            ).scalars().all()
+            session.commit()
+            if not keys and ids is None:
+                break
+
+            counts["deleted"] += len(keys)
+            if store is not None:
+                counts["blobs_deleted"] += delete_unreferenced_blobs(
+                    session, store, [key for key in keys if key]
+                )
+            if progress is not None:
+                progress(dict(counts))
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge image data and its blobs.")
+    parser.add_argument("--ids", type=int, nargs="+", default=None)
+    parser.add_argument("--parts-id", type=int, default=None)
+    parser.add_argument("--slicer-settings-id", type=int, default=None)
+    parser.add_argument("--label", type=int, default=None)
+    parser.add_argument("--start-time", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end-time", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    filters = {
+        name: value
+        for name, value in (
+            ("parts_id", args.parts_id),
+            ("slicer_settings_id", args.slicer_settings_id),
+            ("label", args.label),
+            ("start_time", args.start_time),
+            ("end_time", args.end_time),
+        )
+        if value is not None
+    }
+    counts = purge_image_data(
+        ids=args.ids,
+        filters=filters,
+        store=get_blob_store(),
+        chunk_size=args.chunk_size,
+        progress=lambda counts: print(f"Deleted {counts['deleted']} rows"),
+    )
+    print(f"Deleted {counts['deleted']} rows and {counts['blobs_deleted']} blobs.")
@@ -0,0 +1,223 @@
+"""
+Query plan regression check for the image_data filters of the API.
+
+Loads a synthetic table (1M rows by default) into a scratch schema of a local
+PostgreSQL, then runs ``EXPLAIN`` on the statements the API builds and fails if
+any of them does not read ``image_data`` through the index intended for its
+filters, e.g. falls back to a sequential scan or to a primary key scan that
+filters every row.
+
+Usage:
+    python query_plan_check.py --rows 1000000
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from database import Base, engine
+from models import ImageData
+from crud import (
+    IMAGE_METADATA_COLUMNS,
+    filter_image_data,
+    select_image_data_by_column_value,
+)
+
+SCHEMA_NAME = "query_plan_check"
+NUM_PARTS = 50
+NUM_SLICER_SETTINGS = 40
+START_TIME = datetime(2024, 1, 1)
+
+
+def _list_query(**filters):
+    """Same statement as GET /images/ with the default pagination."""
+    stmt = filter_image_data(sa.select(*IMAGE_METADATA_COLUMNS), **filters)
+    return stmt.order_by(ImageData.id).offset(0).limit(100)
+
+
+# (description, expected index, statement) covering the filters used by the API
+QUERY_CASES = [
+    (
+        "images by parts_id",
+        "ix_image_data_parts_id_label_layer",
+        _list_query(parts_id=7),
+    ),
+    (
+        "images by parts_id + label",
+        "ix_image_data_parts_id_label_layer",
+        _list_query(parts_id=7, label=3),
+    ),
+    (
+        "images by parts_id + label + layer",
+        "ix_image_data_parts_id_label_layer",
+        _list_query(parts_id=7, label=3, layer=42),
+    ),
+    (
+        "images by slicer_settings_id",
+        "ix_image_data_slicer_settings_id_label",
+        _list_query(slicer_settings_id=11),
+    ),
+    (
+        "images by slicer_settings_id + label",
+        "ix_image_data_slicer_settings_id_label",
+        _list_query(slicer_settings_id=11, label=4),
+    ),
+    (
+        "images by label + layer",
+        "ix_image_data_label_layer",
+        _list_query(label=2, layer=120),
+    ),
+    ("images by layer", "ix_image_data_layer", _list_query(layer=120)),
+    (
+        "images in time range",
+        "ix_image_data_timestamp",
+        _list_query(
+            start_time=START_TIME + timedelta(days=100),
+            end_time=START_TIME + timedelta(days=101),
+        ),
+    ),
+    (
+        "by-column parts_id page",
+        "ix_image_data_parts_id_label_layer",
+        select_image_data_by_column_value("parts_id", 7, limit=1000),
+    ),
+    (
+        "by-column slicer_settings_id page",
+        "ix_image_data_slicer_settings_id_label",
+        select_image_data_by_column_value("slicer_settings_id", 11, limit=1000),
+    ),
+]
+
+
+def load_synthetic_data(connection, num_rows: int) -> None:
+    """
+    Creates the tables in the scratch schema and fills them with synthetic rows.
+
+    Labels are skewed like the real dataset (mostly normal frames), layers span
+    0-300 and timestamps are spread over one year.
+    """
+    connection.execute(sa.text(f"DROP SCHEMA IF EXISTS {SCHEMA_NAME} CASCADE"))
+    connection.execute(sa.text(f"CREATE SCHEMA {SCHEMA_NAME}"))
+    connection.execute(sa.text(f"SET search_path TO {SCHEMA_NAME}"))
+    Base.metadata.create_all(
+        bind=connection.execution_options(schema_translate_map={None: SCHEMA_NAME})
+    )
+
+    connection.execute(
+        sa.text(
+            "INSERT INTO parts (name, url, general_image) "
+            "SELECT 'part_' || i, 'url_' || i, '\\x00'::bytea "
+            "FROM generate_series(1, :n) AS i"
+        ),
+        {"n": NUM_PARTS},
+    )
+    connection.execute(
+        sa.text(
+            "INSERT INTO slicer_settings (slicer_profile, sparse_infill_density, "
+            "sparse_infill_pattern, sparse_infill_speed, first_layer_bed_temperature, "
+            "bed_temperature_other_layers, first_layer_nozzle_temperature, "
+            "nozzle_temperature_other_layers, travel_speed, first_layer_height, "
+            "layer_height_other_layers, line_width, retraction_length, "
+            "filament_flow_ratio, printer_name) "
+            "SELECT 'profile_' || i, 15, 'grid', 100, 60, 60, 215, 210, 200, "
+            "0.2, 0.2, 0.42, 0.8, 0.98, 'printer' "
+            "FROM generate_series(1, :n) AS i"
+        ),
+        {"n": NUM_SLICER_SETTINGS},
+    )
+    connection.execute(
+        sa.text(
+            "INSERT INTO image_data (image, timestamp, slicer_settings_id, "
+            "parts_id, label, layer) "
+            "SELECT '\\x00'::bytea, "
+            ":start + (i * interval '31 seconds'), "
+            "1 + (random() * (:num_settings - 1))::int, "
+            "1 + (random() * (:num_parts - 1))::int, "
+            "CASE WHEN random() < 0.7 THEN 0 ELSE 1 + (random() * 3)::int END, "
+            "(random() * 300)::int "
+            "FROM generate_series(1, :n) AS i"
+        ),
+        {
+            "n": num_rows,
+            "start": START_TIME,
+            "num_settings": NUM_SLICER_SETTINGS,
+            "num_parts": NUM_PARTS,
+        },
+    )
+    connection.execute(sa.text("ANALYZE"))
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def explain(connection, stmt) -> dict:
+    """Returns the JSON plan of a statement compiled for PostgreSQL."""
+    compiled = stmt.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    result = connection.execute(sa.text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    return result.scalar()[0]["Plan"]
+
+
+def check_plan(plan, expected_index: str) -> tuple:
+    """
+    Checks that a plan reads image_data through the expected index.
+
+    Bitmap index scans carry the index name but no relation name, so index
+    names are collected from all nodes; the expected index belongs to
+    image_data.
+
+    Returns:
+        tuple: (passed, comma separated node summary)
+    """
+    uses_index = False
+    summary = []
+    for node in _plan_nodes(plan):
+        node_type = node["Node Type"]
+        index_name = node.get("Index Name")
+        on_image_data = node.get("Relation Name") == ImageData.__tablename__
+        if not on_image_data and not index_name:
+            continue
+        summary.append(f"{node_type} {index_name or ''}".strip())
+        if node_type == "Seq Scan" and on_image_data:
+            return False, ", ".join(summary)
+        if index_name == expected_index:
+            uses_index = True
+    return uses_index, ", ".join(summary)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch schema afterwards"
+    )
+    args = parser.parse_args()
+
+    failures = 0
+    with engine.begin() as connection:
+        start_time = time.time()
+        load_synthetic_data(connection, args.rows)
+        print(f"Loaded {args.rows} rows in {time.time() - start_time:.1f} s")
+
+        for description, expected_index, stmt in QUERY_CASES:
+            passed, summary = check_plan(explain(connection, stmt), expected_index)
+            print(f"[{'PASS' if passed else 'FAIL'}] {description}: {summary}")
+            failures += 0 if passed else 1
+
+        if not args.keep:
+            connection.execute(sa.text(f"DROP SCHEMA {SCHEMA_NAME} CASCADE"))
+
+    print(f"{len(QUERY_CASES) - failures}/{len(QUERY_CASES)} query plans use their indexes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
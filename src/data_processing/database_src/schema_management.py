@@ -77,3 +77,448 @@ def add_column_to_table(
     except Exception as e:
         print(f"Error adding column '{column_name}' to table '{table_name}': {e}")
         return False
+
+
+def create_image_data_indexes():
+    """
+    Creates the indexes declared on the ImageData model on an existing table.
+
+    ``Base.metadata.create_all`` does not add indexes to tables that already
+    exist, so this builds them with ``CREATE INDEX CONCURRENTLY`` to avoid
+    blocking the capture pipeline while the index is built. On a partitioned
+    table, where the parent cannot be indexed concurrently, the index is
+    created on the parent only and built concurrently on every partition.
+    Indexes on columns that do not exist yet (see ``add-blob-columns`` and
+    ``add-dedup-columns``) are skipped, and a partial index that was built
+    without its ``WHERE`` clause is rebuilt.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from models import ImageData
+
+    table_name = ImageData.__tablename__
+    try:
+        # CONCURRENTLY cannot run inside a transaction block
+        autocommit = db.execution_options(isolation_level="AUTOCOMMIT")
+        with autocommit.connect() as connection:
+            existing_columns = set(
+                connection.execute(
+                    sa.text(
+                        "SELECT column_name FROM information_schema.columns "
+                        "WHERE table_name = :table_name"
+                    ),
+                    {"table_name": table_name},
+                ).scalars()
+            )
+            partitions = connection.execute(
+                sa.text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                    "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                    "WHERE parent.relname = :table_name AND parent.relkind = 'p'"
+                ),
+                {"table_name": table_name},
+            ).scalars().all()
+            partitioned = (
+                connection.execute(
+                    sa.text("SELECT relkind FROM pg_class WHERE relname = :table_name"),
+                    {"table_name": table_name},
+                ).scalar()
+                == "p"
+            )
+
+            for index in ImageData.__table__.indexes:
+                names = [column.name for column in index.columns]
+                missing = [name for name in names if name not in existing_columns]
+                if missing:
+                    print(
+                        f"Index '{index.name}' skipped, table '{table_name}' has no "
+                        f"column {', '.join(missing)}."
+                    )
+                    continue
+                where = index.dialect_options["postgresql"]["where"]
+                predicate = f" WHERE {where}" if where is not None else ""
+                current = connection.execute(
+                    sa.text(
+                        "SELECT pg_get_indexdef(i.indexrelid), i.indisvalid "
+                        "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                        "WHERE c.relname = :name"
+                    ),
+                    {"name": index.name},
+                ).first()
+                if current is not None and where is not None:
+                    if " WHERE " not in current[0]:
+                        # Built by an earlier version without the predicate
+                        concurrently = "" if partitioned else "CONCURRENTLY "
+                        connection.execute(
+                            sa.text(f"DROP INDEX {concurrently}{index.name}")
+                        )
+                        current = None
+
+                columns = ", ".join(names)
+                if not partitioned:
+                    connection.execute(
+                        sa.text(
+                            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+                            f"ON {table_name} ({columns}){predicate}"
+                        )
+                    )
+                elif current is None or not current[1]:
+                    # Invalid until the index of every partition is attached;
+                    # partitions created later get the index automatically
+                    connection.execute(
+                        sa.text(
+                            f"CREATE INDEX IF NOT EXISTS {index.name} "
+                            f"ON ONLY {table_name} ({columns}){predicate}"
+                        )
+                    )
+                    for partition in partitions:
+                        partition_index = index.name.replace(table_name, partition, 1)
+                        connection.execute(
+                            sa.text(
+                                "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                                f"{partition_index} ON {partition} ({columns})"
+                                f"{predicate}"
+                            )
+                        )
+                        connection.execute(
+                            sa.text(
+                                f"ALTER INDEX {index.name} "
+                                f"ATTACH PARTITION {partition_index}"
+                            )
+                        )
+                print(f"Index '{index.name}' is present on table '{table_name}'.")
+            connection.execute(sa.text(f"ANALYZE {table_name}"))
+        return True
+
+    except Exception as e:
+        print(f"Error creating indexes on table '{table_name}': {e}")
+        return False
+
+
+def add_blob_store_columns(table_name: str = "image_data"):
+    """
+    Adds the blob store reference columns to an existing image_data table.
+
+    The ``image`` column becomes nullable, because migrated rows only keep the
+    content key and size of their blob.
+
+    Args:
+        table_name: The name of the table (default is 'image_data').
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    if not add_column_to_table("image_sha256", "VARCHAR(64)", table_name):
+        return False
+    if not add_column_to_table("image_size", "INTEGER", table_name):
+        return False
+    try:
+        with db.begin() as connection:
+            connection.execute(
+                sa.text(f"ALTER TABLE {table_name} ALTER COLUMN image DROP NOT NULL")
+            )
+            connection.execute(
+                sa.text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table_name}_image_sha256 "
+                    f"ON {table_name} (image_sha256)"
+                )
+            )
+        return True
+
+    except Exception as e:
+        print(f"Error preparing table '{table_name}' for the blob store: {e}")
+        return False
+
+
+def add_dedup_columns(table_name: str = "image_data"):
+    """
+    Adds the perceptual hash column used by dedup.py and its indexes.
+
+    The 16-bit segments of the hash are added as generated columns, which
+    rewrites the table once, and indexed for the near-duplicate search. The
+    partial index on the frames without a hash lets ``dedup.py hash`` resume
+    quickly. A btree on ``phash`` itself cannot serve the Hamming distance
+    queries, so an existing one is dropped.
+
+    Args:
+        table_name: The name of the table (default is 'image_data').
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from models import PHASH_SEGMENTS, phash_segment_sql
+
+    if not add_column_to_table("phash", "BIGINT", table_name):
+        return False
+    for segment in range(PHASH_SEGMENTS):
+        column_type = (
+            f"INTEGER GENERATED ALWAYS AS ({phash_segment_sql(segment)}) STORED"
+        )
+        if not add_column_to_table(f"phash_{segment}", column_type, table_name):
+            return False
+    try:
+        with db.begin() as connection:
+            connection.execute(sa.text(f"DROP INDEX IF EXISTS ix_{table_name}_phash"))
+        return create_image_data_indexes()
+
+    except Exception as e:
+        print(f"Error preparing table '{table_name}' for deduplication: {e}")
+        return False
+
+
+def create_predictions_table():
+    """
+    Creates the predictions table of the batch scoring job if it is missing.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from models import Prediction
+
+    try:
+        Prediction.__table__.create(db, checkfirst=True)
+        print(f"Table '{Prediction.__tablename__}' is present.")
+        return True
+
+    except Exception as e:
+        print(f"Error creating table '{Prediction.__tablename__}': {e}")
+        return False
+
+
+def create_gcode_files_table():
+    """
+    Creates the G-code parameter cache table (see gcode_cache.py) if it is missing.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from models import GcodeFile
+
+    try:
+        GcodeFile.__table__.create(db, checkfirst=True)
+        print(f"Table '{GcodeFile.__tablename__}' is present.")
+        return True
+
+    except Exception as e:
+        print(f"Error creating table '{GcodeFile.__tablename__}': {e}")
+        return False
+
+
+def create_future_partitions(
+    periods_ahead: int = 3, interval: str = "month", table_name: str = "image_data"
+):
+    """
+    Creates the partitions of a partitioned table for the coming periods.
+
+    Run this regularly (e.g. daily from cron) so new frames never land in the
+    default partition.
+
+    Args:
+        periods_ahead: Number of periods after the current one to create.
+        interval: 'month' or 'week', as used for the migration.
+        table_name: The name of the table (default is 'image_data').
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from datetime import datetime
+
+    from partitioning import create_partitions, next_partition_start, partition_start
+
+    try:
+        now = datetime.now()
+        last = partition_start(now, interval)
+        for _ in range(periods_ahead):
+            last = next_partition_start(last, interval)
+        with db.begin() as connection:
+            names = create_partitions(connection, now, last, interval, table_name)
+        print(f"Partitions present on table '{table_name}': {', '.join(names)}")
+        return True
+
+    except Exception as e:
+        print(f"Error creating partitions on table '{table_name}': {e}")
+        return False
+
+
+def drop_partitions_before(cutoff, table_name: str = "image_data", store=None):
+    """
+    Retention: detaches and drops all partitions that end before ``cutoff``.
+
+    Dropping a partition is a metadata operation, unlike a mass ``DELETE``
+    which has to touch and vacuum every row. ``DETACH ... CONCURRENTLY`` is not
+    allowed on a table with a default partition, so each partition is detached
+    in its own short transaction, which briefly locks the table. Blobs are only
+    deleted once the partition is dropped, so a failed drop loses no images.
+
+    Args:
+        cutoff: Partitions whose upper bound is at or before this time are dropped.
+        table_name: The name of the table (default is 'image_data').
+        store: Blob store; blobs only referenced by dropped rows are deleted.
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from partitioning import list_partitions
+    from purge import delete_unreferenced_blobs
+
+    try:
+        with db.connect() as connection:
+            partitions = [
+                name
+                for name, _, end in list_partitions(connection, table_name)
+                if end <= cutoff
+            ]
+
+        for name in partitions:
+            keys = []
+            with db.begin() as connection:
+                connection.execute(
+                    sa.text(f"ALTER TABLE {table_name} DETACH PARTITION {name}")
+                )
+                if store is not None:
+                    keys = connection.execute(
+                        sa.text(
+                            f"SELECT DISTINCT image_sha256 FROM {name} p "
+                            "WHERE image_sha256 IS NOT NULL AND NOT EXISTS "
+                            f"(SELECT 1 FROM {table_name} d "
+                            "WHERE d.image_sha256 = p.image_sha256)"
+                        )
+                    ).scalars().all()
+                connection.execute(sa.text(f"DROP TABLE {name}"))
+            print(f"Partition '{name}' dropped from table '{table_name}'.")
+
+            if keys:
+                with db.connect() as connection:
+                    deleted = delete_unreferenced_blobs(connection, store, keys)
+                print(f"{deleted} blobs of partition '{name}' deleted.")
+        return True
+
+    except Exception as e:
+        print(f"Error dropping partitions of table '{table_name}': {e}")
+        return False
+
+
+def add_slicer_settings_fingerprints(table_name: str = "slicer_settings"):
+    """
+    Adds and backfills the fingerprint column of slicer_settings.
+
+    Rows with identical settings are merged into the row with the lowest ID
+    (image_data is re-pointed to it) before the unique index is created.
+
+    Args:
+        table_name: The name of the table (default is 'slicer_settings').
+
+    Returns:
+        bool: True if successful, False otherwise.
+    """
+    from crud import SLICER_SETTINGS_COLUMNS, slicer_settings_fingerprint
+
+    if not add_column_to_table("fingerprint", "VARCHAR(64)", table_name):
+        return False
+    try:
+        with db.begin() as connection:
+            columns = ", ".join(("id",) + SLICER_SETTINGS_COLUMNS)
+            rows = connection.execute(
+                sa.text(f"SELECT {columns} FROM {table_name} ORDER BY id")
+            ).mappings()
+
+            kept = {}
+            for row in rows.all():
+                fingerprint = slicer_settings_fingerprint(row)
+                if fingerprint not in kept:
+                    kept[fingerprint] = row["id"]
+                    connection.execute(
+                        sa.text(
+                            f"UPDATE {table_name} SET fingerprint = :fingerprint "
+                            "WHERE id = :id"
+                        ),
+                        {"fingerprint": fingerprint, "id": row["id"]},
+                    )
+                    continue
+
+                # Duplicate profile: merge into the first row
+                connection.execute(
+                    sa.text(
+                        "UPDATE image_data SET slicer_settings_id = :kept_id "
+                        "WHERE slicer_settings_id = :id"
+                    ),
+                    {"kept_id": kept[fingerprint], "id": row["id"]},
+                )
+                connection.execute(
+                    sa.text(f"DELETE FROM {table_name} WHERE id = :id"),
+                    {"id": row["id"]},
+                )
+                print(
+                    f"Merged duplicate slicer settings {row['id']} "
+                    f"into {kept[fingerprint]}."
+                )
+
+            connection.execute(
+                sa.text(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table_name}_fingerprint "
+                    f"ON {table_name} (fingerprint)"
+                )
+            )
+        print(f"Fingerprints of table '{table_name}' are backfilled and indexed.")
+        return True
+
+    except Exception as e:
+        print(f"Error adding fingerprints to table '{table_name}': {e}")
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="image_data schema maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create-indexes", help="Create the model indexes")
+    commands.add_parser("add-blob-columns", help="Prepare the blob store columns")
+    commands.add_parser("add-dedup-columns", help="Add the perceptual hash column")
+    commands.add_parser("create-predictions", help="Create the predictions table")
+    commands.add_parser(
+        "create-gcode-cache", help="Create the G-code parameter cache table"
+    )
+    commands.add_parser(
+        "add-fingerprints", help="Backfill and index the slicer settings fingerprints"
+    )
+    create_parser = commands.add_parser(
+        "create-partitions", help="Create partitions for the coming periods"
+    )
+    create_parser.add_argument("--ahead", type=int, default=3)
+    create_parser.add_argument("--interval", choices=("month", "week"), default="month")
+    drop_parser = commands.add_parser(
+        "drop-partitions", help="Drop partitions that end before a date"
+    )
+    drop_parser.add_argument(
+        "--before", type=datetime.fromisoformat, required=True, help="YYYY-MM-DD"
+    )
+    drop_parser.add_argument(
+        "--delete-blobs",
+        action="store_true",
+        help="Also delete blobs that are no longer referenced",
+    )
+    args = parser.parse_args()
+
+    if args.command == "create-indexes":
+        create_image_data_indexes()
+    elif args.command == "add-blob-columns":
+        add_blob_store_columns()
+    elif args.command == "add-dedup-columns":
+        add_dedup_columns()
+    elif args.command == "create-predictions":
+        create_predictions_table()
+    elif args.command == "create-gcode-cache":
+        create_gcode_files_table()
+    elif args.command == "add-fingerprints":
+        add_slicer_settings_fingerprints()
+    elif args.command == "create-partitions":
+        create_future_partitions(args.ahead, args.interval)
+    elif args.command == "drop-partitions":
+        from blob_store import get_blob_store
+
+        store = get_blob_store() if args.delete_blobs else None
+        drop_partitions_before(args.before, store=store)
@@ -0,0 +1,137 @@
+"""
+Materialised frame statistics of image_data.
+
+The ``image_data_stats`` materialised view holds frame counts and blob byte
+totals per label, layer bucket, part and slicer setting. Queries aggregate
+over the (small) view instead of scanning image_data. The view is refreshed
+``CONCURRENTLY``, so it can be read while it is refreshed.
+
+NULL keys are stored as -1 because ``REFRESH ... CONCURRENTLY`` needs a
+unique index and NULLs are never equal in PostgreSQL unique indexes.
+
+Usage:
+    python stats.py create
+    python stats.py refresh
+"""
+
+import argparse
+import time
+
+import sqlalchemy as sa
+
+from database import db
+
+VIEW_NAME = "image_data_stats"
+LAYER_BUCKET_SIZE = 10
+NULL_KEY = -1
+
+GROUP_COLUMNS = ("label", "layer_bucket", "parts_id", "slicer_settings_id")
+
+# Kept out of Base.metadata, so create_all never creates it as a table
+image_data_stats = sa.Table(
+    VIEW_NAME,
+    sa.MetaData(),
+    sa.Column("label", sa.Integer),
+    sa.Column("layer_bucket", sa.Integer),
+    sa.Column("parts_id", sa.Integer),
+    sa.Column("slicer_settings_id", sa.Integer),
+    sa.Column("frame_count", sa.BigInteger),
+    sa.Column("total_bytes", sa.BigInteger),
+)
+
+
+def create_stats_view(connection) -> None:
+    """Creates the materialised view and its unique index if they do not exist."""
+    connection.execute(
+        sa.text(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS "
+            f"SELECT coalesce(label, {NULL_KEY}) AS label, "
+            f"coalesce(layer / {LAYER_BUCKET_SIZE} * {LAYER_BUCKET_SIZE}, {NULL_KEY}) "
+            "AS layer_bucket, "
+            f"coalesce(parts_id, {NULL_KEY}) AS parts_id, "
+            f"coalesce(slicer_settings_id, {NULL_KEY}) AS slicer_settings_id, "
+            "count(*) AS frame_count, "
+            "coalesce(sum(coalesce(image_size, octet_length(image))), 0) "
+            "AS total_bytes "
+            "FROM image_data GROUP BY 1, 2, 3, 4"
+        )
+    )
+    connection.execute(
+        sa.text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{VIEW_NAME} "
+            f"ON {VIEW_NAME} ({', '.join(GROUP_COLUMNS)})"
+        )
+    )
+
+
+def refresh_stats_view(connection, concurrently: bool = True) -> None:
+    """
+    Recomputes the materialised view.
+
+    Args:
+        connection: SQLAlchemy connection inside a transaction.
+        concurrently: Keep the view readable during the refresh.
+    """
+    mode = "CONCURRENTLY " if concurrently else ""
+    connection.execute(sa.text(f"REFRESH MATERIALIZED VIEW {mode}{VIEW_NAME}"))
+
+
+def select_stats(
+    group_by=("label",), label=None, parts_id=None, slicer_settings_id=None
+):
+    """
+    Builds the aggregate query over the materialised view.
+
+    Args:
+        group_by: Columns of ``GROUP_COLUMNS`` to group by.
+        label: Filter by label.
+        parts_id: Filter by parts ID.
+        slicer_settings_id: Filter by slicer settings ID.
+
+    Returns:
+        Select statement with the group columns, frame_count and total_bytes.
+
+    Raises:
+        ValueError: If a group column is unknown.
+    """
+    for name in group_by:
+        if name not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group statistics by '{name}'")
+
+    columns = [image_data_stats.c[name] for name in group_by]
+    stmt = sa.select(
+        *columns,
+        sa.func.sum(image_data_stats.c.frame_count).label("frame_count"),
+        sa.func.sum(image_data_stats.c.total_bytes).label("total_bytes"),
+    )
+    if label is not None:
+        stmt = stmt.where(image_data_stats.c.label == label)
+    if parts_id is not None:
+        stmt = stmt.where(image_data_stats.c.parts_id == parts_id)
+    if slicer_settings_id is not None:
+        stmt = stmt.where(image_data_stats.c.slicer_settings_id == slicer_settings_id)
+    return stmt.group_by(*columns).order_by(*columns)
+
+
+def stats_row_to_dict(row) -> dict:
+    """Converts a row of ``select_stats`` to a dict with -1 keys mapped to None."""
+    data = dict(row._mapping)
+    for name in GROUP_COLUMNS:
+        if data.get(name) == NULL_KEY:
+            data[name] = None
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the image_data statistics.")
+    parser.add_argument("command", choices=("create", "refresh"))
+    args = parser.parse_args()
+
+    start_time = time.time()
+    with db.begin() as connection:
+        if args.command == "create":
+            create_stats_view(connection)
+        else:
+            refresh_stats_view(connection)
+    elapsed = time.time() - start_time
+    print(f"{args.command.capitalize()} of '{VIEW_NAME}' took {elapsed:.1f} s")
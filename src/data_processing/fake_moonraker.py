@@ -0,0 +1,232 @@
+"""
+Local fake of the Moonraker JSON-RPC WebSocket API for development.
+
+Simulates a printer that repeatedly goes through standby -> printing ->
+complete, with the layer and Z height advancing while it prints, and pushes
+``notify_status_update`` notifications to subscribed clients like Moonraker.
+Supports ``printer.objects.subscribe``, ``printer.objects.query`` and
+``server.info``; ``restart_klippy`` and ``disconnect`` simulate a Klippy
+restart and a dropped connection.
+
+Usage:
+    python fake_moonraker.py --port 7125 --layers 20 --layer-time 0.5
+    python moonraker_ws.py http://localhost:7125
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import time
+
+import websockets
+
+
+def initial_status(filename: str, total_layers: int) -> dict:
+    """Returns the printer object status of an idle printer."""
+    return {
+        "print_stats": {
+            "state": "standby",
+            "filename": filename,
+            "print_duration": 0.0,
+            "info": {"current_layer": 0, "total_layer": total_layers},
+        },
+        "toolhead": {"position": [0.0, 0.0, 0.0, 0.0], "homed_axes": "xyz"},
+        "gcode_move": {
+            "gcode_position": [0.0, 0.0, 0.0, 0.0],
+            "position": [0.0, 0.0, 0.0, 0.0],
+            "speed": 1500.0,
+        },
+    }
+
+
+def select_fields(status: dict, objects: dict) -> dict:
+    """
+    Restricts a status dict to the subscribed objects and fields.
+
+    Args:
+        status: Status per printer object.
+        objects: Subscribed objects, mapping to a field list or None for all.
+
+    Returns:
+        dict: The selected part of ``status``.
+    """
+    selected = {}
+    for name, fields in objects.items():
+        if name not in status:
+            continue
+        if fields is None:
+            selected[name] = copy.deepcopy(status[name])
+        else:
+            selected[name] = {
+                field: copy.deepcopy(status[name][field])
+                for field in fields
+                if field in status[name]
+            }
+    return {name: fields for name, fields in selected.items() if fields}
+
+
+class FakeMoonraker:
+    """Simulated printer and the connected WebSocket clients."""
+
+    def __init__(
+        self,
+        filename: str = "Part_0.2mm_PLA_Generic Klipper Printer_22m13s.gcode",
+        layers: int = 20,
+        layer_time: float = 0.5,
+        layer_height: float = 0.2,
+        idle_time: float = 2.0,
+    ) -> None:
+        self.layers = layers
+        self.layer_time = layer_time
+        self.layer_height = layer_height
+        self.idle_time = idle_time
+        self.status = initial_status(filename, layers)
+        # Subscribed objects per connected client
+        self.subscriptions = {}
+
+    async def handler(self, websocket, path=None) -> None:
+        """Serves the JSON-RPC requests of one client."""
+        self.subscriptions[websocket] = {}
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                response = {"jsonrpc": "2.0", "id": request.get("id")}
+                try:
+                    response["result"] = self.dispatch(
+                        websocket, request["method"], request.get("params", {})
+                    )
+                except KeyError as e:
+                    response["error"] = {"code": -32601, "message": str(e)}
+                await websocket.send(json.dumps(response))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            del self.subscriptions[websocket]
+
+    def dispatch(self, websocket, method: str, params: dict):
+        if method == "server.info":
+            return {"klippy_connected": True, "klippy_state": "ready"}
+        if method in ("printer.objects.subscribe", "printer.objects.query"):
+            objects = params.get("objects", {})
+            if method == "printer.objects.subscribe":
+                self.subscriptions[websocket] = objects
+            return {
+                "eventtime": time.monotonic(),
+                "status": select_fields(self.status, objects),
+            }
+        raise KeyError(f"Method not found: {method}")
+
+    async def update(self, changes: dict) -> None:
+        """Applies status changes and notifies the subscribed clients."""
+        for name, fields in changes.items():
+            self.status[name].update(copy.deepcopy(fields))
+        for websocket, objects in list(self.subscriptions.items()):
+            selected = select_fields(changes, objects)
+            if not selected:
+                continue
+            notification = {
+                "jsonrpc": "2.0",
+                "method": "notify_status_update",
+                "params": [selected, time.monotonic()],
+            }
+            try:
+                await websocket.send(json.dumps(notification))
+            except websockets.ConnectionClosed:
+                pass
+
+    async def notify(self, method: str, params: list = None) -> None:
+        """Sends a notification to all connected clients."""
+        notification = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            notification["params"] = params
+        for websocket in list(self.subscriptions):
+            try:
+                await websocket.send(json.dumps(notification))
+            except websockets.ConnectionClosed:
+                pass
+
+    async def restart_klippy(self) -> None:
+        """Drops all subscriptions, like a Klippy restart, and reports ready."""
+        for websocket in self.subscriptions:
+            self.subscriptions[websocket] = {}
+        await self.notify("notify_klippy_ready")
+
+    async def disconnect(self) -> None:
+        """Closes the connections of all clients."""
+        for websocket in list(self.subscriptions):
+            await websocket.close()
+
+    async def simulate(self) -> None:
+        """Runs print jobs in a loop."""
+        while True:
+            await asyncio.sleep(self.idle_time)
+            await self.update({"print_stats": {"state": "printing"}})
+            start = time.monotonic()
+            e = 0.0
+            for layer in range(1, self.layers + 1):
+                z = round(layer * self.layer_height, 3)
+                await self.update(
+                    {
+                        "print_stats": {
+                            "print_duration": time.monotonic() - start,
+                            "info": {
+                                "current_layer": layer,
+                                "total_layer": self.layers,
+                            },
+                        },
+                        "toolhead": {"position": [100.0, 100.0, z, e]},
+                        "gcode_move": {
+                            "gcode_position": [100.0, 100.0, z, e],
+                            "position": [100.0, 100.0, z, e],
+                        },
+                    }
+                )
+                # The layer is extruded at the new height
+                await asyncio.sleep(self.layer_time / 2)
+                e = round(e + 10.0, 3)
+                await self.update(
+                    {
+                        "toolhead": {"position": [150.0, 150.0, z, e]},
+                        "gcode_move": {
+                            "gcode_position": [150.0, 150.0, z, e],
+                            "position": [150.0, 150.0, z, e],
+                        },
+                    }
+                )
+                await asyncio.sleep(self.layer_time / 2)
+            await self.update({"print_stats": {"state": "complete"}})
+            await asyncio.sleep(self.idle_time)
+            await self.update(
+                {
+                    "print_stats": {
+                        "state": "standby",
+                        "print_duration": 0.0,
+                        "info": {"current_layer": 0, "total_layer": self.layers},
+                    }
+                }
+            )
+
+
+async def serve(host: str, port: int, printer: FakeMoonraker) -> None:
+    async with websockets.serve(printer.handler, host, port):
+        print(f"Fake Moonraker listening on ws://{host}:{port}/websocket")
+        await printer.simulate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Moonraker WebSocket server.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=7125)
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--layer-time", type=float, default=0.5)
+    parser.add_argument("--idle-time", type=float, default=2.0)
+    args = parser.parse_args()
+
+    printer = FakeMoonraker(
+        layers=args.layers, layer_time=args.layer_time, idle_time=args.idle_time
+    )
+    try:
+        asyncio.run(serve(args.host, args.port, printer))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,376 @@
+"""
+Durable on-disk spool for captured frames.
+
+Frames are appended to segment files first and drained to the database in
+bulk in the background, so nothing is lost while PostgreSQL is unreachable.
+
+Layout of a spool directory:
+    segment-000000000001.log   records, append-only
+    segment-000000000001.idx   record offsets of a sealed segment (uint64)
+    cursor.json                first record not yet drained
+
+Record: header (magic, metadata length, image length, CRC32 of metadata and
+image), JSON metadata, image bytes. On open, the active segment is scanned
+and a torn or corrupt tail left by a crash is truncated. Sealed segments are
+loaded from their index files. When the spool exceeds ``max_bytes`` the
+oldest segments are evicted, drained or not.
+
+Usage (benchmark):
+    python frame_spool.py /tmp/spool --frames 20000 --frame-size 150000
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+MAGIC = b"FRM1"
+HEADER = struct.Struct("<4sIII")
+SEGMENT_PREFIX = "segment-"
+CURSOR_FILE = "cursor.json"
+
+
+def _segment_name(sequence: int, suffix: str) -> str:
+    return f"{SEGMENT_PREFIX}{sequence:012d}{suffix}"
+
+
+def encode_metadata(row: dict) -> dict:
+    """Makes the metadata of a frame row JSON serialisable."""
+    meta = dict(row)
+    if isinstance(meta.get("timestamp"), datetime):
+        meta["timestamp"] = meta["timestamp"].isoformat()
+    return meta
+
+
+def decode_metadata(meta: dict) -> dict:
+    """Reverses ``encode_metadata``."""
+    if meta.get("timestamp"):
+        meta["timestamp"] = datetime.fromisoformat(meta["timestamp"])
+    return meta
+
+
+class FrameSpool(object):
+    """
+    Write-ahead spool of frames in append-only segment files.
+
+    Args:
+        directory: Spool directory.
+        segment_bytes: Size after which a new segment is started.
+        max_bytes: Total size after which the oldest segments are evicted.
+        sync_every: fsync after this many appended records (1 for every record).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 10 * 1024 * 1024 * 1024,
+        sync_every: int = 64,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_every = sync_every
+        self.evicted = 0
+        # End of the last batch returned by read_batch, not committed yet
+        self._reading = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        # Record offsets per segment sequence number, oldest first
+        self._offsets = {}
+        self._sizes = {}
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # Recovery -------------------------------------------------------------
+
+    def _recover(self) -> None:
+        sequences = sorted(
+            int(name[len(SEGMENT_PREFIX) : -len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(".log")
+        )
+        for sequence in sequences:
+            offsets = None
+            if sequence != sequences[-1]:
+                offsets = self._load_index(sequence)
+            if offsets is None:
+                offsets, size = self._scan(sequence)
+            else:
+                size = os.path.getsize(self._path(sequence, ".log"))
+            self._offsets[sequence], self._sizes[sequence] = offsets, size
+
+        self._active = sequences[-1] if sequences else 1
+        self._offsets.setdefault(self._active, [])
+        self._sizes.setdefault(self._active, 0)
+        self._file = open(self._path(self._active, ".log"), "ab")
+
+        self._cursor = (min(self._offsets), 0)
+        if os.path.exists(os.path.join(self.directory, CURSOR_FILE)):
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            self._cursor = (cursor["segment"], cursor["record"])
+        if self._cursor[0] not in self._offsets:
+            # The cursor segment was evicted or drained before a crash
+            later = [s for s in self._offsets if s > self._cursor[0]]
+            self._cursor = (min(later) if later else self._active, 0)
+        segment, record = self._cursor
+        self._cursor = (segment, min(record, len(self._offsets[segment])))
+
+    def _load_index(self, sequence: int):
+        # Returns None if the index is missing or does not match the segment
+        path = self._path(sequence, ".idx")
+        if not os.path.exists(path) or os.path.getsize(path) % 8:
+            return None
+        offsets = array("Q")
+        with open(path, "rb") as f:
+            offsets.frombytes(f.read())
+        if not offsets or offsets[-1] >= os.path.getsize(self._path(sequence, ".log")):
+            return None
+        return list(offsets)
+
+    def _scan(self, sequence: int) -> Tuple[list, int]:
+        # Reads all records and truncates the file after the last valid one
+        offsets = []
+        path = self._path(sequence, ".log")
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                magic, meta_len, image_len, crc = HEADER.unpack(header)
+                payload = f.read(meta_len + image_len)
+                if (
+                    magic != MAGIC
+                    or len(payload) < meta_len + image_len
+                    or zlib.crc32(payload) != crc
+                ):
+                    break
+                offsets.append(offset)
+                offset += HEADER.size + meta_len + image_len
+        if offset < os.path.getsize(path):
+            print(f"Truncating torn tail of spool segment {path} at {offset}")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        return offsets, offset
+
+    def _path(self, sequence: int, suffix: str) -> str:
+        return os.path.join(self.directory, _segment_name(sequence, suffix))
+
+    # Appending ------------------------------------------------------------
+
+    def append(self, row: dict) -> None:
+        """Appends one frame row (image bytes plus metadata) to the spool."""
+        self.append_many([row])
+
+    def append_many(self, rows: List[dict]) -> None:
+        """
+        Appends frame rows to the spool.
+
+        Args:
+            rows: Dicts with the ``image`` bytes and JSON-compatible metadata
+                (datetimes are converted).
+        """
+        with self._lock:
+            for row in rows:
+                meta = dict(row)
+                image = meta.pop("image")
+                meta_bytes = json.dumps(encode_metadata(meta)).encode("utf-8")
+                payload = meta_bytes + image
+                header = HEADER.pack(
+                    MAGIC, len(meta_bytes), len(image), zlib.crc32(payload)
+                )
+                if self._sizes[self._active] >= self.segment_bytes:
+                    self._roll()
+                self._offsets[self._active].append(self._sizes[self._active])
+                self._file.write(header)
+                self._file.write(payload)
+                self._sizes[self._active] += len(header) + len(payload)
+                self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+            self._evict()
+
+    def flush(self) -> None:
+        """Writes all appended records durably to disk."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _roll(self) -> None:
+        # Seal the active segment with its index and start a new one
+        self._sync()
+        self._file.close()
+        with open(self._path(self._active, ".idx"), "wb") as f:
+            f.write(array("Q", self._offsets[self._active]).tobytes())
+        self._active += 1
+        self._offsets[self._active] = []
+        self._sizes[self._active] = 0
+        self._file = open(self._path(self._active, ".log"), "ab")
+
+    def _evict(self) -> None:
+        # The active segment is never evicted
+        while sum(self._sizes.values()) > self.max_bytes and len(self._offsets) > 1:
+            oldest = min(self._offsets)
+            if self._cursor[0] <= oldest:
+                # Frames that were not drained yet are lost; those of a batch
+                # being drained are counted by drain instead
+                segment, record = max(self._cursor, self._reading or self._cursor)
+                if segment == oldest:
+                    self.evicted += len(self._offsets[oldest]) - record
+                elif segment < oldest:
+                    self.evicted += len(self._offsets[oldest])
+                self._cursor = (oldest + 1, 0)
+                self._write_cursor()
+            self._delete_segment(oldest)
+
+    def _delete_segment(self, sequence: int) -> None:
+        del self._offsets[sequence]
+        del self._sizes[sequence]
+        for suffix in (".log", ".idx"):
+            if os.path.exists(self._path(sequence, suffix)):
+                os.remove(self._path(sequence, suffix))
+
+    # Draining -------------------------------------------------------------
+
+    def pending(self) -> int:
+        """Number of records not yet drained."""
+        with self._lock:
+            segment, record = self._cursor
+            return sum(
+                len(offsets) - (record if sequence == segment else 0)
+                for sequence, offsets in self._offsets.items()
+                if sequence >= segment
+            )
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def read_batch(self, max_records: int = 500) -> Tuple[List[dict], tuple]:
+        """
+        Reads the next records after the drain cursor.
+
+        Returns:
+            tuple: (rows, position); pass the position to ``commit`` once the
+            rows are stored.
+        """
+        with self._lock:
+            if self._unsynced:
+                self._file.flush()
+            segment, record = self._cursor
+            rows = []
+            while len(rows) < max_records and segment in self._offsets:
+                offsets = self._offsets[segment]
+                if record >= len(offsets):
+                    if segment == self._active:
+                        break
+                    segment, record = segment + 1, 0
+                    continue
+                end = min(len(offsets), record + max_records - len(rows))
+                with open(self._path(segment, ".log"), "rb") as f:
+                    f.seek(offsets[record])
+                    for _ in range(record, end):
+                        rows.append(self._read_record(f))
+                record = end
+            self._reading = (segment, record) if rows else None
+            return rows, (segment, record)
+
+    @staticmethod
+    def _read_record(f) -> dict:
+        _, meta_len, image_len, _ = HEADER.unpack(f.read(HEADER.size))
+        row = decode_metadata(json.loads(f.read(meta_len)))
+        row["image"] = f.read(image_len)
+        return row
+
+    def commit(self, position: tuple) -> None:
+        """Moves the drain cursor and deletes fully drained segments."""
+        with self._lock:
+            self._reading = None
+            if position <= self._cursor:
+                # Eviction already moved the cursor past the segments of the batch
+                return
+            self._cursor = position
+            self._write_cursor()
+            for sequence in [s for s in self._offsets if s < position[0]]:
+                self._delete_segment(sequence)
+
+    def _write_cursor(self) -> None:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": self._cursor[0], "record": self._cursor[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def drain(
+        self, writer: Callable[[List[dict]], None], batch_size: int = 500
+    ) -> int:
+        """
+        Writes all pending records with ``writer`` in batches.
+
+        The cursor only moves after ``writer`` returned, so a failing writer
+        leaves the records in the spool.
+
+        Returns:
+            int: Number of drained records.
+        """
+        drained = 0
+        while True:
+            rows, position = self.read_batch(batch_size)
+            if not rows:
+                return drained
+            writer(rows)
+            self.commit(position)
+            drained += len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+
+def benchmark(directory: str, frames: int, frame_size: int, batch_size: int) -> None:
+    """Measures fill and drain throughput of a spool with synthetic frames."""
+    spool = FrameSpool(directory)
+    image = os.urandom(frame_size)
+    row = {"timestamp": datetime.now(), "layer": 1, "parts_id": None}
+    megabytes = frames * frame_size / 1e6
+
+    start = time.perf_counter()
+    for _ in range(0, frames, batch_size):
+        spool.append_many([dict(row, image=image) for _ in range(batch_size)])
+    spool.flush()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Fill:  {frames / elapsed:.0f} frames/s, {megabytes / elapsed:.0f} MB/s "
+        f"({spool.size_bytes() / 1e6:.0f} MB on disk)"
+    )
+
+    start = time.perf_counter()
+    drained = spool.drain(lambda rows: None, batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Drain: {drained / elapsed:.0f} frames/s, {megabytes / elapsed:.0f} MB/s")
+    spool.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Frame spool benchmark.")
+    parser.add_argument("directory", help="Empty directory for the benchmark spool")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--frame-size", type=int, default=150000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    benchmark(args.directory, args.frames, args.frame_size, args.batch_size)
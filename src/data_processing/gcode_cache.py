@@ -0,0 +1,189 @@
+"""
+Cache of the slicer parameters of the G-code files on the printers.
+
+Farms print the same files over and over, so the parameters of a file are
+downloaded and parsed once per printer and stored in the ``gcode_files``
+table together with the resolved ``slicer_settings_id``:
+
+    (printer, filename) -> size, modified, parameters, slicer_settings_id
+
+A row is only used while ``size`` and ``modified`` still match Moonraker's
+metadata of the file (``/server/files/metadata``), so a re-uploaded file is
+parsed again. An in-process TTLCache in front of the table saves the database
+round trip, and ``watch`` drops entries as soon as Moonraker reports changed
+files with ``notify_filelist_changed``.
+
+Create the table with:
+    python database_src/schema_management.py create-gcode-cache
+"""
+
+import asyncio
+import os
+import sys
+from typing import Callable, Optional
+
+# Add the database_src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), "database_src"))
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from cache import DEFAULT_MAXSIZE, DEFAULT_TTL, TTLCache
+from models import GcodeFile
+from gcode_extraction.parameter_parser import SLICING_PARAMETERS
+from gcode_extraction.slicer_params import RAW_KEYS, ingest_slicer_settings
+
+# The parameters returned by extract_gcode_params and those of slicer_settings
+CACHED_PARAMETERS = tuple(dict.fromkeys(tuple(SLICING_PARAMETERS) + RAW_KEYS))
+
+
+class GcodeParameterCache(object):
+    """
+    Read-through cache of G-code parameters and slicer settings IDs.
+
+    Args:
+        session_factory: Returns a new SQLAlchemy session, e.g. ``Session``.
+        ttl: Seconds an entry stays in the in-process cache.
+        maxsize: Maximum number of entries in the in-process cache.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        ttl: float = DEFAULT_TTL,
+        maxsize: int = DEFAULT_MAXSIZE,
+    ):
+        self.session_factory = session_factory
+        self.memory = TTLCache(maxsize, ttl)
+        self.downloads = 0
+
+    def lookup(self, printer, filename: Optional[str] = None) -> dict:
+        """
+        Returns the parameters and slicer settings ID of a printer's G-code file.
+
+        Args:
+            printer: KlipperPrinter the file is on.
+            filename: G-code file; defaults to the current print job.
+
+        Returns:
+            dict: ``parameters`` (raw values as returned by
+            ``fetch_gcode_metadata``) and ``slicer_settings_id`` (None if the
+            parameters could not be converted).
+
+        Raises:
+            PrinterUnavailableError: If the printer does not answer.
+        """
+        filename = filename or printer.get_filename()
+        metadata = printer.get_file_metadata(filename)
+        size, modified = metadata.get("size"), metadata.get("modified")
+        if size is None or modified is None:
+            # Moonraker has not scanned the file yet, so there is no key
+            with self.session_factory() as session:
+                return self._load(session, printer, filename)
+
+        key = (printer.addr, filename, size, modified)
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry
+        with self.session_factory() as session:
+            row = session.get(GcodeFile, (printer.addr, filename))
+            if row is not None and row.size == size and row.modified == modified:
+                entry = {
+                    "parameters": row.parameters,
+                    "slicer_settings_id": row.slicer_settings_id,
+                }
+            else:
+                entry = self._load(session, printer, filename)
+                self._store(session, key, entry)
+        self.memory.set(key, entry)
+        return entry
+
+    def _load(self, session, printer, filename: str) -> dict:
+        # Downloads the head and tail of the file and resolves the settings
+        parameters = printer.fetch_gcode_metadata(
+            filename, parameters=CACHED_PARAMETERS
+        )
+        self.downloads += 1
+        try:
+            slicer_settings_id, _ = ingest_slicer_settings(session, parameters)
+        except (KeyError, ValueError) as e:
+            print(f"No slicer settings for {filename}: {e}")
+            slicer_settings_id = None
+        return {"parameters": parameters, "slicer_settings_id": slicer_settings_id}
+
+    @staticmethod
+    def _store(session, key: tuple, entry: dict) -> None:
+        printer, filename, size, modified = key
+        values = dict(
+            size=size,
+            modified=modified,
+            parameters=entry["parameters"],
+            slicer_settings_id=entry["slicer_settings_id"],
+        )
+        session.execute(
+            postgresql.insert(GcodeFile)
+            .values(printer=printer, filename=filename, **values)
+            .on_conflict_do_update(
+                index_elements=[GcodeFile.printer, GcodeFile.filename],
+                set_=dict(values, updated_at=sa.func.now()),
+            )
+        )
+        session.commit()
+
+    def invalidate(self, printer: str, path: str) -> int:
+        """
+        Removes a file, or all files of a directory, of a printer from the cache.
+
+        Args:
+            printer: Printer address as in ``KlipperPrinter.addr``.
+            path: File or directory path relative to the gcodes root.
+
+        Returns:
+            int: Number of deleted rows.
+        """
+        # Entries are keyed by size and modified, which are unknown here
+        self.memory.clear()
+        prefix = path.rstrip("/") + "/"
+        with self.session_factory() as session:
+            result = session.execute(
+                sa.delete(GcodeFile).where(
+                    GcodeFile.printer == printer,
+                    sa.or_(
+                        GcodeFile.filename == path,
+                        GcodeFile.filename.startswith(prefix, autoescape=True),
+                    ),
+                )
+            )
+            session.commit()
+        return result.rowcount
+
+    def watch(self, client, address: str) -> None:
+        """
+        Invalidates the files of a printer that Moonraker reports as changed.
+
+        Args:
+            client: MoonrakerWebSocket of the printer.
+            address: Printer address as passed to KlipperPrinter.
+        """
+        printer = address.strip("/")
+
+        def on_filelist_changed(params: list) -> None:
+            for change in params:
+                for item in (change.get("item"), change.get("source_item")):
+                    if item and item.get("root") == "gcodes" and item.get("path"):
+                        # Listeners run in the event loop, the delete does not
+                        asyncio.get_running_loop().run_in_executor(
+                            None, self._invalidate_quietly, printer, item["path"]
+                        )
+
+        client.add_notification_listener("notify_filelist_changed", on_filelist_changed)
+
+    def _invalidate_quietly(self, printer: str, path: str) -> None:
+        try:
+            self.invalidate(printer, path)
+        except Exception as e:
+            print(f"Error invalidating cached parameters of {path}: {e}")
+
+    def stats(self) -> dict:
+        """Hit rates of the in-process cache and the number of downloads."""
+        return dict(self.memory.stats(), downloads=self.downloads)
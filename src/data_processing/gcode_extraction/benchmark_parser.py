@@ -0,0 +1,125 @@
+"""
+Benchmarks the G-code parameter parser against the old line-by-line extractor.
+
+Run it on real G-code files, or create an OrcaSlicer-like file of a given size
+first:
+
+    cd src/data_processing
+    python -m gcode_extraction.benchmark_parser print.gcode other.gcode
+    python -m gcode_extraction.benchmark_parser /tmp/synthetic.gcode --synthesize 100
+"""
+
+import argparse
+import os
+import random
+import time
+
+from gcode_extraction.parameter_parser import (
+    SLICING_PARAMETERS,
+    parse_gcode_file,
+    parse_gcode_parameters,
+)
+
+
+def legacy_extract(content: str) -> dict:
+    """The extractor as it was before parameter_parser.py, for comparison."""
+    slicing_params = {}
+    for line in content.split("\n"):
+        line = line.strip().lower()
+        if line.startswith(";"):
+            line = line.lstrip(";").strip()
+            for param in SLICING_PARAMETERS:
+                if line.startswith(f"{param} ="):
+                    value = line.split("=")[1].strip()
+                    if "," in value:
+                        value = value.split(",")[0]
+                    slicing_params[param] = value
+    return slicing_params
+
+
+def synthesize(path: str, size_mb: int, seed: int = 0) -> None:
+    """Writes an OrcaSlicer-like G-code file: header, moves, config block."""
+    rng = random.Random(seed)
+    values = {
+        "sparse_infill_density": "15%",
+        "sparse_infill_pattern": "grid",
+        "sparse_infill_speed": "270",
+        "first_layer_bed_temperature": "55",
+        "nozzle_temperature_initial_layer": "220",
+        "nozzle_temperature": "220",
+        "travel_speed": "500",
+        "retraction_length": "0.8",
+        "first_layer_height": "0.2",
+        "layer_height": "0.2",
+        "line_width": "0.42",
+        "filament_flow_ratio": "0.98",
+    }
+    target = size_mb * 1024 * 1024
+    with open(path, "w") as f:
+        f.write("; HEADER_BLOCK_START\n; generated by OrcaSlicer\n")
+        f.write("; HEADER_BLOCK_END\n\n")
+        written, layer = 0, 0
+        while written < target:
+            layer += 1
+            lines = [f";LAYER_CHANGE\n;Z:{layer * 0.2:.2f}\n;HEIGHT:0.2\n"]
+            for _ in range(2000):
+                x, y = rng.uniform(0, 250), rng.uniform(0, 250)
+                lines.append(f"G1 X{x:.3f} Y{y:.3f} E{rng.uniform(0, 1):.5f}\n")
+            chunk = "".join(lines)
+            f.write(chunk)
+            written += len(chunk)
+        f.write("; CONFIG_BLOCK_START\n")
+        for i in range(300):
+            f.write(f"; unrelated_setting_{i} = {i}\n")
+        for key, value in values.items():
+            f.write(f"; {key} = {value},{value}\n")
+        f.write("; CONFIG_BLOCK_END\n")
+
+
+def _timed(function, *args) -> tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark(path: str) -> None:
+    size_mb = os.path.getsize(path) / 1e6
+    with open(path, encoding="utf-8", errors="replace") as f:
+        content = f.read()
+
+    legacy, legacy_seconds = _timed(legacy_extract, content)
+    parsed, string_seconds = _timed(parse_gcode_parameters, content)
+    _, file_seconds = _timed(parse_gcode_file, path)
+
+    print(f"{path} ({size_mb:.0f} MB)")
+    for name, seconds in (
+        ("legacy extractor (str)", legacy_seconds),
+        ("parse_gcode_parameters (str)", string_seconds),
+        ("parse_gcode_file (path)", file_seconds),
+    ):
+        print(f"  {name:30} {seconds:7.3f} s  {size_mb / seconds:7.0f} MB/s")
+    # The legacy extractor keeps the last occurrence of a key, the parser the first
+    differences = {
+        key: (legacy.get(key), parsed.get(key))
+        for key in set(legacy) | set(parsed)
+        if legacy.get(key) != parsed.get(key)
+    }
+    if differences:
+        print(f"  values differ (legacy, parser): {differences}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="G-code parameter parser benchmark.")
+    parser.add_argument("paths", nargs="+", help="G-code files")
+    parser.add_argument(
+        "--synthesize",
+        type=int,
+        metavar="MB",
+        help="First write a synthetic G-code file of this size to each path",
+    )
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if args.synthesize:
+            synthesize(path, args.synthesize)
+        benchmark(path)
@@ -1,74 +1,23 @@
 import json
 
+from gcode_extraction.parameter_parser import SLICING_PARAMETERS, parse_gcode_file
+
 # global variables
-parameters = [
-    "sparse_infill_density",
-    "sparse_infill_pattern",
-    "sparse_infill_speed",
-    "first_layer_bed_temperature",
-    "nozzle_temperature_initial_layer",
-    "nozzle_temperature",
-    "travel_speed",
-    "retraction_length",
-    "first_layer_height",
-    "layer_height",
-    "line_width",
-    "filament_flow_ratio",
-]
+parameters = SLICING_PARAMETERS
 
 
 def extract_relevant_slicing_parameters_from_file(input_file_path, output_file_path):
     """
-    Extracts only first_layer_temperature and infill_density from a G-code file.
+    Extracts the slicing parameters from a G-code file and saves them as JSON.
 
     Args:
         input_file_path (str): The path to the G-code file.
         output_file_path (str): The path where to save the JSON output.
 
     Returns:
-        dict: A dictionary containing only first_layer_temperature and infill_density.
+        dict: The found parameters and their raw values.
     """
-    slicing_params = {}
-    parameters = [
-        "sparse_infill_density",
-        "sparse_infill_pattern",
-        "sparse_infill_speed",
-        "first_layer_bed_temperature",
-        "nozzle_temperature_initial_layer",
-        "nozzle_temperature",
-        "travel_speed",
-        "retraction_length",
-        "first_layer_height",
-        "layer_height",
-        "line_width",
-        "filament_flow_ratio",
-    ]
-    # Parameters to look for
-
-    with open(input_file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip().lower()
-            if line.startswith(";"):  # Only process comment lines
-                line = line.lstrip(";").strip()  # Remove semicolon and extra whitespace
-
-                # Check each parameter
-                for param in parameters:
-                    # Create patterns to match the parameter followed by : or =
-                    pattern_equal = f"{param} ="
-                    if line.startswith(pattern_equal):
-                        # print(f"Found parameter: {param} in line: {line}")
-                        # Extract the value after '='
-                        if "=" in line:
-                            value = line.split("=")[1].strip()
-                            # Remove the second value if it exists
-                            if "," in value:
-                                value = value.split(",")[0]
-
-                        slicing_params[param] = value
-
-                        # Break if we found all parameters
-                        if len(slicing_params) == len(parameters):
-                            break
+    slicing_params = parse_gcode_file(input_file_path, parameters)
 
     # Save the dictionary to a file
     with open(output_file_path, "w") as f:
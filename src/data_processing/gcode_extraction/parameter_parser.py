@@ -0,0 +1,144 @@
+"""
+Single-pass parser for the ``; key = value`` comment lines of G-code files.
+
+Slicers write their settings as comments, OrcaSlicer in a config block at the
+end of the file and PrusaSlicer both in the header and at the end:
+
+    ; layer_height = 0.2
+    ; nozzle_temperature = 220,220
+
+The parser jumps from comment line to comment line with ``str.find``, so the
+move commands are skipped at C speed; only comment lines are decoded and
+split, the key is looked up in a set of requested parameters, and parsing
+stops as soon as all of them are found. Comments must start at the beginning
+of a line. Keys and values are lowercased and only the first value of a
+multi-extruder list is kept, as the old extractors did.
+
+Unlike the old extractors, which kept the last occurrence of a key, the first
+occurrence wins. Stopping early is only possible this way, and it is what
+makes PrusaSlicer headers and the head range read by
+``KlipperPrinter.fetch_gcode_metadata`` cheap. A slicer writes the header and
+the config block from the same configuration, so their values agree; the
+result only differs for files that repeat a key with another value, e.g. in a
+custom G-code comment.
+"""
+
+import io
+import os
+from typing import Iterable, Optional, Union
+
+# Bytes read from a stream at a time
+BLOCK_SIZE = 1024 * 1024
+
+SLICING_PARAMETERS = [
+    "sparse_infill_density",
+    "sparse_infill_pattern",
+    "sparse_infill_speed",
+    "first_layer_bed_temperature",
+    "nozzle_temperature_initial_layer",
+    "nozzle_temperature",
+    "travel_speed",
+    "retraction_length",
+    "first_layer_height",
+    "layer_height",
+    "line_width",
+    "filament_flow_ratio",
+]
+
+
+def parse_gcode_parameters(
+    source: Union[str, bytes, os.PathLike, io.IOBase],
+    parameters: Optional[Iterable[str]] = SLICING_PARAMETERS,
+    first_value_only: bool = True,
+) -> dict:
+    """
+    Extracts slicer parameters from G-code in a single pass.
+
+    Args:
+        source: G-code content (str or bytes), a path (``os.PathLike``) or an
+            open text or binary file. Use ``parse_gcode_file`` for str paths.
+        parameters: Keys to look for; None returns every ``key = value``
+            comment and reads the whole source.
+        first_value_only: Keep only the first value of comma-separated lists.
+
+    Returns:
+        dict: Found parameters mapped to their raw string values. The first
+        occurrence of a key wins.
+    """
+    if isinstance(source, os.PathLike):
+        return parse_gcode_file(source, parameters, first_value_only)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        comments = _comment_lines(bytes(source))
+    elif isinstance(source, str):
+        comments = _comment_lines(source)
+    else:
+        comments = _stream_comment_lines(source)
+
+    wanted = None if parameters is None else {p.lower() for p in parameters}
+    found = {}
+    for comment in comments:
+        if isinstance(comment, bytes):
+            comment = comment.decode("utf-8", errors="replace")
+        key, sep, value = comment.partition("=")
+        if not sep:
+            continue
+        key = key.lstrip(";").strip().lower()
+        if key in found or (wanted is not None and key not in wanted):
+            continue
+        value = value.strip().lower()
+        if first_value_only:
+            value = value.split(",", 1)[0]
+        found[key] = value
+        if wanted is not None and len(found) == len(wanted):
+            break
+    return found
+
+
+def parse_gcode_file(
+    path: Union[str, os.PathLike],
+    parameters: Optional[Iterable[str]] = SLICING_PARAMETERS,
+    first_value_only: bool = True,
+) -> dict:
+    """
+    Extracts slicer parameters from a G-code file, see ``parse_gcode_parameters``.
+    """
+    with open(path, "rb") as f:
+        return parse_gcode_parameters(f, parameters, first_value_only)
+
+
+def _comment_lines(content):
+    # Yields the comment lines (without the first semicolon) of str or bytes
+    # content. str.find jumps from one "\n;" to the next at memchr speed, so
+    # the move commands in between are never looked at in Python.
+    newline, semicolon = ("\n", ";") if isinstance(content, str) else (b"\n", b";")
+    if content.startswith(semicolon):
+        start = 0
+    else:
+        start = content.find(newline + semicolon) + 1
+        if not start:
+            return
+    while True:
+        end = content.find(newline, start)
+        if end == -1:
+            yield content[start + 1 :]
+            return
+        yield content[start + 1 : end]
+        start = content.find(newline + semicolon, end) + 1
+        if not start:
+            return
+
+
+def _stream_comment_lines(stream, block_size: int = BLOCK_SIZE):
+    # Reads the stream in blocks and scans the complete lines of each block
+    rest = None
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        if rest:
+            block = rest + block
+        end = block.rfind(b"\n" if isinstance(block, bytes) else "\n") + 1
+        rest = block[end:]
+        yield from _comment_lines(block[:end])
+    if rest:
+        yield from _comment_lines(rest)
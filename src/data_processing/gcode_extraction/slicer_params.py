@@ -0,0 +1,389 @@
+"""
+Typed conversion of raw slicer parameters to ``slicer_settings`` columns.
+
+G-code files carry the slicer configuration as raw strings (see
+parameter_parser.py) under slicer-specific keys, with units, percentages and
+one value per extruder:
+
+    ; sparse_infill_density = 15%         (OrcaSlicer; PrusaSlicer: fill_density)
+    ; line_width = 105%                   (of the nozzle diameter)
+    ; nozzle_temperature = 220,215        (one value per extruder)
+
+``SLICER_PARAMETERS`` describes for every ``SlicerSettings`` column which keys
+it is read from and how the value is converted. ``normalize_slicer_params``
+converts the parameters of one file, ``normalize_slicer_params_batch`` those
+of many files at once with pandas, and ``ingest_slicer_settings`` goes from a
+G-code file to a ``slicer_settings`` ID in one call.
+
+Usage:
+    cd src/data_processing
+    python -m gcode_extraction.slicer_params print1.gcode print2.gcode [--ingest]
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from gcode_extraction.parameter_parser import parse_gcode_file, parse_gcode_parameters
+
+# Add the database_src directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "database_src"))
+
+from crud import (
+    SLICER_SETTINGS_COLUMNS,
+    get_or_create_slicer_settings,
+    normalize_slicer_settings_value,
+)
+
+# A number with an optional unit, e.g. '0.42', '15%', '0.8mm', '270 mm/s'
+NUMBER_PATTERN = r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)\s*(%|mm/s|mm)?\s*$"
+_NUMBER = re.compile(NUMBER_PATTERN, re.IGNORECASE)
+
+DEFAULT_NOZZLE_DIAMETER = 0.4  # mm
+
+
+class SlicerParameter(object):
+    """
+    How one ``slicer_settings`` column is read from raw slicer parameters.
+
+    Args:
+        column: Column name.
+        keys: Raw keys in order of preference (OrcaSlicer first, then
+            PrusaSlicer).
+        value_type: int, float or str.
+        percent_of: Column a percentage is relative to, e.g. the nozzle
+            diameter for line widths. Without it '15%' converts to 15.
+        fallback: Column whose value is used if none of the keys is present.
+        default: Value used if none of the keys is present.
+    """
+
+    def __init__(
+        self,
+        column: str,
+        keys: tuple,
+        value_type: type,
+        percent_of: str = None,
+        fallback: str = None,
+        default=None,
+    ):
+        self.column = column
+        self.keys = keys
+        self.value_type = value_type
+        self.percent_of = percent_of
+        self.fallback = fallback
+        self.default = default
+
+    def raw_value(self, raw: dict):
+        """Returns the value of the first key present in ``raw``, or None."""
+        for key in self.keys:
+            if raw.get(key) not in (None, ""):
+                return raw[key]
+        return None
+
+    def convert(self, text: str, extruder: int, values: dict):
+        """
+        Converts a raw value to the column type.
+
+        Args:
+            text: Raw value, possibly a comma-separated list per extruder.
+            extruder: Index of the extruder whose value is used.
+            values: Already converted columns, for ``percent_of``.
+
+        Raises:
+            ValueError: If the value is not a valid number or is empty.
+        """
+        if self.value_type is str:
+            text = str(text).strip().strip('"').strip()
+            if not text:
+                raise ValueError(f"Empty value for {self.column}")
+            return text
+        items = str(text).split(",")
+        text = items[extruder if extruder < len(items) else 0]
+        match = _NUMBER.match(text)
+        if match is None:
+            raise ValueError(f"Invalid value for {self.column}: {text!r}")
+        number = float(match.group(1))
+        if match.group(2) == "%" and self.percent_of is not None:
+            number = values[self.percent_of] * number / 100
+        if self.column not in SLICER_SETTINGS_COLUMNS:
+            # Auxiliary parameters are not stored
+            return self.value_type(number)
+        # Normalised like slicer_settings_fingerprint, e.g. 0.6 * 105% = 0.63
+        return normalize_slicer_settings_value(self.column, number)
+
+
+# Only used to resolve percentages, not stored
+AUXILIARY_PARAMETERS = (
+    SlicerParameter(
+        "nozzle_diameter", ("nozzle_diameter",), float, default=DEFAULT_NOZZLE_DIAMETER
+    ),
+)
+
+# In dependency order: percent_of and fallback columns come first
+SLICER_PARAMETERS = (
+    SlicerParameter("slicer_profile", ("print_settings_id",), str),
+    SlicerParameter(
+        "sparse_infill_density", ("sparse_infill_density", "fill_density"), int
+    ),
+    SlicerParameter(
+        "sparse_infill_pattern", ("sparse_infill_pattern", "fill_pattern"), str
+    ),
+    SlicerParameter(
+        "sparse_infill_speed", ("sparse_infill_speed", "infill_speed"), int
+    ),
+    SlicerParameter(
+        "first_layer_bed_temperature",
+        ("first_layer_bed_temperature", "hot_plate_temp_initial_layer"),
+        int,
+    ),
+    SlicerParameter(
+        "bed_temperature_other_layers",
+        ("bed_temperature", "hot_plate_temp"),
+        int,
+        fallback="first_layer_bed_temperature",
+    ),
+    SlicerParameter(
+        "first_layer_nozzle_temperature",
+        ("nozzle_temperature_initial_layer", "first_layer_temperature"),
+        int,
+    ),
+    SlicerParameter(
+        "nozzle_temperature_other_layers", ("nozzle_temperature", "temperature"), int
+    ),
+    SlicerParameter("travel_speed", ("travel_speed",), int),
+    SlicerParameter("layer_height_other_layers", ("layer_height",), float),
+    SlicerParameter(
+        "first_layer_height",
+        ("first_layer_height", "initial_layer_print_height"),
+        float,
+        percent_of="layer_height_other_layers",
+    ),
+    SlicerParameter(
+        "line_width",
+        ("line_width", "extrusion_width"),
+        float,
+        percent_of="nozzle_diameter",
+    ),
+    SlicerParameter(
+        "retraction_length", ("retraction_length", "retract_length"), float
+    ),
+    SlicerParameter(
+        "filament_flow_ratio", ("filament_flow_ratio", "extrusion_multiplier"), float
+    ),
+    SlicerParameter("printer_name", ("printer_settings_id", "printer_model"), str),
+)
+
+# Every raw key to extract from a G-code file
+RAW_KEYS = tuple(
+    dict.fromkeys(
+        key for spec in AUXILIARY_PARAMETERS + SLICER_PARAMETERS for key in spec.keys
+    )
+)
+
+
+def parse_raw_slicer_params(source) -> dict:
+    """
+    Extracts the raw parameters needed for ``slicer_settings`` from G-code.
+
+    Args:
+        source: G-code as accepted by ``parse_gcode_parameters``, or a str path
+            of a G-code file.
+
+    Returns:
+        dict: Raw values with the values of all extruders.
+    """
+    if isinstance(source, str) and "\n" not in source and os.path.isfile(source):
+        return parse_gcode_file(source, RAW_KEYS, first_value_only=False)
+    return parse_gcode_parameters(source, RAW_KEYS, first_value_only=False)
+
+
+def normalize_slicer_params(raw: dict, extruder: int = 0, **overrides) -> dict:
+    """
+    Converts raw slicer parameters to ``slicer_settings`` column values.
+
+    Args:
+        raw: Raw parameters, e.g. from ``parse_raw_slicer_params``.
+        extruder: Extruder whose values are used for multi-extruder lists.
+        **overrides: Column values that replace the G-code values, e.g.
+            ``printer_name="SovolSv06"``; None values are ignored.
+
+    Returns:
+        dict: A value for every column of ``SLICER_SETTINGS_COLUMNS``.
+
+    Raises:
+        KeyError: If a column has no value and no fallback or default.
+        ValueError: If a value cannot be converted to its column type.
+    """
+    values = {}
+    for spec in AUXILIARY_PARAMETERS + SLICER_PARAMETERS:
+        if overrides.get(spec.column) is not None:
+            values[spec.column] = overrides[spec.column]
+            continue
+        text = spec.raw_value(raw)
+        if text is not None:
+            values[spec.column] = spec.convert(text, extruder, values)
+        elif spec.fallback is not None:
+            values[spec.column] = values[spec.fallback]
+        elif spec.default is not None:
+            values[spec.column] = spec.default
+        else:
+            raise KeyError(f"No value for {spec.column} (keys: {', '.join(spec.keys)})")
+    return {column: values[column] for column in SLICER_SETTINGS_COLUMNS}
+
+
+def normalize_slicer_params_batch(raw_rows, extruder: int = 0, **overrides) -> tuple:
+    """
+    Vectorised ``normalize_slicer_params`` for the parameters of many files.
+
+    Args:
+        raw_rows: DataFrame or list of dicts of raw parameters, one per file.
+        extruder: Extruder whose values are used for multi-extruder lists.
+        **overrides: Column values that replace the G-code values.
+
+    Returns:
+        tuple: (DataFrame with the ``SLICER_SETTINGS_COLUMNS`` of the valid
+        rows, index labels of the rows with missing or invalid values)
+    """
+    raw = raw_rows if isinstance(raw_rows, pd.DataFrame) else pd.DataFrame(raw_rows)
+    values = pd.DataFrame(index=raw.index)
+    valid = pd.Series(True, index=raw.index)
+    for spec in AUXILIARY_PARAMETERS + SLICER_PARAMETERS:
+        if overrides.get(spec.column) is not None:
+            values[spec.column] = overrides[spec.column]
+            continue
+        # Value of the first key present per row
+        text = pd.Series(None, index=raw.index, dtype="string")
+        for key in spec.keys:
+            if key in raw.columns:
+                column = raw[key].astype("string").replace("", pd.NA)
+                text = text.fillna(column)
+        missing = text.isna()
+
+        if spec.value_type is str:
+            converted = text.str.strip().str.strip('"').str.strip().replace("", pd.NA)
+        else:
+            items = text.str.split(",")
+            text = items.str[extruder].fillna(items.str[0])
+            match = text.str.extract(NUMBER_PATTERN, flags=re.IGNORECASE)
+            converted = pd.to_numeric(match[0], errors="coerce")
+            if spec.percent_of is not None:
+                relative = match[1].eq("%").fillna(False).astype(bool)
+                converted = converted.where(
+                    ~relative, values[spec.percent_of] * converted / 100
+                )
+            if spec.value_type is float:
+                converted = converted.round(6)
+        valid &= missing | converted.notna()
+
+        if spec.fallback is not None:
+            converted = converted.where(~missing, values[spec.fallback])
+        elif spec.default is not None:
+            converted = converted.where(~missing, spec.default)
+        else:
+            valid &= ~missing
+        if spec.value_type is int:
+            # Rounded like normalize_slicer_settings_value (half to even)
+            converted = np.round(converted).astype("Int64")
+        values[spec.column] = converted
+
+    rejected = list(raw.index[~valid])
+    return values.loc[valid, list(SLICER_SETTINGS_COLUMNS)], rejected
+
+
+def ingest_slicer_settings(session, source, extruder: int = 0, **overrides) -> tuple:
+    """
+    Looks up or inserts the slicer settings of a G-code file.
+
+    Args:
+        session: SQLAlchemy session object.
+        source: Dict of raw parameters, or G-code as accepted by
+            ``parse_raw_slicer_params``.
+        extruder: Extruder whose values are used for multi-extruder lists.
+        **overrides: Column values that replace the G-code values.
+
+    Returns:
+        tuple: (slicer settings ID, True if the row was created)
+
+    Raises:
+        KeyError: If a column has no value.
+        ValueError: If a value cannot be converted to its column type.
+    """
+    raw = source if isinstance(source, dict) else parse_raw_slicer_params(source)
+    values = normalize_slicer_params(raw, extruder, **overrides)
+    return get_or_create_slicer_settings(session, values)
+
+
+def ingest_slicer_settings_files(
+    session, paths: list, extruder: int = 0, **overrides
+) -> dict:
+    """
+    Looks up or inserts the slicer settings of many G-code files.
+
+    The files are parsed one by one, converted in one batch and every distinct
+    set of settings is resolved once.
+
+    Args:
+        session: SQLAlchemy session object.
+        paths: G-code file paths.
+        extruder: Extruder whose values are used for multi-extruder lists.
+        **overrides: Column values that replace the G-code values.
+
+    Returns:
+        dict: Slicer settings ID per path, None for files with missing or
+        invalid parameters.
+    """
+    raw = pd.DataFrame(
+        [parse_gcode_file(path, RAW_KEYS, first_value_only=False) for path in paths]
+    )
+    values, rejected = normalize_slicer_params_batch(raw, extruder, **overrides)
+    ids = {paths[index]: None for index in rejected}
+    settings_ids = {}
+    rows = values.astype(object).to_dict(orient="records")
+    for index, row in zip(values.index, rows):
+        key = tuple(row.values())
+        if key not in settings_ids:
+            settings_ids[key], _ = get_or_create_slicer_settings(session, row)
+        ids[paths[index]] = settings_ids[key]
+    return ids
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert the slicer settings of G-code files."
+    )
+    parser.add_argument("paths", nargs="+", help="G-code files")
+    parser.add_argument("--extruder", type=int, default=0)
+    parser.add_argument("--slicer-profile", help="Overrides print_settings_id")
+    parser.add_argument("--printer-name", help="Overrides printer_settings_id")
+    parser.add_argument(
+        "--ingest", action="store_true", help="Add new settings to slicer_settings"
+    )
+    args = parser.parse_args()
+    overrides = dict(slicer_profile=args.slicer_profile, printer_name=args.printer_name)
+
+    if args.ingest:
+        from database import Session
+
+        with Session() as session:
+            ids = ingest_slicer_settings_files(
+                session, args.paths, args.extruder, **overrides
+            )
+        for path, setting_id in ids.items():
+            print(f"{path}: {setting_id}")
+    else:
+        raw = [
+            parse_gcode_file(path, RAW_KEYS, first_value_only=False)
+            for path in args.paths
+        ]
+        values, rejected = normalize_slicer_params_batch(
+            raw, args.extruder, **overrides
+        )
+        values.index = [args.paths[index] for index in values.index]
+        print(values.T.to_string())
+        for index in rejected:
+            print(f"Missing or invalid parameters: {args.paths[index]}")
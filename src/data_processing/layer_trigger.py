@@ -0,0 +1,131 @@
+"""
+Layer-change detection for layer-aligned frame capture.
+
+``LayerTracker`` turns Moonraker status updates into layer numbers. It
+prefers ``print_stats.info.current_layer``, which Klipper reports when the
+slicer emits ``SET_PRINT_STATS_INFO``, and otherwise counts layers from the
+toolhead position ``gcode_move.position``. A higher Z only counts as a new
+layer once the extruder moves beyond the furthest position reached so far at
+that height, i.e. once filament is extruded there. Z-hops during travel moves
+do not extrude, and the un-retraction after them only returns the extruder
+to where it was, so they are not mistaken for layer changes however long
+they last.
+
+Alternatively the slicer's layer change G-code can call a macro that prints
+``RESPOND PREFIX=capture MSG="layer={layer_num}"``; ``parse_capture_macro``
+recognises these lines.
+"""
+
+import math
+import re
+from typing import Optional, Sequence
+
+Z_EPSILON = 0.01  # mm
+E_EPSILON = 0.01  # mm of filament
+
+_CAPTURE_MACRO = re.compile(r"^(?://\s*)?capture\b.*?\blayer=(\d+)")
+
+
+class LayerTracker(object):
+    """Follows the current layer of one print from status updates."""
+
+    def __init__(self, z_epsilon: float = Z_EPSILON, e_epsilon: float = E_EPSILON):
+        self.z_epsilon = z_epsilon
+        self.e_epsilon = e_epsilon
+        self.reset()
+
+    def reset(self) -> None:
+        """Starts counting layers of a new print."""
+        self.layer = 0
+        self.layer_z = 0.0
+        self.uses_layer_info = False
+        # Furthest extruder position so far; G92 does not change
+        # gcode_move.position, so it only decreases on retractions
+        self._max_e = None
+        self._pending_z = None
+        self._pending_e = None
+
+    def update(self, changes: dict, status: dict) -> Optional[int]:
+        """
+        Processes one status update of ``MoonrakerWebSocket``.
+
+        Args:
+            changes: Changed fields per printer object.
+            status: Merged status of all subscribed objects.
+
+        Returns:
+            The new layer number if the update started a new layer, else None.
+        """
+        if changes.get("print_stats", {}).get("state") == "printing":
+            if status.get("print_stats", {}).get("print_duration", 0) == 0:
+                self.reset()
+
+        info = changes.get("print_stats", {}).get("info") or {}
+        current_layer = info.get("current_layer")
+        if current_layer is not None:
+            self.uses_layer_info = True
+            if current_layer > self.layer:
+                self.layer = current_layer
+                return self.layer
+            return None
+        if self.uses_layer_info:
+            return None
+
+        position = changes.get("gcode_move", {}).get("position")
+        if not position:
+            return None
+        return self._update_position(position[2], position[3])
+
+    def _update_position(self, z: float, e: float) -> Optional[int]:
+        if self._max_e is None:
+            self._max_e = e
+        if z <= self.layer_z + self.z_epsilon:
+            # At the layer height, also after a z-hop
+            self._max_e = max(self._max_e, e)
+            self._pending_z = None
+            return None
+        if self._pending_z is None or not math.isclose(
+            z, self._pending_z, abs_tol=self.z_epsilon
+        ):
+            # New height; E may still include extrusion at the previous one,
+            # since updates are sampled
+            self._pending_z = z
+            self._pending_e = max(self._max_e, e)
+            return None
+        if e <= self._pending_e + self.e_epsilon:
+            # Nothing extruded at this height yet, e.g. a travel with z-hop
+            return None
+        self.layer += 1
+        self.layer_z = z
+        self._max_e = e
+        self._pending_z = None
+        return self.layer
+
+
+def parse_capture_macro(line: str) -> Optional[int]:
+    """
+    Recognises the output of the capture macro in a G-code response line.
+
+    Args:
+        line: e.g. '// capture layer=12'
+
+    Returns:
+        The layer number if the line is a capture request, None otherwise.
+    """
+    match = _CAPTURE_MACRO.match(line.strip())
+    return int(match.group(1)) if match else None
+
+
+def in_position(status: dict, target: Sequence[float], tolerance: float) -> bool:
+    """
+    Checks whether the toolhead is within ``tolerance`` mm of an XY position.
+
+    Args:
+        status: Merged status with ``toolhead.position``.
+        target: (x, y) capture position.
+        tolerance: Maximum XY distance in mm.
+    """
+    position = status.get("toolhead", {}).get("position")
+    if not position:
+        return False
+    return math.hypot(position[0] - target[0], position[1] - target[1]) <= tolerance
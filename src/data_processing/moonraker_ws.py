@@ -0,0 +1,286 @@
+"""
+Event-driven Moonraker client using the JSON-RPC WebSocket API.
+
+Instead of polling ``/printer/objects/query`` over HTTP, the client subscribes
+to printer objects once and Moonraker pushes every change as a
+``notify_status_update`` notification. Listeners are called with the changed
+fields and the merged status, so state transitions (e.g. ``print_stats.state``
+going from 'printing' to 'complete') are seen within one event loop tick.
+
+The connection is re-established with exponential backoff, and the
+subscription is renewed whenever Klippy reports it is ready again.
+
+Usage:
+    python fake_moonraker.py --port 7125
+    python moonraker_ws.py http://localhost:7125
+"""
+
+import asyncio
+import inspect
+import itertools
+import json
+import random
+from typing import Callable, Dict, Optional
+
+import websockets
+
+# Printer objects the client subscribes to (None subscribes to all fields)
+DEFAULT_OBJECTS = {"print_stats": None, "toolhead": None, "gcode_move": None}
+
+
+def websocket_url(address: str) -> str:
+    """
+    Builds the Moonraker WebSocket URL from the printer address.
+
+    Args:
+        address: e.g. 'http://192.168.1.17' or 'http://localhost:7125/'
+
+    Returns:
+        str: e.g. 'ws://192.168.1.17/websocket'
+    """
+    address = address.strip("/")
+    if address.startswith("https://"):
+        address = "wss://" + address[len("https://") :]
+    elif address.startswith("http://"):
+        address = "ws://" + address[len("http://") :]
+    elif not address.startswith(("ws://", "wss://")):
+        address = "ws://" + address
+    return address + "/websocket"
+
+
+def merge_status(status: dict, changes: dict) -> None:
+    """Merges the changed fields of a status update into the status dict."""
+    for name, fields in changes.items():
+        status.setdefault(name, {}).update(fields)
+
+
+class MoonrakerWebSocket:
+    """
+    Moonraker JSON-RPC WebSocket client with printer object subscriptions.
+
+    Args
+    ----
+    address (str): e.g. 'http://192.168.1.17'
+    objects (dict): Printer objects to subscribe to, see ``DEFAULT_OBJECTS``.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        objects: Optional[Dict[str, Optional[list]]] = None,
+        request_timeout: float = 5.0,
+        min_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.url = websocket_url(address)
+        self.objects = dict(objects or DEFAULT_OBJECTS)
+        self.request_timeout = request_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.status: Dict[str, dict] = {}
+        self.connected = asyncio.Event()
+        self._listeners = []
+        self._notification_listeners: Dict[str, list] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._websocket = None
+        self._closed = False
+
+    def add_listener(self, callback: Callable) -> None:
+        """
+        Registers a callback for status updates.
+
+        The callback is called with ``(changes, status)``: the changed fields
+        per object and the merged status of all subscribed objects. It may be
+        a plain function or a coroutine function.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable) -> None:
+        """Unregisters a callback added with ``add_listener``."""
+        self._listeners.remove(callback)
+
+    def add_notification_listener(self, method: str, callback: Callable) -> None:
+        """
+        Registers a callback for other Moonraker notifications.
+
+        Args:
+            method: Notification method, e.g. 'notify_gcode_response'.
+            callback: Called with the ``params`` list of the notification.
+        """
+        self._notification_listeners.setdefault(method, []).append(callback)
+
+    @property
+    def state(self) -> Optional[str]:
+        """The last known ``print_stats.state``, e.g. 'printing'."""
+        return self.status.get("print_stats", {}).get("state")
+
+    async def call(self, method: str, params: Optional[dict] = None):
+        """
+        Sends a JSON-RPC request and waits for its result.
+
+        Args:
+            method: e.g. 'printer.objects.query'
+            params: Request parameters.
+
+        Returns:
+            The ``result`` of the response.
+
+        Raises:
+            ConnectionError: If the client is not connected.
+            RuntimeError: If Moonraker returns an error.
+            asyncio.TimeoutError: If there is no response in time.
+        """
+        if self._websocket is None:
+            raise ConnectionError(f"Not connected to {self.url}")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"jsonrpc": "2.0", "method": method, "id": request_id}
+        if params is not None:
+            request["params"] = params
+        try:
+            await self._websocket.send(json.dumps(request))
+            return await asyncio.wait_for(future, self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def subscribe(self) -> dict:
+        """Subscribes to ``self.objects`` and stores their full status."""
+        result = await self.call("printer.objects.subscribe", {"objects": self.objects})
+        status = result["status"]
+        self.status = {}
+        merge_status(self.status, status)
+        await self._notify(status)
+        return self.status
+
+    async def wait_for_state(self, *states: str, timeout: Optional[float] = None):
+        """
+        Waits until ``print_stats.state`` is one of ``states``.
+
+        Returns:
+            str: The reached state.
+        """
+        if self.state in states:
+            return self.state
+        reached = asyncio.get_running_loop().create_future()
+
+        def listener(changes, status):
+            state = changes.get("print_stats", {}).get("state")
+            if state in states and not reached.done():
+                reached.set_result(state)
+
+        self.add_listener(listener)
+        try:
+            return await asyncio.wait_for(reached, timeout)
+        finally:
+            self.remove_listener(listener)
+
+    async def run(self) -> None:
+        """Keeps the connection and subscription alive until ``close``."""
+        backoff = self.min_backoff
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    self._websocket = websocket
+                    receiver = asyncio.create_task(self._receive(websocket))
+                    try:
+                        await self.subscribe()
+                        self.connected.set()
+                        backoff = self.min_backoff
+                        await receiver
+                    finally:
+                        receiver.cancel()
+            except (
+                OSError,
+                RuntimeError,
+                asyncio.TimeoutError,
+                websockets.WebSocketException,
+            ) as e:
+                if not self._closed:
+                    print(f"Moonraker connection to {self.url} lost: {e}")
+            finally:
+                self._websocket = None
+                self.connected.clear()
+                self._fail_pending(ConnectionError(f"Disconnected from {self.url}"))
+            if self._closed:
+                break
+            # Jittered exponential backoff between reconnection attempts
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def close(self) -> None:
+        """Stops ``run`` and closes the connection."""
+        self._closed = True
+        if self._websocket is not None:
+            await self._websocket.close()
+
+    async def _receive(self, websocket) -> None:
+        async for message in websocket:
+            data = json.loads(message)
+            if "id" in data:
+                future = self._pending.get(data["id"])
+                if future is None or future.done():
+                    continue
+                if "error" in data:
+                    future.set_exception(RuntimeError(data["error"].get("message")))
+                else:
+                    future.set_result(data.get("result"))
+            elif data.get("method") == "notify_status_update":
+                changes = data["params"][0]
+                merge_status(self.status, changes)
+                await self._notify(changes)
+            elif data.get("method") == "notify_klippy_ready":
+                # Subscriptions do not survive a Klippy restart
+                asyncio.create_task(self._resubscribe())
+            elif data.get("method") in (
+                "notify_klippy_shutdown",
+                "notify_klippy_disconnected",
+            ):
+                self.status.setdefault("print_stats", {})["state"] = "error"
+                await self._notify({"print_stats": {"state": "error"}})
+            for callback in self._notification_listeners.get(data.get("method"), ()):
+                try:
+                    callback(data.get("params", []))
+                except Exception as e:
+                    print(f"Error in Moonraker notification listener: {e}")
+
+    async def _resubscribe(self) -> None:
+        try:
+            await self.subscribe()
+        except Exception as e:
+            print(f"Error renewing the Moonraker subscription: {e}")
+
+    async def _notify(self, changes: dict) -> None:
+        for listener in list(self._listeners):
+            try:
+                result = listener(changes, self.status)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Error in Moonraker status listener: {e}")
+
+    def _fail_pending(self, error: Exception) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+
+async def _print_updates(address: str) -> None:
+    client = MoonrakerWebSocket(address)
+    client.add_listener(lambda changes, status: print(json.dumps(changes)))
+    await client.run()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print Moonraker status updates.")
+    parser.add_argument("address", help="e.g. http://192.168.1.17")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_print_updates(args.address))
+    except KeyboardInterrupt:
+        pass
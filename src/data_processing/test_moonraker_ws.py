@@ -0,0 +1,182 @@
+"""
+Runs MoonrakerWebSocket against FakeMoonraker on localhost.
+
+Checks the subscription, state transitions, ``wait_for_state``, the renewed
+subscription after a Klippy restart and the reconnection backoff. The fake
+printer is driven step by step instead of running its print simulation.
+
+Usage:
+    python test_moonraker_ws.py
+"""
+
+import asyncio
+import time
+
+import websockets
+
+import moonraker_ws
+from fake_moonraker import FakeMoonraker
+from moonraker_ws import DEFAULT_OBJECTS, MoonrakerWebSocket
+
+MIN_BACKOFF = 0.05
+MAX_BACKOFF = 0.4
+
+
+async def wait_until(condition, timeout: float = 2.0) -> None:
+    """Polls ``condition`` until it is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not reached in time")
+        await asyncio.sleep(0.01)
+
+
+async def check_subscription(printer: FakeMoonraker, client: MoonrakerWebSocket):
+    assert list(printer.subscriptions.values()) == [DEFAULT_OBJECTS]
+    assert client.state == "standby"
+    assert client.status["print_stats"] == printer.status["print_stats"]
+    assert client.status["toolhead"]["position"] == [0.0, 0.0, 0.0, 0.0]
+
+    # A query does not change the subscription
+    result = await client.call(
+        "printer.objects.query", {"objects": {"print_stats": ["state"]}}
+    )
+    assert result["status"] == {"print_stats": {"state": "standby"}}
+    assert list(printer.subscriptions.values()) == [DEFAULT_OBJECTS]
+
+
+async def check_state_transitions(
+    printer: FakeMoonraker, client: MoonrakerWebSocket
+):
+    states = []
+    client.add_listener(
+        lambda changes, status: states.append(changes["print_stats"]["state"])
+        if "state" in changes.get("print_stats", {})
+        else None
+    )
+    await printer.update({"print_stats": {"state": "printing"}})
+    await printer.update({"gcode_move": {"gcode_position": [1.0, 2.0, 0.2, 0.0]}})
+    await printer.update({"print_stats": {"state": "complete"}})
+    await wait_until(lambda: states == ["printing", "complete"])
+
+    # Changed fields are merged into the status of the subscribed objects
+    assert client.state == "complete"
+    assert client.status["gcode_move"]["gcode_position"] == [1.0, 2.0, 0.2, 0.0]
+    assert client.status["gcode_move"]["speed"] == 1500.0
+
+
+async def check_wait_for_state(printer: FakeMoonraker, client: MoonrakerWebSocket):
+    # The current state is returned at once
+    assert await client.wait_for_state("complete", timeout=0.1) == "complete"
+
+    waiter = asyncio.create_task(client.wait_for_state("printing", "paused"))
+    await asyncio.sleep(0.05)
+    assert not waiter.done()
+    await printer.update({"print_stats": {"state": "standby"}})
+    await printer.update({"print_stats": {"state": "paused"}})
+    assert await asyncio.wait_for(waiter, 1.0) == "paused"
+
+    try:
+        await client.wait_for_state("cancelled", timeout=0.1)
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("wait_for_state did not time out")
+    # The listeners of finished waits are removed
+    assert len(client._listeners) == 1
+
+
+async def check_klippy_restart(printer: FakeMoonraker, client: MoonrakerWebSocket):
+    await printer.update({"print_stats": {"state": "printing"}})
+    await wait_until(lambda: client.state == "printing")
+
+    await printer.notify("notify_klippy_shutdown")
+    await wait_until(lambda: client.state == "error")
+
+    # The restart drops the subscription; the client subscribes again when
+    # Klippy is ready and gets the full status
+    printer.status["print_stats"]["state"] = "standby"
+    await printer.restart_klippy()
+    await wait_until(
+        lambda: list(printer.subscriptions.values()) == [DEFAULT_OBJECTS]
+    )
+    await wait_until(lambda: client.state == "standby")
+
+    await printer.update({"print_stats": {"state": "printing"}})
+    await wait_until(lambda: client.state == "printing")
+
+
+async def check_reconnect_backoff(
+    printer: FakeMoonraker, client: MoonrakerWebSocket, port: int, server
+):
+    attempts = []
+    connect = moonraker_ws.websockets.connect
+
+    def recording_connect(*args, **kwargs):
+        attempts.append(time.monotonic())
+        return connect(*args, **kwargs)
+
+    moonraker_ws.websockets.connect = recording_connect
+    try:
+        server.close()
+        await printer.disconnect()
+        await server.wait_closed()
+        await wait_until(lambda: not client.connected.is_set())
+        try:
+            await client.call("server.info")
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("call did not fail while disconnected")
+
+        # Refused connections are retried with a growing, capped delay
+        await wait_until(lambda: len(attempts) >= 6, timeout=5.0)
+        delays = [b - a for a, b in zip(attempts, attempts[1:])]
+        assert delays[0] < MIN_BACKOFF * 3, delays
+        assert delays[3] > MIN_BACKOFF * 2, delays
+        assert max(delays) < MAX_BACKOFF * 1.5, delays
+
+        printer.status["print_stats"]["state"] = "complete"
+        server = await websockets.serve(printer.handler, "localhost", port)
+        await asyncio.wait_for(client.connected.wait(), MAX_BACKOFF * 3)
+        assert client.state == "complete"
+        assert list(printer.subscriptions.values()) == [DEFAULT_OBJECTS]
+        assert (await client.call("server.info"))["klippy_state"] == "ready"
+    finally:
+        moonraker_ws.websockets.connect = connect
+    return server
+
+
+async def main() -> None:
+    printer = FakeMoonraker()
+    server = await websockets.serve(printer.handler, "localhost", 0)
+    port = next(iter(server.sockets)).getsockname()[1]
+    client = MoonrakerWebSocket(
+        f"http://localhost:{port}", min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF
+    )
+    runner = asyncio.create_task(client.run())
+    try:
+        await asyncio.wait_for(client.connected.wait(), 2.0)
+        for check in (
+            check_subscription,
+            check_state_transitions,
+            check_wait_for_state,
+            check_klippy_restart,
+        ):
+            await check(printer, client)
+            print(f"{check.__name__}: ok")
+        server = await check_reconnect_backoff(printer, client, port, server)
+        print("check_reconnect_backoff: ok")
+    finally:
+        await client.close()
+        await asyncio.wait_for(runner, 2.0)
+        server.close()
+        await server.wait_closed()
+
+
+def test_moonraker_ws():
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    test_moonraker_ws()